@@ -6,6 +6,7 @@ from sqlalchemy.orm import Session
 from db.deps import get_db
 from models.user import User
 from auth.jwt import SECRET_KEY, ALGORITHM
+from config import ADMIN_EMAILS
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
@@ -27,3 +28,10 @@ def get_current_user(
         raise HTTPException(status_code=404, detail="User not found")
 
     return user
+
+
+def get_admin_user(current_user: User = Depends(get_current_user)):
+    if current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    return current_user
@@ -0,0 +1,244 @@
+"""
+Load test the workspace AI endpoints against the mock LLM server.
+
+Starts the mock OpenAI/Perplexity server (benchmarks/mock_llm_server.py)
+and the app (uvicorn, on a throwaway SQLite database and upload directory)
+pointed at it, creates tasks with notes and a corpus PDF, then drives
+/summary/generate, /resources/generate and /assignments/solve with
+concurrent requests. Reports per endpoint:
+    - throughput in requests/sec
+    - p50 / p90 / p99 / max latency
+    - errors (HTTP failures and 200s carrying an error)
+    - upstream model calls per request and the share of prompt tokens
+      served from the (simulated) prompt cache, from the mock server's counters
+
+With --latency fixed:0 and a high --tokens-per-second the upstream time
+is close to zero, so the latencies measure the overhead of ai_service,
+assignment_service and resource_service themselves.
+
+Usage (from the backend directory):
+    python -m benchmarks.ai_load_test [--requests 50] [--concurrency 8] [--endpoints summary resources assignments]
+    python -m benchmarks.ai_load_test --latency fixed:0 --tokens-per-second 1e9   # app overhead only
+    python -m benchmarks.ai_load_test --app-url http://127.0.0.1:8000 --mock-url http://127.0.0.1:8100
+"""
+import argparse
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+
+from benchmarks.make_corpus import CORPUS_DIR, _paragraphs
+from benchmarks.mock_llm_server import add_server_arguments, server_options, start_server
+
+BACKEND_DIR = Path(__file__).parent.parent
+NOTES_PDF = CORPUS_DIR / "lecture_notes.pdf"
+ASSIGNMENT_PDF = CORPUS_DIR / "problem_set.pdf"
+
+ENDPOINTS = ("summary", "resources", "assignments")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(mock_url: str, workers: int, workdir: Path) -> tuple[subprocess.Popen, str]:
+    """Run the app under uvicorn against the mock server, on its own database and upload directory."""
+    port = _free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{workdir / 'loadtest.db'}",
+        "UPLOAD_DIR": str(workdir / "uploads"),
+        "OPENAI_API_KEY": "mock-key",
+        "PERPLEXITY_API_KEY": "mock-key",
+        "OPENAI_BASE_URL": f"{mock_url}/v1",
+        "PERPLEXITY_API_URL": f"{mock_url}/chat/completions"
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=open(workdir / "app.log", "w"),
+        stderr=subprocess.STDOUT
+    )
+    app_url = f"http://127.0.0.1:{port}"
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"App exited during start-up, see {workdir / 'app.log'}")
+        try:
+            if httpx.get(f"{app_url}/", timeout=1).status_code == 200:
+                return process, app_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f"App did not start within 60s, see {workdir / 'app.log'}")
+
+
+def setup_tasks(client: httpx.Client, count: int) -> list[int]:
+    """Register a user and create tasks that each have notes and a PDF attachment."""
+    email = f"loadtest-{random.randrange(10 ** 9)}@example.com"
+    client.post("/auth/register", json={"email": email, "password": "loadtest-password"}).raise_for_status()
+    token = client.post("/auth/login", json={"email": email, "password": "loadtest-password"}).json()["access_token"]
+    client.headers["Authorization"] = f"Bearer {token}"
+
+    rng = random.Random(0)
+    task_ids = []
+    for i in range(count):
+        task = client.post("/tasks/", json={"title": f"Thermodynamics problem set {i + 1}"})
+        task.raise_for_status()
+        task_id = task.json()["id"]
+        notes = "\n\n".join(_paragraphs(rng, 12))
+        client.put(f"/tasks/{task_id}/workspace/notes", json={"content": notes}).raise_for_status()
+        with open(NOTES_PDF, "rb") as f:
+            client.post(
+                f"/tasks/{task_id}/workspace/attachments", files={"file": (NOTES_PDF.name, f, "application/pdf")}
+            ).raise_for_status()
+        task_ids.append(task_id)
+    return task_ids
+
+
+def call_endpoint(client: httpx.Client, endpoint: str, task_id: int, allow_cache: bool) -> tuple[float, bool]:
+    """One request; returns (seconds, succeeded)."""
+    base = f"/tasks/{task_id}/workspace"
+    started = time.perf_counter()
+    try:
+        if endpoint == "summary":
+            response = client.post(f"{base}/summary/generate", params={} if allow_cache else {"force": "true"})
+        elif endpoint == "resources":
+            response = client.post(f"{base}/resources/generate", params={} if allow_cache else {"force": "true"})
+        else:
+            with open(ASSIGNMENT_PDF, "rb") as f:
+                response = client.post(
+                    f"{base}/assignments/solve", files={"file": (ASSIGNMENT_PDF.name, f, "application/pdf")}
+                )
+        elapsed = time.perf_counter() - started
+        ok = response.status_code == 200 and not response.json().get("error")
+    except (httpx.HTTPError, ValueError):
+        elapsed = time.perf_counter() - started
+        ok = False
+    return elapsed, ok
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def run_endpoint(client: httpx.Client, endpoint: str, task_ids: list[int], requests: int,
+                 concurrency: int, allow_cache: bool) -> dict:
+    """
+    Send `requests` requests from `concurrency` threads.
+
+    Each thread works on its own task (generation replaces a task's saved
+    results, so concurrent requests for one task would collide).
+    """
+    def worker(index: int) -> list[tuple[float, bool]]:
+        task_id = task_ids[index % len(task_ids)]
+        count = requests // concurrency + (1 if index < requests % concurrency else 0)
+        return [call_endpoint(client, endpoint, task_id, allow_cache) for _ in range(count)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = [result for batch in pool.map(worker, range(concurrency)) for result in batch]
+    wall = time.perf_counter() - started
+
+    latencies = [seconds for seconds, _ in results]
+    return {
+        "endpoint": endpoint,
+        "requests": requests,
+        "errors": sum(1 for _, ok in results if not ok),
+        "seconds": wall,
+        "throughput": requests / wall if wall else 0.0,
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies, default=0.0)
+    }
+
+
+def upstream_stats(mock_url: str) -> tuple[int, int, int]:
+    """(model calls, prompt tokens, cached prompt tokens) so far, from the mock server."""
+    stats = httpx.get(f"{mock_url}/stats").json()
+    calls = sum(count for key, count in stats.items() if key.startswith("requests."))
+    return calls, stats.get("tokens.prompt", 0), stats.get("tokens.cached", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=50, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--tasks", type=int, help="Tasks the requests are spread over (default: one per concurrent request)")
+    parser.add_argument("--app-workers", type=int, default=1, help="uvicorn workers for the app this script starts")
+    parser.add_argument("--allow-cache", action="store_true", help="Let /summary/generate and /resources/generate use their caches")
+    parser.add_argument("--app-url", help="Use an already running app (pointed at --mock-url) instead of starting one")
+    parser.add_argument("--mock-url", help="Use an already running mock server instead of starting one")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    mock_server = None
+    mock_url = args.mock_url
+    if not mock_url:
+        mock_server = start_server(port=0, **server_options(args))
+        mock_url = mock_server.base_url
+        print(f"Mock LLM server on {mock_url} (latency {args.latency}, {args.tokens_per_second:g} tokens/sec)")
+
+    app_process = None
+    app_url = args.app_url
+    workdir = Path(tempfile.mkdtemp(prefix="ai-load-test-"))
+    if not app_url:
+        app_process, app_url = start_app(mock_url, args.app_workers, workdir)
+        print(f"App on {app_url} ({args.app_workers} workers), logs in {workdir / 'app.log'}")
+
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        with httpx.Client(base_url=app_url, timeout=300, limits=limits) as client:
+            task_ids = setup_tasks(client, args.tasks or args.concurrency)
+            print(f"Created {len(task_ids)} tasks; {args.requests} requests per endpoint at concurrency {args.concurrency}")
+
+            results = []
+            for endpoint in args.endpoints:
+                calls, prompt_tokens, cached_tokens = upstream_stats(mock_url)
+                result = run_endpoint(client, endpoint, task_ids, args.requests, args.concurrency, args.allow_cache)
+                after = upstream_stats(mock_url)
+                result["upstream_per_request"] = (after[0] - calls) / args.requests
+                prompt_tokens = after[1] - prompt_tokens
+                result["cached_share"] = (after[2] - cached_tokens) / prompt_tokens if prompt_tokens else 0.0
+                results.append(result)
+    finally:
+        if app_process:
+            app_process.terminate()
+            app_process.wait(timeout=30)
+        if mock_server:
+            mock_server.shutdown()
+
+    print()
+    print(
+        f"{'endpoint':>12} {'requests':>9} {'errors':>7} {'req/sec':>8} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7} "
+        f"{'upstream/req':>13} {'cached':>7}"
+    )
+    for r in results:
+        print(
+            f"{r['endpoint']:>12} {r['requests']:>9} {r['errors']:>7} {r['throughput']:>8.2f} "
+            f"{r['p50']:>6.2f}s {r['p90']:>6.2f}s {r['p99']:>6.2f}s {r['max']:>6.2f}s {r['upstream_per_request']:>13.2f} "
+            f"{r['cached_share']:>6.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
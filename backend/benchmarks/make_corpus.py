@@ -0,0 +1,120 @@
+"""
+Generate the checked-in PDF benchmark corpus in benchmarks/corpus/.
+
+The PDFs are written directly (no PDF library needed) from seeded
+pseudo-random academic text, so the corpus is reproducible. Re-run only
+when the corpus itself should change.
+
+Usage (from the backend directory):
+    python -m benchmarks.make_corpus
+"""
+import random
+import textwrap
+import zlib
+from pathlib import Path
+
+CORPUS_DIR = Path(__file__).parent / "corpus"
+
+WORDS = (
+    "energy entropy system process heat work temperature pressure volume cycle engine "
+    "equilibrium reversible irreversible state function enthalpy gas ideal constant law "
+    "first second third derivative integral matrix vector eigenvalue proof theorem lemma "
+    "cell protein membrane enzyme gene expression pathway molecule reaction rate catalyst "
+    "market demand supply price elasticity equilibrium cost marginal revenue policy "
+    "algorithm complexity graph node edge tree search sort recursion memory cache thread "
+    "the a of and to in is that for as with by on this are be which from it can"
+).split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraphs(rng: random.Random, count: int) -> list[str]:
+    return [" ".join(_sentence(rng) for _ in range(rng.randint(3, 7))) for _ in range(count)]
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _page_stream(lines: list[str], drawing_ops: int, rng: random.Random) -> bytes:
+    ops = ["BT /F1 10 Tf 50 760 Td 13 TL"]
+    ops.extend(f"({_escape(line)}) '" for line in lines)
+    ops.append("ET")
+    # Lots of tiny path segments, like a dense chart or vector drawing
+    for _ in range(drawing_ops):
+        x, y = rng.uniform(50, 560), rng.uniform(50, 740)
+        ops.append(f"{x:.1f} {y:.1f} m {x + rng.uniform(-5, 5):.1f} {y + rng.uniform(-5, 5):.1f} l S")
+    return "\n".join(ops).encode("latin-1")
+
+
+def write_pdf(path: Path, pages: list[list[str]], drawing_ops: int = 0, seed: int = 0):
+    """Write a minimal PDF with one Helvetica text block per page."""
+    rng = random.Random(seed)
+    objects: list[bytes] = []
+    page_count = len(pages)
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(page_count))
+
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {page_count} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i, lines in enumerate(pages):
+        stream = zlib.compress(_page_stream(lines, drawing_ops, rng))
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        objects.append(
+            f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode() + stream + b"\nendstream"
+        )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += f"{i + 1} 0 obj\n".encode() + obj + b"\nendobj\n"
+
+    xref_offset = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+    path.write_bytes(bytes(out))
+
+
+def _layout(paragraphs: list[str], lines_per_page: int = 54, width: int = 95) -> list[list[str]]:
+    lines = []
+    for paragraph in paragraphs:
+        lines.extend(textwrap.wrap(paragraph, width))
+        lines.append("")
+    return [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+
+
+# name -> (paragraphs, drawing ops per page)
+DOCUMENTS = {
+    "problem_set.pdf": (12, 0),
+    "lecture_notes.pdf": (90, 0),
+    "slides.pdf": (40, 0),
+    "textbook_chapter.pdf": (1000, 0),
+    "vector_figures.pdf": (60, 1500),
+}
+
+
+def main():
+    CORPUS_DIR.mkdir(exist_ok=True)
+    for seed, (name, (paragraph_count, drawing_ops)) in enumerate(DOCUMENTS.items()):
+        rng = random.Random(seed)
+        paragraphs = _paragraphs(rng, paragraph_count)
+        if name == "slides.pdf":
+            # One short paragraph per page
+            pages = [textwrap.wrap(p, 60)[:6] for p in paragraphs]
+        else:
+            pages = _layout(paragraphs)
+        path = CORPUS_DIR / name
+        write_pdf(path, pages, drawing_ops=drawing_ops, seed=seed)
+        print(f"Wrote {path.name}: {len(pages)} pages, {path.stat().st_size // 1024} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,484 @@
+"""
+Local stand-in for the OpenAI and Perplexity chat-completions APIs.
+
+Answers POST /v1/chat/completions (OpenAI) and /chat/completions
+(Perplexity) with canned JSON shaped like what each of our prompts asks
+for (study guides, partial summaries, assignment solutions, resource
+lists), so the workspace AI endpoints can be load tested without API
+credits. Resource URLs point back at this server, which answers them with
+200 so URL verification passes offline.
+
+    - Latency: time to first token from a distribution (--latency), plus
+      reading the uncached prompt at --prefill-tokens-per-second if set,
+      then output at --tokens-per-second; --model-latency and
+      --model-tokens-per-second override both for one model, so model
+      routing tiers can be compared
+    - max_tokens: responses longer than the request's max_tokens are cut
+      off there with finish_reason "length", like the real API
+    - Prompt caching: like OpenAI's automatic prefix caching, a prompt
+      sharing 1024+ tokens of prefix with an earlier one to the same model
+      reports those tokens (in steps of 128) as
+      usage.prompt_tokens_details.cached_tokens
+    - Streaming: "stream": true is answered with server-sent event chunks,
+      plus a usage chunk when stream_options.include_usage is set
+    - Errors: --error-rate answers 500, --rate-limit-rate answers 429 with
+      a Retry-After of --retry-after seconds
+    - Canned JSON: --canned file.json overrides the response per request
+      kind (study_guide, partial_summary, question_segments, assignment,
+      resources, text); question_segments is otherwise built from the
+      assignment text, splitting it into four questions
+    - GET /stats returns request counts by kind and status, and prompt and
+      cached prompt tokens
+
+Usage (from the backend directory):
+    python -m benchmarks.mock_llm_server [--port 8100] [--latency lognormal:0.8,0.5] [--error-rate 0.01]
+
+Then run the app with:
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 PERPLEXITY_API_URL=http://127.0.0.1:8100/chat/completions
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED = {
+    "study_guide": {
+        "summary": "This task covers the first and second laws of thermodynamics and how they constrain heat engines. "
+                   "The notes define internal energy, work and heat, and the documents work through the Carnot cycle.",
+        "key_points": [
+            "The first law states that the change in internal energy equals heat added minus work done by the system.",
+            "The second law says the entropy of an isolated system never decreases.",
+            "A Carnot engine's efficiency is 1 - Tc/Th and no engine between the same reservoirs can do better.",
+            "State functions such as enthalpy depend only on the state, not on the path taken.",
+            "Reversible processes are idealizations; real processes always generate entropy."
+        ],
+        "concepts": [
+            "Entropy - a measure of the number of microstates consistent with a macrostate",
+            "Enthalpy - internal energy plus pressure times volume",
+            "Carnot cycle - two isothermal and two adiabatic reversible steps"
+        ],
+        "action_items": [
+            "Work through the Carnot efficiency derivation in the lecture notes",
+            "Redo problem set questions 2 and 4",
+            "Review the sign conventions for heat and work"
+        ],
+        "study_tips": [
+            "Draw the PV diagram for every cycle before calculating anything",
+            "Check units at each step of energy calculations",
+            "Explain each law in your own words before memorizing formulas"
+        ]
+    },
+    "partial_summary": {
+        "summary": "This part introduces internal energy, heat and work and applies the first law to closed systems.",
+        "key_points": [
+            "Internal energy change equals heat in minus work out for a closed system.",
+            "Work done by a gas at constant pressure is P times the change in volume."
+        ],
+        "concepts": ["First law of thermodynamics - energy conservation for thermodynamic systems"]
+    },
+    "assignment": {
+        "questions": [
+            {
+                "question_number": str(i),
+                "question_text": f"Question {i} from the assignment",
+                "approach": "Identify the system and the process, then apply the first law with consistent signs.",
+                "key_concepts": ["First law", "Sign conventions", "Ideal gas law"],
+                "solution_steps": [
+                    "Step 1: Identify what is given and what is asked",
+                    "Step 2: Choose the relevant law or formula",
+                    "Step 3: Substitute and solve symbolically first",
+                    "Step 4: Check units and limiting cases"
+                ],
+                "tips": "Watch the sign of work done on versus by the system."
+            }
+            for i in range(1, 5)
+        ]
+    },
+    "resources": [
+        {
+            "title": f"Thermodynamics resource {i}",
+            "url": "{base}/resources/%d" % i,
+            "description": "Explains the laws of thermodynamics with worked examples related to the course material.",
+            "source": "Mock Resources"
+        }
+        for i in range(1, 11)
+    ],
+    "text": "OK"
+}
+
+
+def request_kind(body: dict) -> str:
+    """Which of our prompts a request comes from, judged by its messages."""
+    text = ""
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+        text += f"\n{content or ''}"
+
+    if "resource finder" in text:
+        return "resources"
+    if "summarizing one piece" in text:
+        return "partial_summary"
+    if "split assignments into their individual questions" in text:
+        return "question_segments"
+    if '"questions"' in text:
+        return "assignment"
+    if "study_tips" in text:
+        return "study_guide"
+    return "text"
+
+
+def segment_markers(body: dict, count: int = 4) -> dict:
+    """Question starts for a segmentation request: the first words of each of `count` equal slices of the assignment."""
+    prompt = body["messages"][-1]["content"]
+    words = prompt.split("=== ASSIGNMENT ===", 1)[-1].split()
+    step = max(1, len(words) // count)
+    return {
+        "questions": [
+            {"question_number": str(i + 1), "starts_with": " ".join(words[start:start + 8])}
+            for i, start in enumerate(range(0, len(words), step)) if i < count
+        ]
+    }
+
+
+# Automatic prompt caching applies to prefixes of at least this many tokens, in steps
+PREFIX_CACHE_MIN_TOKENS = 1024
+PREFIX_CACHE_STEP_TOKENS = 128
+PREFIX_CACHE_MAX_ENTRIES = 200000
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class LatencyModel:
+    """Time-to-first-token distribution: fixed:S, uniform:A,B, lognormal:MEDIAN,SIGMA or exponential:MEAN."""
+
+    def __init__(self, spec: str, rng: random.Random):
+        self.name, _, params = spec.partition(":")
+        self.params = [float(p) for p in params.split(",") if p]
+        self.rng = rng
+        self.lock = threading.Lock()
+        if self.name not in ("fixed", "uniform", "lognormal", "exponential"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self) -> float:
+        with self.lock:
+            if self.name == "fixed":
+                return self.params[0]
+            if self.name == "uniform":
+                return self.rng.uniform(self.params[0], self.params[1])
+            if self.name == "lognormal":
+                return self.rng.lognormvariate(math.log(self.params[0]), self.params[1])
+            return self.rng.expovariate(1 / self.params[0])
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: str, tokens_per_second: float, prefill_tokens_per_second: float,
+                 error_rate: float, rate_limit_rate: float, retry_after: float, canned: dict, seed: int | None,
+                 model_latency: dict[str, str], model_tokens_per_second: dict[str, float]):
+        super().__init__(address, MockLLMHandler)
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.latency = LatencyModel(latency, random.Random(seed))
+        self.model_latency = {model: LatencyModel(spec, random.Random(seed)) for model, spec in model_latency.items()}
+        self.tokens_per_second = tokens_per_second
+        self.model_tokens_per_second = model_tokens_per_second
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.prefixes: set[int] = set()
+        self.prefixes_lock = threading.Lock()
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.canned = {**CANNED, **canned}
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key: str, amount: int = 1):
+        with self.stats_lock:
+            self.stats[key] += amount
+
+    def cached_prefix_tokens(self, model: str, prompt: str) -> int:
+        """
+        Tokens of the prompt's longest prefix this model has seen before (0
+        below PREFIX_CACHE_MIN_TOKENS); remembers this prompt. The cache is
+        per model, as the provider's is.
+        """
+        cached = 0
+        with self.prefixes_lock:
+            if len(self.prefixes) > PREFIX_CACHE_MAX_ENTRIES:
+                self.prefixes.clear()
+            for tokens in range(PREFIX_CACHE_MIN_TOKENS, estimate_tokens(prompt) + 1, PREFIX_CACHE_STEP_TOKENS):
+                key = hash((model, prompt[:tokens * 4]))
+                if key in self.prefixes:
+                    if cached == tokens - PREFIX_CACHE_STEP_TOKENS or tokens == PREFIX_CACHE_MIN_TOKENS:
+                        cached = tokens
+                else:
+                    self.prefixes.add(key)
+        return cached
+
+    def clear_prefix_cache(self):
+        """Forget every prompt seen so far, so the next requests start uncached."""
+        with self.prefixes_lock:
+            self.prefixes.clear()
+
+    def latency_for(self, model: str) -> LatencyModel:
+        return self.model_latency.get(model, self.latency)
+
+    def speed_for(self, model: str) -> float:
+        return self.model_tokens_per_second.get(model, self.tokens_per_second)
+
+    def roll(self) -> float:
+        with self.rng_lock:
+            return self.rng.random()
+
+    def content_for(self, kind: str, body: dict) -> str:
+        if kind == "question_segments" and kind not in self.canned:
+            return json.dumps(segment_markers(body))
+        value = self.canned.get(kind, self.canned["text"])
+        if isinstance(value, str):
+            return value
+        return json.dumps(value).replace("{base}", self.base_url)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockLLMServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, data, headers: dict | None = None):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_HEAD(self):
+        self.send_response(200 if self.path.startswith("/resources/") else 404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.server.stats_lock:
+                self._send_json(200, dict(self.server.stats))
+        elif self.path.startswith("/resources/"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", "13")
+            self.end_headers()
+            self.wfile.write(b"<html></html>")
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON", "type": "invalid_request_error"}})
+            return
+
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        kind = request_kind(body)
+        server = self.server
+        server.count(f"requests.{kind}")
+
+        roll = server.roll()
+        if roll < server.rate_limit_rate:
+            server.count("status.429")
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+                {"Retry-After": f"{server.retry_after:g}"}
+            )
+            return
+        if roll < server.rate_limit_rate + server.error_rate:
+            server.count("status.500")
+            self._send_json(500, {"error": {"message": "Internal error (mock)", "type": "server_error"}})
+            return
+
+        content = server.content_for(kind, body)
+        finish_reason = "stop"
+        if body.get("max_tokens") and estimate_tokens(content) > body["max_tokens"]:
+            content = content[:body["max_tokens"] * 4]
+            finish_reason = "length"
+        model = body.get("model", "mock")
+        prompt = json.dumps(body.get("messages", []))
+        prompt_tokens = estimate_tokens(prompt)
+        cached_tokens = server.cached_prefix_tokens(model, prompt)
+        completion_tokens = estimate_tokens(content)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+        server.count("tokens.prompt", prompt_tokens)
+        server.count("tokens.cached", cached_tokens)
+
+        first_token = server.latency_for(model).sample()
+        if server.prefill_tokens_per_second:
+            first_token += (prompt_tokens - cached_tokens) / server.prefill_tokens_per_second
+        time.sleep(first_token)
+        server.count("status.200")
+        if body.get("stream"):
+            self._stream(body, content, usage, finish_reason)
+        else:
+            time.sleep(completion_tokens / server.speed_for(model))
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": finish_reason
+                }],
+                "usage": usage
+            })
+
+    def _write_chunk(self, data: str):
+        payload = data.encode()
+        self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, body: dict, content: str, usage: dict, finish_reason: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        base = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model", "mock")}
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+        piece_size = 16  # About 4 tokens per chunk
+        delay = (piece_size / 4) / self.server.speed_for(body.get("model", "mock"))
+
+        for start in range(0, len(content), piece_size):
+            delta = {"content": content[start:start + piece_size]}
+            if start == 0:
+                delta["role"] = "assistant"
+            chunk = {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            if include_usage:
+                chunk["usage"] = None
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            time.sleep(delay)
+
+        final = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]}
+        self._write_chunk(f"data: {json.dumps(final)}\n\n")
+        if include_usage:
+            self._write_chunk(f"data: {json.dumps({**base, 'choices': [], 'usage': usage})}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def start_server(
+    host: str = "127.0.0.1",
+    port: int = 8100,
+    latency: str = "lognormal:0.8,0.5",
+    tokens_per_second: float = 200.0,
+    prefill_tokens_per_second: float = 0.0,
+    error_rate: float = 0.0,
+    rate_limit_rate: float = 0.0,
+    retry_after: float = 1.0,
+    canned: dict | None = None,
+    seed: int | None = None,
+    model_latency: dict[str, str] | None = None,
+    model_tokens_per_second: dict[str, float] | None = None
+) -> MockLLMServer:
+    """Start the mock server on a background thread (port 0 picks a free port)."""
+    server = MockLLMServer(
+        (host, port), latency, tokens_per_second, prefill_tokens_per_second, error_rate, rate_limit_rate,
+        retry_after, canned or {}, seed, model_latency or {}, model_tokens_per_second or {}
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", default="lognormal:0.8,0.5",
+                        help="Time to first token: fixed:S, uniform:A,B, lognormal:MEDIAN,SIGMA or exponential:MEAN")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Output speed after the first token")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0.0,
+                        help="Speed of reading uncached prompt tokens before the first token (0 = not modelled)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--canned", type=argparse.FileType("r"), help="JSON file of responses by request kind")
+    parser.add_argument("--seed", type=int, help="Seed for latency and error sampling")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SPEC",
+                        help="Time to first token for one model (repeatable), e.g. gpt-4.1-nano=lognormal:0.4,0.4")
+    parser.add_argument("--model-tokens-per-second", action="append", default=[], metavar="MODEL=N",
+                        help="Output speed for one model (repeatable), e.g. gpt-4.1-nano=400")
+
+
+def _model_settings(values: list[str]) -> dict[str, str]:
+    settings = {}
+    for value in values:
+        model, separator, setting = value.partition("=")
+        if not separator:
+            raise SystemExit(f"Expected MODEL=VALUE, got {value!r}")
+        settings[model] = setting
+    return settings
+
+
+def server_options(args) -> dict:
+    return {
+        "latency": args.latency,
+        "tokens_per_second": args.tokens_per_second,
+        "prefill_tokens_per_second": args.prefill_tokens_per_second,
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "retry_after": args.retry_after,
+        "canned": json.load(args.canned) if args.canned else {},
+        "seed": args.seed,
+        "model_latency": _model_settings(args.model_latency),
+        "model_tokens_per_second": {
+            model: float(speed) for model, speed in _model_settings(args.model_tokens_per_second).items()
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_server(args.host, args.port, **server_options(args))
+    print(f"Mock LLM server on {server.base_url}")
+    print(f"  OPENAI_BASE_URL={server.base_url}/v1")
+    print(f"  PERPLEXITY_API_URL={server.base_url}/chat/completions")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Offline evaluation of the model routing tiers (services/model_router.py).
+
+Sends every input to every tier of its workload - whatever tier the router
+would pick for it - and reports per workload and tier:
+    - how many of the inputs the router sends to that tier
+    - mean and p50 latency
+    - mean prompt and completion tokens, and cost from MODEL_PRICES
+    - the share of responses that were complete, valid JSON (not cut off
+      by the tier's max_tokens)
+
+Inputs are requests recorded by the app with AI_RECORD_FILE set (one JSON
+object per line with the model, max_tokens and messages), or by default
+built-in samples of every routed workload at several sizes, built from the
+benchmark corpus's text generator and the real prompt templates. The
+workload of a recorded request is recognised by its system message.
+
+Requests go to an in-process mock server (benchmarks/mock_llm_server.py,
+with its --model-latency / --model-tokens-per-second options) unless
+--base-url points somewhere else, e.g. the real API to compare quality and
+cost on recorded traffic. The mock's prompt cache is cleared before each
+input goes to each tier, so a tier's cost doesn't depend on which tiers
+sent the same prompt before it (a real API's cache can't be cleared, so
+later tiers of the same model may show cached-token discounts there).
+
+Usage (from the backend directory):
+    python -m benchmarks.model_routing_eval [--repeats 3]
+    python -m benchmarks.model_routing_eval --inputs requests.jsonl --base-url https://api.openai.com/v1
+    python -m benchmarks.model_routing_eval --model-latency gpt-4.1-nano=fixed:0.2 --model-tokens-per-second gpt-4.1-nano=400
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import statistics
+import time
+from collections import defaultdict
+from collections.abc import Callable
+
+import httpx
+
+from benchmarks.ai_load_test import percentile
+from benchmarks.make_corpus import _paragraphs
+from benchmarks.mock_llm_server import add_server_arguments, server_options, start_server
+from services.json_stream import parse_json_response
+from services.model_router import estimate_cost, get_routes, message_tokens, route
+from services.prompts import PROMPTS
+from services.token_budget import response_usage
+
+# Workloads whose model and response budget are routed
+WORKLOADS = ("study_guide", "partial_summary", "question_segments", "assignment", "assignment_vision")
+
+# Sizes (paragraphs of corpus text) of the built-in samples
+SAMPLE_SIZES = (3, 12, 60, 200)
+
+
+def _text(rng: random.Random, paragraphs: int) -> str:
+    return "\n\n".join(_paragraphs(rng, paragraphs))
+
+
+def _assignment(rng: random.Random, questions: int) -> str:
+    return "\n\n".join(f"Question {i + 1}. {_text(rng, 1)}" for i in range(questions))
+
+
+def sample_inputs() -> list[dict]:
+    """Requests of every routed text workload at several input sizes."""
+    rng = random.Random(0)
+    title = "Thermodynamics problem set"
+    samples = []
+    for size in SAMPLE_SIZES:
+        samples.append(("study_guide", size, PROMPTS["study_guide"].messages(
+            task_title=title, content="\n\n=== USER'S NOTES ===\n" + _text(rng, size)
+        )))
+        samples.append(("partial_summary", size, PROMPTS["partial_summary"].messages(
+            task_title=title, piece="PIECE (USER'S NOTES):\n" + _text(rng, size)
+        )))
+        samples.append(("question_segments", size, PROMPTS["question_segments"].messages(
+            assignment=_assignment(rng, max(1, size // 2))
+        )))
+        samples.append(("assignment", size, PROMPTS["assignment"].messages(
+            task_title=title, context=_text(rng, size), assignment=_assignment(rng, 3)
+        )))
+    return [{"workload": workload, "label": f"{size} paragraphs", "messages": messages} for workload, size, messages in samples]
+
+
+def detect_workload(messages: list) -> str | None:
+    """The routed workload a request belongs to, by its prompt template's system message."""
+    system = next((message.get("content") for message in messages if message.get("role") == "system"), None)
+    for name, template in PROMPTS.items():
+        if name in WORKLOADS and template.prefix == system:
+            return name
+    return None
+
+
+def load_inputs(path: str) -> list[dict]:
+    inputs = []
+    skipped = 0
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            messages = json.loads(line).get("messages") or []
+            workload = detect_workload(messages)
+            if workload is None:
+                skipped += 1
+                continue
+            inputs.append({"workload": workload, "label": f"line {line_number}", "messages": messages})
+    if skipped:
+        print(f"Skipped {skipped} recorded requests that aren't a routed workload")
+    return inputs
+
+
+def with_detail(messages: list, detail: str) -> list:
+    """The messages with every image at the given detail."""
+    messages = copy.deepcopy(messages)
+    for message in messages:
+        if isinstance(message.get("content"), list):
+            for part in message["content"]:
+                if part.get("type") == "image_url":
+                    part["image_url"]["detail"] = detail
+    return messages
+
+
+def run_request(client: httpx.Client, tier: dict, messages: list) -> dict:
+    """Send one request at a tier's settings; returns latency, usage, cost and whether the JSON was complete."""
+    body = {
+        "model": tier["model"],
+        "messages": with_detail(messages, tier.get("detail", "high")),
+        "temperature": 0.3,
+        "max_tokens": tier["max_tokens"]
+    }
+    started = time.perf_counter()
+    try:
+        response = client.post("/chat/completions", json=body)
+        response.raise_for_status()
+        data = response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        return {"seconds": time.perf_counter() - started, "error": str(e)}
+    seconds = time.perf_counter() - started
+
+    choice = data["choices"][0]
+    _, complete = parse_json_response(choice["message"].get("content") or "")
+    usage = response_usage(data)
+    return {
+        "seconds": seconds,
+        "usage": usage,
+        "cost": estimate_cost(tier["model"], usage),
+        "valid": complete and choice.get("finish_reason") != "length"
+    }
+
+
+def evaluate(
+    client: httpx.Client,
+    inputs: list[dict],
+    repeats: int,
+    clear_cache: Callable[[], None] | None = None
+) -> list[dict]:
+    """
+    Every input against every tier of its workload, aggregated per (workload, tier).
+
+    clear_cache, if given, runs before each input's requests to each tier,
+    so every tier starts from the same (empty) prompt cache.
+    """
+    runs = defaultdict(list)
+    routed = defaultdict(int)
+    tiers_by_key = {}
+
+    for item in inputs:
+        tokens, images = message_tokens(item["messages"])
+        modality = "image" if images else "text"
+        routed[(item["workload"], route(item["workload"], tokens, images)["tier"])] += 1
+        for tier in get_routes(item["workload"]):
+            if tier.get("modality") not in (None, modality):
+                continue
+            key = (item["workload"], tier["tier"])
+            tiers_by_key[key] = tier
+            if clear_cache:
+                clear_cache()
+            for _ in range(repeats):
+                runs[key].append(run_request(client, tier, item["messages"]))
+
+    rows = []
+    for (workload, tier_name), results in runs.items():
+        ok = [r for r in results if "error" not in r]
+        latencies = [r["seconds"] for r in ok]
+        costs = [r["cost"] for r in ok if r["cost"] is not None]
+        rows.append({
+            "workload": workload,
+            "tier": tier_name,
+            "model": tiers_by_key[(workload, tier_name)]["model"],
+            "max_tokens": tiers_by_key[(workload, tier_name)]["max_tokens"],
+            "routed": routed[(workload, tier_name)],
+            "requests": len(results),
+            "errors": len(results) - len(ok),
+            "mean": statistics.mean(latencies) if latencies else 0.0,
+            "p50": percentile(latencies, 50),
+            "prompt_tokens": statistics.mean(r["usage"].get("prompt_tokens") or 0 for r in ok) if ok else 0,
+            "completion_tokens": statistics.mean(r["usage"].get("completion_tokens") or 0 for r in ok) if ok else 0,
+            "cost": statistics.mean(costs) if costs else None,
+            "valid": sum(1 for r in ok if r["valid"]) / len(ok) if ok else 0.0
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inputs", help="Requests recorded with AI_RECORD_FILE (default: built-in samples)")
+    parser.add_argument("--repeats", type=int, default=3, help="Times each input is sent to each tier")
+    parser.add_argument("--base-url", help="OpenAI-compatible API to evaluate against instead of the mock server")
+    parser.add_argument("--api-key", default=os.getenv("OPENAI_API_KEY", "mock-key"))
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    inputs = load_inputs(args.inputs) if args.inputs else sample_inputs()
+    if not inputs:
+        raise SystemExit("No inputs to evaluate")
+
+    mock_server = None
+    base_url = args.base_url
+    if not base_url:
+        mock_server = start_server(port=0, **server_options(args))
+        base_url = f"{mock_server.base_url}/v1"
+        print(f"Mock LLM server on {mock_server.base_url} (latency {args.latency}, {args.tokens_per_second:g} tokens/sec)")
+    print(f"Evaluating {len(inputs)} inputs, {args.repeats} times per tier")
+
+    try:
+        headers = {"Authorization": f"Bearer {args.api_key}"}
+        with httpx.Client(base_url=base_url, headers=headers, timeout=300) as client:
+            rows = evaluate(client, inputs, args.repeats, mock_server.clear_prefix_cache if mock_server else None)
+    finally:
+        if mock_server:
+            mock_server.shutdown()
+
+    print()
+    print(
+        f"{'workload':>18} {'tier':>9} {'model':>13} {'max_tok':>8} {'routed':>7} {'errors':>7} {'mean':>7} {'p50':>7} "
+        f"{'prompt':>8} {'output':>7} {'cost':>10} {'valid':>6}"
+    )
+    def table_order(row: dict) -> tuple[int, int]:
+        tiers = [tier["tier"] for tier in get_routes(row["workload"])]
+        return WORKLOADS.index(row["workload"]), tiers.index(row["tier"])
+
+    for r in sorted(rows, key=table_order):
+        cost = f"${r['cost']:.6f}" if r["cost"] is not None else "-"
+        print(
+            f"{r['workload']:>18} {r['tier']:>9} {r['model']:>13} {r['max_tokens']:>8} {r['routed']:>7} {r['errors']:>7} "
+            f"{r['mean']:>6.2f}s {r['p50']:>6.2f}s {r['prompt_tokens']:>8.0f} {r['completion_tokens']:>7.0f} "
+            f"{cost:>10} {r['valid']:>6.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
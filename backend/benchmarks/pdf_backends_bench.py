@@ -0,0 +1,107 @@
+"""
+Compare the PDF text backends over the checked-in corpus.
+
+Each installed backend runs in a fresh process over every PDF in the
+corpus (in-process extraction, no pool, so only the backend is measured)
+and reports:
+    - throughput in pages/sec
+    - peak memory (max RSS growth over the process baseline)
+    - output-length parity against PyPDF2 per document
+
+Usage (from the backend directory):
+    python -m benchmarks.pdf_backends_bench [--corpus benchmarks/corpus] [--repeat 3]
+"""
+import argparse
+import multiprocessing
+import resource
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.make_corpus import CORPUS_DIR
+from services.pdf_backends import PDF_BACKENDS
+
+
+def _max_rss_kb() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def _run_backend(backend_name: str, corpus: list[str], repeat: int, results):
+    # Imported here so the baseline RSS includes the backend library itself
+    from services.pdf_extraction import extract_pages
+
+    baseline_kb = _max_rss_kb()
+    best = None
+    chars: dict[str, int] = {}
+    pages = 0
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        pages = 0
+        for path in corpus:
+            result = extract_pages(Path(path), workers=0, backend_name=backend_name)
+            pages += len(result["pages"])
+            chars[Path(path).name] = sum(len(text) for text in result["pages"])
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    results.put({
+        "backend": backend_name,
+        "pages": pages,
+        "seconds": best,
+        "pages_per_second": pages / best if best else 0.0,
+        "peak_memory_kb": _max_rss_kb() - baseline_kb,
+        "chars": chars
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=CORPUS_DIR, help="Directory of PDFs (default: checked-in corpus)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per backend; the best time is reported")
+    args = parser.parse_args()
+
+    corpus = [str(path) for path in sorted(args.corpus.rglob("*.pdf"))]
+    if not corpus:
+        parser.error(f"No PDF files found under {args.corpus}")
+
+    available = [name for name, backend in PDF_BACKENDS.items() if backend.available]
+    missing = [name for name, backend in PDF_BACKENDS.items() if not backend.available]
+    print(f"Corpus: {len(corpus)} PDFs from {args.corpus}")
+    if missing:
+        print(f"Not installed (skipped): {', '.join(missing)}")
+
+    # A fresh process per backend keeps memory measurements independent
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for name in available:
+        queue = context.Queue()
+        process = context.Process(target=_run_backend, args=(name, corpus, args.repeat, queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+
+    reference = next((r for r in results if r["backend"] == "pypdf2"), results[0])
+
+    print()
+    print(f"{'backend':<10} {'pages':>6} {'seconds':>8} {'pages/sec':>10} {'peak MB':>8} {'chars vs ' + reference['backend']:>16}")
+    for r in results:
+        total = sum(r["chars"].values())
+        reference_total = sum(reference["chars"].values()) or 1
+        print(
+            f"{r['backend']:<10} {r['pages']:>6} {r['seconds']:>8.2f} {r['pages_per_second']:>10.1f} "
+            f"{r['peak_memory_kb'] / 1024:>8.1f} {total / reference_total:>15.1%}"
+        )
+
+    print()
+    print("Output length per document (characters):")
+    names = sorted(reference["chars"])
+    print(f"{'document':<24}" + "".join(f"{r['backend']:>12}" for r in results))
+    for name in names:
+        print(f"{name:<24}" + "".join(f"{r['chars'].get(name, 0):>12}" for r in results))
+
+
+if __name__ == "__main__":
+    main()
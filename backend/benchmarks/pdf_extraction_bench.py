@@ -0,0 +1,80 @@
+"""
+Benchmark the parallel PDF extraction engine over a local corpus.
+
+Runs every PDF under the corpus directory with increasing worker counts
+and reports pages/sec, so scaling with core count can be checked.
+
+Usage (from the backend directory):
+    python -m benchmarks.pdf_extraction_bench path/to/pdfs [--workers 1 2 4 8] [--repeat 3]
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+
+from services.pdf_extraction import extract_pages, get_page_count, shutdown_extraction_pool
+
+
+def run(corpus: list[Path], workers: int, repeat: int) -> dict:
+    total_pages = 0
+    total_skipped = 0
+    best = None
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        pages = 0
+        skipped = 0
+        for pdf in corpus:
+            result = extract_pages(pdf, workers=workers)
+            pages += len(result["pages"])
+            skipped += len(result["skipped"])
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best:
+            best = elapsed
+        total_pages, total_skipped = pages, skipped
+
+    return {
+        "workers": workers,
+        "pages": total_pages,
+        "skipped": total_skipped,
+        "seconds": best,
+        "pages_per_second": total_pages / best if best else 0.0
+    }
+
+
+def main():
+    cpu_count = os.cpu_count() or 1
+    default_workers = sorted({1, 2, 4, cpu_count} & set(range(1, cpu_count + 1))) or [1]
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", type=Path, help="Directory containing PDF files (searched recursively)")
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per worker count; the best is reported")
+    args = parser.parse_args()
+
+    corpus = sorted(args.corpus.rglob("*.pdf"))
+    if not corpus:
+        parser.error(f"No PDF files found under {args.corpus}")
+
+    page_total = sum(get_page_count(pdf) for pdf in corpus)
+    print(f"Corpus: {len(corpus)} PDFs, {page_total} pages, {cpu_count} CPUs")
+
+    results = []
+    for workers in args.workers:
+        # Warm the pool so process start-up isn't counted
+        extract_pages(corpus[0], workers=workers)
+        results.append(run(corpus, workers, args.repeat))
+    shutdown_extraction_pool()
+
+    baseline = results[0]["pages_per_second"] or 1.0
+    print()
+    print(f"{'workers':>8} {'pages':>8} {'skipped':>8} {'seconds':>9} {'pages/sec':>10} {'speedup':>8}")
+    for r in results:
+        print(
+            f"{r['workers']:>8} {r['pages']:>8} {r['skipped']:>8} {r['seconds']:>9.2f} "
+            f"{r['pages_per_second']:>10.1f} {r['pages_per_second'] / baseline:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
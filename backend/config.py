@@ -1,4 +1,5 @@
 import os
+import json
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -6,8 +7,8 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Base directory for file uploads
-UPLOAD_DIR = Path(__file__).parent / "uploads"
-UPLOAD_DIR.mkdir(exist_ok=True)
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", str(Path(__file__).parent / "uploads")))
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 # Allowed file types
 ALLOWED_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg", ".gif", ".webp"}
@@ -38,3 +39,109 @@ EMAIL_FROM_NAME = os.getenv("EMAIL_FROM_NAME", "Task Manager")
 
 # Frontend URL for email links
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
+
+# PDF extraction engine
+# Text backend: pypdf2 (default), pypdfium2 or pdfminer - falls back to any installed one
+PDF_BACKEND = os.getenv("PDF_BACKEND", "pypdf2")
+# Worker processes for page extraction (0 = extract in the calling thread)
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Seconds a single page may take before it is skipped
+PDF_PAGE_TIMEOUT = float(os.getenv("PDF_PAGE_TIMEOUT", "10"))
+# Smallest page range handed to one worker
+PDF_MIN_PAGES_PER_CHUNK = int(os.getenv("PDF_MIN_PAGES_PER_CHUNK", "4"))
+# Extractions of a page whose worker crashed before its skip marker is kept for good
+PDF_PAGE_MAX_ATTEMPTS = int(os.getenv("PDF_PAGE_MAX_ATTEMPTS", "3"))
+
+# Background job queue
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # Worker threads per app process
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))  # Seconds between queue polls when idle
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))  # Running jobs are reclaimed after this
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_EVENTS_POLL_INTERVAL = float(os.getenv("JOB_EVENTS_POLL_INTERVAL", "0.5"))  # Seconds between job checks for SSE streams
+
+# Study guides precomputed in the background for tasks due soon
+SUMMARY_PRECOMPUTE_ENABLED = os.getenv("SUMMARY_PRECOMPUTE_ENABLED", "true").lower() == "true"
+SUMMARY_PRECOMPUTE_HORIZON_HOURS = float(os.getenv("SUMMARY_PRECOMPUTE_HORIZON_HOURS", "24"))  # Tasks due within this are refreshed
+SUMMARY_PRECOMPUTE_INTERVAL_MINUTES = float(os.getenv("SUMMARY_PRECOMPUTE_INTERVAL_MINUTES", "15"))
+SUMMARY_PRECOMPUTE_MAX_JOBS = int(os.getenv("SUMMARY_PRECOMPUTE_MAX_JOBS", "10"))  # Summaries queued per run
+SUMMARY_PRECOMPUTE_RETRY_HOURS = float(os.getenv("SUMMARY_PRECOMPUTE_RETRY_HOURS", "6"))  # Wait after a failed precompute
+
+# Full-text search
+SEARCH_MAX_CONTENT_LENGTH = int(os.getenv("SEARCH_MAX_CONTENT_LENGTH", "500000"))  # Chars indexed per document
+
+# Tokenizer used for prompt budgets (gpt-4o family). The vocabulary is read from
+# TOKENIZER_CACHE_DIR only - fill it at build time with `python -m services.tokenizer --download`
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+TOKENIZER_CACHE_DIR = Path(os.getenv("TOKENIZER_CACHE_DIR", str(Path(__file__).parent / "tokenizer_cache")))
+
+# Upstream API endpoints - point these at benchmarks/mock_llm_server.py for offline load tests
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # None = api.openai.com
+PERPLEXITY_API_URL = os.getenv("PERPLEXITY_API_URL", "https://api.perplexity.ai/chat/completions")
+
+# Shared OpenAI client
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))  # Seconds per request (read/write)
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))  # Retries per AI provider request (OpenAI and Perplexity)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "10"))  # Pooled connections per process
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "120"))  # Idle connections are kept this long
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # Model calls in flight per process
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))  # Seconds a call may wait for a free slot
+# Model tier tables per workload, replacing the defaults in services/model_router.py, e.g.
+# {"study_guide": [{"tier": "small", "max_input_tokens": 2000, "model": "gpt-4.1-nano", "max_tokens": 1500}, ...]}
+MODEL_ROUTES = json.loads(os.getenv("MODEL_ROUTES", "{}"))
+# Append every model request (model, max_tokens, messages) to this JSONL file, as inputs for
+# benchmarks/model_routing_eval.py. Off when empty; the file holds user content, so only enable it deliberately
+AI_RECORD_FILE = os.getenv("AI_RECORD_FILE", "")
+
+# Upstream AI rate limits per provider and model, shared by all workers through the database
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))  # Requests per minute, 0 = unlimited
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))  # Tokens per minute, 0 = unlimited
+PERPLEXITY_RPM = int(os.getenv("PERPLEXITY_RPM", "50"))
+PERPLEXITY_TPM = int(os.getenv("PERPLEXITY_TPM", "0"))
+# Per-model limits, e.g. {"openai:gpt-4o": {"rpm": 500, "tpm": 30000}}
+RATE_LIMIT_OVERRIDES = json.loads(os.getenv("RATE_LIMIT_OVERRIDES", "{}"))
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "60"))  # Seconds a call may wait for budget and retries
+RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "1"))  # Seconds before the first retry, doubled each time
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "30"))
+
+# Ledger of every upstream AI call (tokens, latency, outcome per task, user and endpoint), written in batches
+AI_USAGE_LEDGER_ENABLED = os.getenv("AI_USAGE_LEDGER_ENABLED", "true").lower() == "true"
+AI_USAGE_FLUSH_SECONDS = float(os.getenv("AI_USAGE_FLUSH_SECONDS", "5"))  # Most time a record waits before being written
+AI_USAGE_BATCH_SIZE = int(os.getenv("AI_USAGE_BATCH_SIZE", "200"))  # Records per insert
+AI_USAGE_QUEUE_SIZE = int(os.getenv("AI_USAGE_QUEUE_SIZE", "10000"))  # Unwritten records kept; more are dropped
+
+# Comma-separated emails of users allowed to use the /admin endpoints
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
+# Study-guide cache (shared across tasks, keyed by a fingerprint of the inputs)
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "1000"))  # Least recently used are evicted
+SUMMARY_CACHE_TTL_DAYS = int(os.getenv("SUMMARY_CACHE_TTL_DAYS", "30"))  # 0 = never expire
+
+# Per-input partial summaries that study guides are merged from (same TTL as the study-guide cache)
+PARTIAL_SUMMARY_WORKERS = int(os.getenv("PARTIAL_SUMMARY_WORKERS", "4"))  # Inputs summarized in parallel per study guide
+PARTIAL_SUMMARY_MAX_ENTRIES = int(os.getenv("PARTIAL_SUMMARY_MAX_ENTRIES", "5000"))  # Least recently used are evicted
+
+# Assignments are split into questions that are solved in parallel
+ASSIGNMENT_SOLVE_WORKERS = int(os.getenv("ASSIGNMENT_SOLVE_WORKERS", "4"))  # Question groups solved at once per assignment
+
+# Resource URLs suggested by Perplexity are checked concurrently, within an overall time budget
+RESOURCE_VERIFY_WORKERS = int(os.getenv("RESOURCE_VERIFY_WORKERS", "8"))  # URLs checked at once per request
+RESOURCE_VERIFY_DEADLINE = float(os.getenv("RESOURCE_VERIFY_DEADLINE", "8"))  # Seconds for checking all of them
+# URL check results are cached in the database; dead results expire sooner, and failed checks much sooner
+URL_LIVE_TTL_HOURS = float(os.getenv("URL_LIVE_TTL_HOURS", "72"))
+URL_DEAD_TTL_HOURS = float(os.getenv("URL_DEAD_TTL_HOURS", "6"))  # Pages answering 404 or 410
+URL_UNREACHABLE_TTL_MINUTES = float(os.getenv("URL_UNREACHABLE_TTL_MINUTES", "5"))  # Timeouts, errors, unreachable domains
+URL_CHECK_TIMEOUT = float(os.getenv("URL_CHECK_TIMEOUT", "5"))  # Seconds one URL check may take, HEAD and GET fallback together
+
+# Verified resources are reused for tasks with the same (or nearly the same) study material
+RESOURCE_CACHE_TTL_HOURS = float(os.getenv("RESOURCE_CACHE_TTL_HOURS", "168"))
+RESOURCE_CACHE_SIMILARITY = float(os.getenv("RESOURCE_CACHE_SIMILARITY", "0.85"))  # Near-duplicate threshold, 1 = exact only
+RESOURCE_CACHE_MAX_ENTRIES = int(os.getenv("RESOURCE_CACHE_MAX_ENTRIES", "2000"))  # Least recently used are evicted
+
+# Pooled keep-alive HTTP sessions for Perplexity calls and URL checks (services/http_client.py)
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "20"))  # Hosts with a connection pool per session
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))  # Connections kept per host
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+PERPLEXITY_TIMEOUT = float(os.getenv("PERPLEXITY_TIMEOUT", "60"))  # Seconds per Perplexity request
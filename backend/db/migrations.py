@@ -0,0 +1,28 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from .database import Base
+
+
+def add_missing_columns(engine: Engine):
+    """
+    Add model columns that are missing from existing tables.
+
+    create_all() only creates new tables, so columns added to an existing
+    model would otherwise never reach databases created before the change.
+    Only nullable columns are supported, which is all this needs to cover.
+    """
+    inspector = inspect(engine)
+
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            print(f"[Migrations] Added column {table.name}.{column.name}")
@@ -6,9 +6,19 @@ from db.database import engine, Base
 from routers.task import router as tasks_router
 from routers.workspace import router as workspace_router
 from routers.share import router as share_router
+from routers.search import router as search_router
+from routers.admin import router as admin_router
+from routers.jobs import router as jobs_router
 import models
 from fastapi.middleware.cors import CORSMiddleware
 from services.scheduler_service import start_scheduler, stop_scheduler
+from services.pdf_extraction import shutdown_extraction_pool
+from services.job_queue import start_job_workers, stop_job_workers
+from services.llm_client import close_llm_client
+from services.http_client import close_http_sessions
+from services.usage_ledger import stop_usage_writer
+from db.migrations import add_missing_columns
+from services.search_service import init_search_index, rebuild_search_index_if_empty
 
 # Get frontend URL from environment, with local dev fallback
 frontend_url = os.getenv("FRONTEND_URL", "http://localhost:5173")
@@ -21,12 +31,18 @@ origins = [
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Manage application lifecycle - start/stop scheduler."""
+    """Manage application lifecycle - start/stop scheduler and worker pools."""
     # Startup
     start_scheduler()
+    start_job_workers()
     yield
     # Shutdown
     stop_scheduler()
+    stop_job_workers()
+    shutdown_extraction_pool()
+    close_llm_client()
+    close_http_sessions()
+    stop_usage_writer()
 
 
 app = FastAPI(title="Smart Task Manager API", lifespan=lifespan)
@@ -42,10 +58,16 @@ app.add_middleware(
 
 app.include_router(auth_router)
 Base.metadata.create_all(bind=engine)
+add_missing_columns(engine)
+init_search_index(engine)
+rebuild_search_index_if_empty()
 
 app.include_router(tasks_router)
 app.include_router(workspace_router)
 app.include_router(share_router)
+app.include_router(search_router)
+app.include_router(admin_router)
+app.include_router(jobs_router)
 
 @app.get("/")
 def health_check():
@@ -6,3 +6,13 @@ from .task_summary import TaskSummary
 from .task_resource import TaskResource
 from .task_share import TaskShare
 from .assignment_solution import AssignmentSolution
+from .attachment_page import AttachmentPage
+from .job import Job
+from .search_document import SearchDocument
+from .summary_cache import SummaryCache
+from .partial_summary import PartialSummary
+from .rate_limit import RateLimitBucket
+from .ai_usage import AIUsageRecord
+from .url_liveness import UrlLiveness
+from .resource_cache import ResourceCache
+from .resource_cache_band import ResourceCacheBand
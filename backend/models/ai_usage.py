@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Index
+from db.database import Base
+
+
+class AIUsageRecord(Base):
+    """One upstream AI call (or a result served from cache instead), appended by the usage ledger."""
+    __tablename__ = "ai_usage_records"
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime, nullable=False, index=True)  # UTC, when the call finished
+
+    # Who and what the call was for; kept as plain ids so the ledger survives deleted tasks
+    task_id = Column(Integer, nullable=True)
+    user_id = Column(Integer, nullable=True, index=True)
+    endpoint = Column(String(50), nullable=False)  # e.g. "summary", "assignments", "summary_precompute"
+
+    provider = Column(String(20), nullable=True)  # "openai" or "perplexity"; None for cache hits
+    model = Column(String(50), nullable=True)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)  # Prompt tokens served from the provider's prefix cache
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cost_usd = Column(Float, nullable=True)  # Estimated from MODEL_PRICES; None for unknown models
+    latency_ms = Column(Float, nullable=False, default=0.0)
+
+    cache_hit = Column(Boolean, nullable=False, default=False)  # Served from a result cache, no upstream call
+    outcome = Column(String(20), nullable=False)  # ok / truncated / rate_limited / timeout / error / cancelled / cached
+
+    __table_args__ = (Index('ix_ai_usage_records_endpoint_created', 'endpoint', 'created_at'),)
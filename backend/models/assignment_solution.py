@@ -16,6 +16,7 @@ class AssignmentSolution(Base):
     # AI-generated solutions
     questions = Column(JSON, nullable=False, default=list)  # List of identified questions
     solutions = Column(JSON, nullable=False, default=list)  # List of solution approaches
+    prompt_version = Column(String(50), nullable=True)  # Prompt templates they were generated with
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
+from db.database import Base
+
+
+class AttachmentPage(Base):
+    __tablename__ = "attachment_pages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    attachment_id = Column(Integer, ForeignKey("task_attachments.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    # SHA-256 of the file the text was extracted from
+    content_hash = Column(String(64), nullable=False)
+
+    page_number = Column(Integer, nullable=False)  # 1-based
+    page_count = Column(Integer, nullable=False)  # Total pages in the document
+    text = Column(Text, nullable=False, default="")
+
+    # None for extracted text; for a skip marker, "retry" (the worker crashed,
+    # so it's extracted again) or "failed" (kept), and the extractions so far
+    status = Column(String(10), nullable=True)
+    attempts = Column(Integer, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # One row per page per version of the file
+    __table_args__ = (UniqueConstraint('attachment_id', 'content_hash', 'page_number', name='unique_attachment_page'),)
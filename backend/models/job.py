@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, Index
+from sqlalchemy.sql import func
+from db.database import Base
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String(36), primary_key=True)  # UUID
+    kind = Column(String(50), nullable=False)  # e.g. "ingest_attachment"
+    status = Column(String(20), nullable=False, default="pending")  # pending / running / done / failed
+    priority = Column(Integer, nullable=False, default=0)  # Higher runs first
+
+    task_id = Column(Integer, nullable=True, index=True)
+    user_id = Column(Integer, nullable=True)
+    attachment_id = Column(Integer, nullable=True, index=True)
+
+    payload = Column(JSON, nullable=False, default=dict)
+    result = Column(JSON, nullable=True)
+    progress = Column(String(255), nullable=True)  # Latest human-readable progress message
+    error = Column(Text, nullable=True)
+
+    attempts = Column(Integer, nullable=False, default=0)
+    lease_expires_at = Column(DateTime, nullable=True)  # Running jobs past this are reclaimed
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index('ix_jobs_status_priority', 'status', 'priority'),)
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy.sql import func
+from db.database import Base
+
+
+class PartialSummary(Base):
+    __tablename__ = "partial_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # SHA-256 over the input's content hash, its kind, prompt version and model route
+    fingerprint = Column(String(64), nullable=False, unique=True, index=True)
+    kind = Column(String(20), nullable=False)  # text or image
+    model = Column(String(50), nullable=False)
+    prompt_version = Column(String(20), nullable=False)
+
+    result = Column(JSON, nullable=False)  # summary, key_points, concepts
+    hit_count = Column(Integer, nullable=False, default=0)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, String, Float
+from db.database import Base
+
+
+class RateLimitBucket(Base):
+    """Token buckets for one upstream provider and model, shared by every worker."""
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String(100), primary_key=True)  # "provider:model"
+    requests = Column(Float, nullable=False)  # Requests available right now
+    tokens = Column(Float, nullable=False)  # Model tokens available right now
+    updated_at = Column(Float, nullable=False)  # Unix time of the last change (checked on update)
+    blocked_until = Column(Float, nullable=False, default=0.0)  # Unix time; set from Retry-After on 429s
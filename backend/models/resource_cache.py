@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy.sql import func
+from db.database import Base
+
+
+class ResourceCache(Base):
+    __tablename__ = "resource_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # SHA-256 over the normalized study material and the resources prompt version
+    fingerprint = Column(String(64), nullable=False, unique=True, index=True)
+    prompt_version = Column(String(50), nullable=False, index=True)
+    # MinHash of the material's word shingles, for finding near-duplicate material
+    minhash = Column(JSON, nullable=False)
+
+    resources = Column(JSON, nullable=False)  # Verified title, url, description, source dicts
+    hit_count = Column(Integer, nullable=False, default=0)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
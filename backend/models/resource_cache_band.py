@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint
+from db.database import Base
+
+
+class ResourceCacheBand(Base):
+    """One LSH band of a resource cache entry's MinHash, so near-duplicate lookups only read entries sharing a band."""
+    __tablename__ = "resource_cache_bands"
+
+    id = Column(Integer, primary_key=True, index=True)
+    entry_id = Column(Integer, ForeignKey("resource_cache.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    # Hash of the band's number and its slice of the signature
+    band_key = Column(String(16), nullable=False, index=True)
+
+    __table_args__ = (UniqueConstraint('entry_id', 'band_key', name='unique_resource_cache_band'),)
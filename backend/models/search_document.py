@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from db.database import Base
+
+
+class SearchDocument(Base):
+    __tablename__ = "search_documents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, nullable=False, index=True)
+
+    # What was indexed: "task" (title), "note" or "attachment"
+    source_type = Column(String(20), nullable=False)
+    source_id = Column(Integer, nullable=False)
+
+    title = Column(String, nullable=False, default="")
+    content = Column(Text, nullable=False, default="")
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # One document per indexed source
+    __table_args__ = (UniqueConstraint('source_type', 'source_id', name='unique_search_source'),)
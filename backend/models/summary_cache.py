@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy.sql import func
+from db.database import Base
+
+
+class SummaryCache(Base):
+    __tablename__ = "summary_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # SHA-256 over title, notes, attachment contents, prompt version and model routes
+    fingerprint = Column(String(64), nullable=False, unique=True, index=True)
+    model = Column(String(50), nullable=False)
+    prompt_version = Column(String(20), nullable=False)
+
+    result = Column(JSON, nullable=False)  # summary, key_points, concepts, action_items, study_tips
+    hit_count = Column(Integer, nullable=False, default=0)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
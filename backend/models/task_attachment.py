@@ -14,4 +14,7 @@ class TaskAttachment(Base):
     content_type = Column(String, nullable=False)
     file_size = Column(BigInteger, nullable=False)
 
+    # Background ingestion: pending / processing / ready / failed
+    ingestion_status = Column(String(20), nullable=True)
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -13,5 +13,6 @@ class TaskResource(Base):
     url = Column(Text, nullable=False)
     description = Column(Text, nullable=True)
     source = Column(String(100), nullable=True)  # e.g., "Khan Academy", "Wikipedia", etc.
+    prompt_version = Column(String(50), nullable=True)  # Prompt template it was found with
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
 from sqlalchemy.sql import func
 from db.database import Base
 
@@ -14,6 +14,7 @@ class TaskSummary(Base):
     concepts = Column(JSON, nullable=False, default=list)
     action_items = Column(JSON, nullable=False, default=list)
     study_tips = Column(JSON, nullable=False, default=list)
+    prompt_version = Column(String(50), nullable=True)  # Prompt templates it was generated with, e.g. "study_guide@3"
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime
+from db.database import Base
+
+
+class UrlLiveness(Base):
+    """Last result of checking a resource URL, or a whole domain found unreachable, shared by every worker."""
+    __tablename__ = "url_liveness"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # SHA-256 of the normalized URL, or of "domain:<host>" for an unreachable domain
+    key = Column(String(64), nullable=False, unique=True, index=True)
+    kind = Column(String(10), nullable=False)  # url or domain
+    url = Column(Text, nullable=False)  # Normalized URL, or the host for domains
+
+    live = Column(Boolean, nullable=False)
+    status_code = Column(Integer, nullable=True)  # None if no response
+    final_url = Column(Text, nullable=True)  # Where redirects ended up
+    checked_at = Column(DateTime, nullable=False, index=True)  # UTC
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from auth.deps import get_admin_user
+from db.deps import get_db
+from models.user import User
+from services.llm_client import get_llm_metrics
+from services.rate_limiter import get_rate_limit_status
+from services.usage_ledger import get_usage_rollups
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+@router.get("/metrics/llm")
+def llm_metrics(current_user: User = Depends(get_admin_user)):
+    """LLM client metrics for the process serving this request (calls, queueing, connection reuse)."""
+    return get_llm_metrics()
+
+
+@router.get("/metrics/rate-limits")
+def rate_limit_metrics(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """Shared upstream rate-limit buckets, plus throttling and retry counts for this process."""
+    return get_rate_limit_status(db)
+
+
+@router.get("/usage")
+def ai_usage(
+    days: int = Query(7, ge=1, le=365),
+    limit: int = Query(20, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    AI calls, tokens, estimated cost and latency from the usage ledger over
+    the last `days`: in total, per endpoint, per model and for the `limit`
+    users who cost the most. Records reach the ledger within AI_USAGE_FLUSH_SECONDS.
+    """
+    return get_usage_rollups(db, days=days, limit=limit)
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import time
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from db.database import SessionLocal
+from db.deps import get_db
+from auth.deps import get_current_user
+from models.job import Job
+from models.user import User
+from schemas.job import JobResponse
+from config import JOB_EVENTS_POLL_INTERVAL
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+# Comment line sent on quiet streams so proxies don't close them
+KEEPALIVE_SECONDS = 15
+
+
+def get_user_job(job_id: str, db: Session, current_user: User) -> Job:
+    """Helper to fetch a job started by the current user."""
+    job = db.query(Job).filter(Job.id == job_id, Job.user_id == current_user.id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def _load_job(job_id: str) -> JobResponse | None:
+    # Streams outlive the request's session, so every check uses its own
+    db: Session = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        return JobResponse.model_validate(job) if job else None
+    finally:
+        db.close()
+
+
+# Headers that stop proxies buffering or caching an event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse_event(event: str, data: str) -> str:
+    """One server-sent event."""
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+def get_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Status, progress and (once done) result of a background job."""
+    return get_user_job(job_id, db, current_user)
+
+
+@router.get("/{job_id}/events")
+def job_events(
+    job_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Server-sent events for a background job.
+
+    Sends a "progress" event whenever the status or progress message
+    changes, then one final "done" or "failed" event with the full job
+    (including its result) and closes the stream.
+    """
+    get_user_job(job_id, db, current_user)
+
+    async def stream():
+        last_state = None
+        last_sent = time.monotonic()
+
+        while not await request.is_disconnected():
+            job = await run_in_threadpool(_load_job, job_id)
+            if job is None:
+                yield sse_event("failed", json.dumps({"id": job_id, "status": "failed", "error": "Job no longer exists"}))
+                return
+
+            state = (job.status, job.progress)
+            if job.status in ("done", "failed"):
+                yield sse_event(job.status, job.model_dump_json())
+                return
+
+            if state != last_state:
+                yield sse_event("progress", json.dumps({"id": job.id, "status": job.status, "progress": job.progress}))
+                last_state = state
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > KEEPALIVE_SECONDS:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+
+            await asyncio.sleep(JOB_EVENTS_POLL_INTERVAL)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
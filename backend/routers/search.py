@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from db.deps import get_db
+from auth.deps import get_current_user
+from models.user import User
+from schemas.search import SearchResponse
+from services.search_service import search
+
+router = APIRouter(prefix="/search", tags=["Search"])
+
+
+@router.get("", response_model=SearchResponse)
+def search_tasks(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Search task titles, notes and attachment text across the user's own and shared tasks."""
+    return search(db, current_user.id, q, limit)
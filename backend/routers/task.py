@@ -7,6 +7,7 @@ from models.task import Task
 from models.task_share import TaskShare
 from schemas.task import TaskCreate, TaskUpdate, TaskResponse
 from services.suggestions import rank_tasks
+from services.search_service import index_task, remove_task_from_index
 
 router = APIRouter(prefix="/tasks", tags=["Tasks"])
 
@@ -72,6 +73,9 @@ def create_task(
     db.add(new_task)
     db.commit()
     db.refresh(new_task)
+
+    index_task(db, new_task)
+    db.commit()
     return new_task
 
 @router.put("/{task_id}", response_model=TaskResponse)
@@ -93,6 +97,9 @@ def update_task(
     for key, value in update_data.items():
         setattr(task, key, value)
 
+    if "title" in update_data:
+        index_task(db, task)
+
     db.commit()
     db.refresh(task)
     return task
@@ -111,6 +118,7 @@ def delete_task(
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
 
+    remove_task_from_index(db, task.id)
     db.delete(task)
     db.commit()
     return {"message": "Task deleted"}
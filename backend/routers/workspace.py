@@ -1,8 +1,10 @@
 import os
+import json
 import uuid
 from pathlib import Path
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from auth.deps import get_current_user
@@ -13,15 +15,24 @@ from models.task_attachment import TaskAttachment
 from models.task_summary import TaskSummary
 from models.task_resource import TaskResource
 from models.task_share import TaskShare
+from db.database import SessionLocal
 from db.deps import get_db
 from schemas.task_note import TaskNoteUpdate, TaskNoteResponse
-from schemas.task_attachment import TaskAttachmentResponse
+from schemas.task_attachment import TaskAttachmentResponse, AttachmentStatusResponse
 from schemas.task_summary import TaskSummaryResponse
 from schemas.task_resource import TaskResourceResponse
 from config import UPLOAD_DIR, ALLOWED_CONTENT_TYPES, MAX_FILE_SIZE
-from services.ai_service import generate_task_summary, extract_pdf_text
-from services.resource_service import find_resources
-from services.assignment_service import solve_assignment
+from schemas.job import JobResponse
+from routers.jobs import SSE_HEADERS, sse_event
+from services.ai_service import get_image_derivative_path
+from services.pdf_service import delete_attachment_pages
+from services.workspace_ai import (
+    generate_summary_for_task, stream_summary_for_task, generate_resources_for_task, solve_assignment_for_task,
+    queue_summary_job, queue_resources_job, queue_assignment_job
+)
+from services.ingestion_service import queue_attachment_ingestion, get_attachment_status
+from services.search_service import index_note, index_attachment, remove_from_index
+from services.usage_ledger import usage_context
 from models.assignment_solution import AssignmentSolution
 from schemas.assignment_solution import AssignmentSolutionResponse
 
@@ -85,6 +96,9 @@ def update_task_notes(
 
     db.commit()
     db.refresh(note)
+
+    index_note(db, note)
+    db.commit()
     return note
 
 
@@ -155,9 +169,38 @@ async def upload_attachment(
     db.commit()
     db.refresh(attachment)
 
+    # Filename is searchable right away; text is indexed once ingestion extracts it
+    index_attachment(db, attachment)
+    db.commit()
+
+    # Preprocess in the background so AI features don't have to
+    queue_attachment_ingestion(db, attachment, current_user.id)
+    db.refresh(attachment)
+
     return attachment
 
 
+@router.get("/attachments/{attachment_id}/status", response_model=AttachmentStatusResponse)
+def get_attachment_ingestion_status(
+    task_id: int,
+    attachment_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get the background preprocessing status of an attachment."""
+    get_user_task(task_id, db, current_user)
+
+    attachment = db.query(TaskAttachment).filter(
+        TaskAttachment.id == attachment_id,
+        TaskAttachment.task_id == task_id
+    ).first()
+
+    if not attachment:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+
+    return get_attachment_status(db, attachment)
+
+
 @router.get("/attachments/{attachment_id}/download")
 def download_attachment(
     task_id: int,
@@ -204,15 +247,22 @@ def delete_attachment(
     if not attachment:
         raise HTTPException(status_code=404, detail="Attachment not found")
 
-    # Delete file from disk
+    # Delete file and any precomputed derivative from disk
     file_path = UPLOAD_DIR / str(task_id) / attachment.stored_filename
     if file_path.exists():
         os.remove(file_path)
+    derivative_path = get_image_derivative_path(file_path)
+    if derivative_path.exists():
+        os.remove(derivative_path)
 
-    # Delete database record
+    # Delete stored text and database record
+    delete_attachment_pages(db, attachment.id)
+    remove_from_index(db, "attachment", attachment.id)
     db.delete(attachment)
 
-    # Clear cached summary and resources since attachments changed
+    # Clear the saved summary and resources since attachments changed. The
+    # partial summaries of the remaining notes and files stay cached, so
+    # regenerating only merges them again instead of re-reading everything
     db.query(TaskSummary).filter(TaskSummary.task_id == task_id).delete()
     db.query(TaskResource).filter(TaskResource.task_id == task_id).delete()
     print(f"[Attachment Delete] Cleared cached summary and resources for task {task_id}")
@@ -244,6 +294,7 @@ def get_saved_summary(
         "concepts": summary.concepts,
         "action_items": summary.action_items,
         "study_tips": summary.study_tips,
+        "prompt_version": summary.prompt_version,
         "error": False,
         "updated_at": summary.updated_at.isoformat() if summary.updated_at else None
     }
@@ -268,72 +319,70 @@ def delete_summary(
 @router.post("/summary/generate")
 def generate_and_save_summary(
     task_id: int,
+    force: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Generate a FRESH AI summary - always reads current attachments and notes."""
-    task = get_user_task(task_id, db, current_user, require_edit=True)
-
-    # STEP 1: Delete any existing summary first
-    db.query(TaskSummary).filter(TaskSummary.task_id == task_id).delete()
-    db.commit()
-    print(f"[Summary Generate] Deleted old summary for task {task_id}")
+    """
+    Generate a FRESH AI summary - always reads current attachments and notes.
 
-    # STEP 2: Get fresh notes
-    note = db.query(TaskNote).filter(TaskNote.task_id == task_id).first()
-    notes_content = note.content if note else ""
-    print(f"[Summary Generate] Notes content: {len(notes_content)} chars")
-
-    # STEP 3: Get current attachments from database
-    attachments = db.query(TaskAttachment).filter(
-        TaskAttachment.task_id == task_id
-    ).all()
-
-    print(f"[Summary Generate] === CURRENT ATTACHMENTS FOR TASK {task_id} ===")
-    print(f"[Summary Generate] Found {len(attachments)} attachments in database")
-
-    # Build attachment data - only include files that exist on disk
-    attachment_data = []
-    for att in attachments:
-        file_path = UPLOAD_DIR / str(task_id) / att.stored_filename
-        exists = file_path.exists()
-        print(f"[Summary Generate]   - {att.filename} | stored: {att.stored_filename} | exists: {exists}")
-
-        if exists:
-            attachment_data.append({
-                "task_id": att.task_id,
-                "stored_filename": att.stored_filename,
-                "filename": att.filename,
-                "content_type": att.content_type
-            })
-
-    print(f"[Summary Generate] Processing {len(attachment_data)} valid attachments")
+    If the exact same title, notes and files were summarized before (for any
+    task) the cached study guide is reused; force=true always calls the model.
+    """
+    task = get_user_task(task_id, db, current_user, require_edit=True)
+    with usage_context("summary", task_id=task.id, user_id=current_user.id):
+        return generate_summary_for_task(db, task, force=force)
 
-    # STEP 4: Generate fresh summary
-    result = generate_task_summary(task.title, notes_content, attachment_data)
 
-    # If there was an error, return it without saving
-    if result.get("error"):
-        return result
+@router.post("/summary/stream")
+def stream_summary(
+    task_id: int,
+    force: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Generate and save a fresh summary, streamed as server-sent events.
 
-    # STEP 5: Save the new summary
-    new_summary = TaskSummary(
-        task_id=task_id,
-        summary=result.get("summary", ""),
-        key_points=result.get("key_points", []),
-        concepts=result.get("concepts", []),
-        action_items=result.get("action_items", []),
-        study_tips=result.get("study_tips", [])
+    Sends a "section" event ({"name", "value"}) as soon as each section of
+    the study guide is written, then a final "done" (or "failed") event with
+    the complete result, the same as /summary/generate returns.
+    """
+    get_user_task(task_id, db, current_user, require_edit=True)
+    user_id = current_user.id
+
+    def events():
+        # The stream outlives the request's session, so it uses its own
+        stream_db: Session = SessionLocal()
+        try:
+            task = stream_db.query(Task).filter(Task.id == task_id).first()
+            with usage_context("summary_stream", task_id=task_id, user_id=user_id):
+                for event, data in stream_summary_for_task(stream_db, task, force=force):
+                    if event == "section":
+                        name, value = data
+                        yield sse_event("section", json.dumps({"name": name, "value": value}))
+                    else:
+                        yield sse_event("failed" if data.get("error") else "done", json.dumps(data))
+        finally:
+            stream_db.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
     )
-    db.add(new_summary)
-    db.commit()
-    db.refresh(new_summary)
-
-    result["updated_at"] = new_summary.updated_at.isoformat() if new_summary.updated_at else None
-    print(f"[Summary Generate] New summary saved for task {task_id}")
 
-    return result
 
+@router.post("/summary/jobs", status_code=202, response_model=JobResponse)
+def queue_summary_generation(
+    task_id: int,
+    force: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Generate the summary in the background. Follow it at /jobs/{job_id} or /jobs/{job_id}/events."""
+    task = get_user_task(task_id, db, current_user, require_edit=True)
+    return queue_summary_job(db, task, current_user.id, force=force)
 
 # ============ RESOURCES ENDPOINTS ============
 
@@ -372,113 +421,31 @@ def delete_resources(
 @router.post("/resources/generate")
 def generate_resources(
     task_id: int,
+    force: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Generate FRESH resource suggestions - always reads current attachments and notes."""
-    task = get_user_task(task_id, db, current_user, require_edit=True)
-
-    # STEP 1: Delete any existing resources first
-    db.query(TaskResource).filter(TaskResource.task_id == task_id).delete()
-    db.commit()
-    print(f"[Resources Generate] Deleted old resources for task {task_id}")
-
-    # STEP 2: Get fresh notes
-    note = db.query(TaskNote).filter(TaskNote.task_id == task_id).first()
-    notes_content = note.content if note else ""
-    print(f"[Resources Generate] Notes content: {len(notes_content)} chars")
-
-    # STEP 3: Get ALL attachments and extract text from PDFs
-    pdf_content = ""
-    all_attachments = db.query(TaskAttachment).filter(
-        TaskAttachment.task_id == task_id
-    ).all()
-
-    print(f"[Resources Generate] === ALL ATTACHMENTS FOR TASK {task_id} ===")
-    print(f"[Resources Generate] Found {len(all_attachments)} total attachments in database")
-
-    pdf_attachments = [a for a in all_attachments if a.content_type == "application/pdf"]
-    print(f"[Resources Generate] Found {len(pdf_attachments)} PDF attachments")
-
-    for att in pdf_attachments[:5]:  # Process up to 5 PDFs
-        file_path = UPLOAD_DIR / str(task_id) / att.stored_filename
-        exists = file_path.exists()
-        print(f"[Resources Generate]   - {att.filename} | stored: {att.stored_filename} | exists: {exists}")
-
-        if exists:
-            extracted = extract_pdf_text(file_path)
-            print(f"[Resources Generate]   Extraction result: {len(extracted) if extracted else 0} chars")
-            print(f"[Resources Generate]   First 200 chars: {extracted[:200] if extracted else 'None'}...")
-
-            # Include content even if it starts with [ - just log a warning
-            if extracted:
-                if extracted.startswith("["):
-                    print(f"[Resources Generate]   WARNING: PDF extraction returned message: {extracted[:100]}")
-                else:
-                    pdf_content += f"\n\n=== PDF: {att.filename} ===\n{extracted[:12000]}"
-                    print(f"[Resources Generate]   Added {min(len(extracted), 12000)} chars from {att.filename}")
-
-    print(f"[Resources Generate] Total PDF content: {len(pdf_content)} chars")
-
-    # STEP 4: Find fresh resources based on current content
-    # Use task title as fallback if no notes/PDF content but there are image attachments
-    has_any_attachments = len(all_attachments) > 0
-    has_text_content = bool(notes_content.strip()) or bool(pdf_content.strip())
-
-    print(f"[Resources Generate] has_any_attachments: {has_any_attachments}, has_text_content: {has_text_content}")
-
-    # If we have attachments but no extractable text, use task title as content hint
-    effective_notes = notes_content
-    if has_any_attachments and not has_text_content and task.title:
-        effective_notes = f"Topic: {task.title}"
-        print(f"[Resources Generate] Using task title as content hint: {task.title}")
-
-    resources = find_resources(
-        task_title=task.title,
-        notes_content=effective_notes,
-        pdf_content=pdf_content,
-        num_resources=5
-    )
-
-    if not resources:
-        return {"resources": [], "error": "Could not find relevant resources. Please add notes or upload PDFs with readable text."}
-
-    # STEP 5: Save new resources
-    saved_resources = []
-    for r in resources:
-        resource = TaskResource(
-            task_id=task_id,
-            title=r.get("title", ""),
-            url=r.get("url", ""),
-            description=r.get("description", ""),
-            source=r.get("source", "")
-        )
-        db.add(resource)
-        saved_resources.append(resource)
-
-    db.commit()
-
-    for r in saved_resources:
-        db.refresh(r)
+    """
+    Generate FRESH resource suggestions - always reads current attachments and notes.
 
-    print(f"[Resources Generate] Saved {len(saved_resources)} new resources for task {task_id}")
+    If the same (or nearly the same) material had resources found recently
+    (for any task) the verified resources are reused; force=true always searches.
+    """
+    task = get_user_task(task_id, db, current_user, require_edit=True)
+    with usage_context("resources", task_id=task.id, user_id=current_user.id):
+        return generate_resources_for_task(db, task, force=force)
 
-    return {
-        "resources": [
-            {
-                "id": r.id,
-                "task_id": r.task_id,
-                "title": r.title,
-                "url": r.url,
-                "description": r.description,
-                "source": r.source,
-                "created_at": r.created_at.isoformat() if r.created_at else None
-            }
-            for r in saved_resources
-        ],
-        "error": None
-    }
 
+@router.post("/resources/jobs", status_code=202, response_model=JobResponse)
+def queue_resource_generation(
+    task_id: int,
+    force: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Generate resource suggestions in the background. Follow it at /jobs/{job_id} or /jobs/{job_id}/events."""
+    task = get_user_task(task_id, db, current_user, require_edit=True)
+    return queue_resources_job(db, task, current_user.id, force=force)
 
 # ============ ASSIGNMENT SOLVER ENDPOINTS ============
 
@@ -519,16 +486,8 @@ def get_assignment_solution(
     return solution
 
 
-@router.post("/assignments/solve")
-async def solve_assignment_endpoint(
-    task_id: int,
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Upload an assignment and generate solution approaches using task notes as context."""
-    task = get_user_task(task_id, db, current_user, require_edit=True)
-
+async def save_assignment_upload(task_id: int, file: UploadFile) -> Path:
+    """Validate an uploaded assignment file and save it in the task's upload directory."""
     # Validate content type
     if file.content_type not in ALLOWED_CONTENT_TYPES:
         raise HTTPException(
@@ -561,67 +520,40 @@ async def solve_assignment_endpoint(
         f.write(content)
 
     print(f"[Assignment Solve] Saved assignment file: {file_path}")
+    return file_path
 
-    # Get notes content
-    note = db.query(TaskNote).filter(TaskNote.task_id == task_id).first()
-    notes_content = note.content if note else ""
 
-    # Get context attachments (study materials)
-    attachments = db.query(TaskAttachment).filter(
-        TaskAttachment.task_id == task_id
-    ).all()
+@router.post("/assignments/solve")
+async def solve_assignment_endpoint(
+    task_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Upload an assignment and generate solution approaches using task notes as context."""
+    task = get_user_task(task_id, db, current_user, require_edit=True)
+    file_path = await save_assignment_upload(task_id, file)
 
-    context_attachments = []
-    for att in attachments:
-        att_path = UPLOAD_DIR / str(task_id) / att.stored_filename
-        if att_path.exists():
-            context_attachments.append({
-                "task_id": att.task_id,
-                "stored_filename": att.stored_filename,
-                "filename": att.filename,
-                "content_type": att.content_type
-            })
-
-    print(f"[Assignment Solve] Using {len(context_attachments)} context attachments")
-    print(f"[Assignment Solve] Notes content: {len(notes_content)} chars")
-
-    # Generate solutions
-    result = solve_assignment(
-        task_title=task.title,
-        notes_content=notes_content,
-        context_attachments=context_attachments,
-        assignment_file_path=file_path,
-        assignment_content_type=file.content_type,
-        assignment_filename=file.filename or "assignment"
-    )
+    # In the threadpool, since the model call may wait for a free slot (it runs in a copy of this context)
+    with usage_context("assignments", task_id=task.id, user_id=current_user.id):
+        return await run_in_threadpool(
+            solve_assignment_for_task, db, task, file_path, file.filename or "assignment", file.content_type
+        )
 
-    if result.get("error"):
-        # Clean up the uploaded file if there was an error
-        if file_path.exists():
-            os.remove(file_path)
-        return {"questions": [], "error": result["error"]}
 
-    # Save the solution to database
-    solution = AssignmentSolution(
-        task_id=task_id,
-        assignment_filename=file.filename or "assignment",
-        assignment_stored_filename=stored_filename,
-        questions=result.get("questions", [])
+@router.post("/assignments/jobs", status_code=202, response_model=JobResponse)
+async def queue_assignment_solving(
+    task_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Upload an assignment and solve it in the background. Follow it at /jobs/{job_id} or /jobs/{job_id}/events."""
+    task = get_user_task(task_id, db, current_user, require_edit=True)
+    file_path = await save_assignment_upload(task_id, file)
+    return queue_assignment_job(
+        db, task, current_user.id, file_path.name, file.filename or "assignment", file.content_type
     )
-    db.add(solution)
-    db.commit()
-    db.refresh(solution)
-
-    print(f"[Assignment Solve] Saved solution with {len(result.get('questions', []))} questions")
-
-    return {
-        "id": solution.id,
-        "task_id": solution.task_id,
-        "assignment_filename": solution.assignment_filename,
-        "questions": solution.questions,
-        "created_at": solution.created_at.isoformat() if solution.created_at else None,
-        "error": None
-    }
 
 
 @router.delete("/assignments/{solution_id}")
@@ -17,6 +17,7 @@ class AssignmentSolutionResponse(BaseModel):
     task_id: int
     assignment_filename: str
     questions: list[QuestionSolution]
+    prompt_version: Optional[str] = None
     created_at: datetime
 
     class Config:
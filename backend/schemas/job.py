@@ -0,0 +1,20 @@
+from typing import Any
+from pydantic import BaseModel
+from datetime import datetime
+
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    status: str  # pending / running / done / failed
+    task_id: int | None = None
+    progress: str | None = None
+    result: Any = None  # Same body the synchronous endpoint returns, once done
+    error: str | None = None
+    attempts: int
+    created_at: datetime | None = None
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+
+
+class SearchHit(BaseModel):
+    task_id: int
+    task_title: str
+    source_type: str  # "task", "note" or "attachment"
+    source_id: int
+    title: str
+    snippet: str  # HTML-escaped text, matches wrapped in <mark></mark>
+    score: float
+
+
+class SearchResponse(BaseModel):
+    query: str
+    hits: list[SearchHit]
+    took_ms: float
@@ -8,7 +8,18 @@ class TaskAttachmentResponse(BaseModel):
     filename: str
     content_type: str
     file_size: int
+    ingestion_status: str | None = None
     created_at: datetime
 
     class Config:
         from_attributes = True
+
+
+class AttachmentStatusResponse(BaseModel):
+    attachment_id: int
+    status: str | None
+    page_count: int | None = None
+    char_count: int | None = None
+    token_count: int | None = None
+    error: str | None = None
+    updated_at: datetime | None = None
@@ -9,6 +9,7 @@ class TaskResourceResponse(BaseModel):
     url: str
     description: str | None
     source: str | None
+    prompt_version: str | None = None
     created_at: datetime
 
     model_config = {"from_attributes": True}
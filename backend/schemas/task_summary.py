@@ -10,6 +10,7 @@ class TaskSummaryResponse(BaseModel):
     concepts: list[str]
     action_items: list[str]
     study_tips: list[str]
+    prompt_version: str | None = None
     created_at: datetime
     updated_at: datetime
 
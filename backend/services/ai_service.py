@@ -1,47 +1,55 @@
 import base64
-import json
+import os
 from pathlib import Path
-from openai import OpenAI
 from config import OPENAI_API_KEY, UPLOAD_DIR
-
-# Try to import PyPDF2 for PDF text extraction
-try:
-    from PyPDF2 import PdfReader
-    PDF_SUPPORT = True
-except ImportError:
-    PDF_SUPPORT = False
-
-
-def extract_pdf_text(file_path: Path) -> str:
-    """Extract text content from a PDF file."""
-    if not PDF_SUPPORT:
-        return "[PDF text extraction not available - please install PyPDF2]"
-
-    try:
-        reader = PdfReader(str(file_path))
-        text_parts = []
-
-        # Extract text from each page
-        for i, page in enumerate(reader.pages):
-            text = page.extract_text()
-            if text and text.strip():
-                text_parts.append(f"--- Page {i + 1} ---\n{text.strip()}")
-
-        if text_parts:
-            full_text = "\n\n".join(text_parts)
-            # Log the extraction for debugging
-            print(f"[AI Service] Extracted {len(full_text)} characters from PDF with {len(reader.pages)} pages")
-            return full_text
-        else:
-            return "[No extractable text found in PDF - the PDF may contain only images or scanned content]"
-
-    except Exception as e:
-        print(f"[AI Service] Error reading PDF: {str(e)}")
-        return f"[Error reading PDF: {str(e)}]"
+from services.llm_client import chat_completion, stream_chat_completion
+from services.json_stream import JsonStream, parse_json_response
+from services.pdf_service import get_attachment_text
+from services.partial_summary import (
+    PARTIAL_SEGMENT_TOKENS, MAX_SEGMENTS_PER_INPUT, segment_text, text_part, image_part, render_partial, summarize_parts
+)
+from services.tokenizer import count_tokens
+from services.token_budget import input_budget, pack_sections, response_usage, token_report, log_token_report
+from services.prompts import STUDY_GUIDE_PROMPT, PARTIAL_SUMMARY_PROMPT
+from services.model_router import max_response_tokens, route_messages
+
+# Token limits (GPT-4o-mini has ~128k context but we want to be safe)
+MAX_CONTENT_TOKENS = 25000
+# The content budget leaves room for the largest response any study-guide tier allows
+SUMMARY_RESPONSE_TOKENS = max_response_tokens("study_guide")
+
+# Part of the study-guide cache key; bump the template's version whenever the
+# prompt, budgets or parsing change, so cached study guides are regenerated
+SUMMARY_PROMPT_VERSION = STUDY_GUIDE_PROMPT.version
+
+# Sections of a study guide, in the order the model writes them
+SUMMARY_SECTIONS = ("summary", "key_points", "concepts", "action_items", "study_tips")
+
+
+def get_image_derivative_path(file_path: Path) -> Path:
+    """Path of the precomputed base64 encoding stored next to an image."""
+    return file_path.with_name(file_path.name + ".b64")
+
+
+def write_image_derivative(file_path: Path) -> Path:
+    """Precompute the base64 encoding of an image so AI calls can reuse it."""
+    derivative_path = get_image_derivative_path(file_path)
+    with open(file_path, "rb") as f:
+        encoded = base64.b64encode(f.read())
+    # Write then rename, so readers never see a half-written encoding
+    temp_path = derivative_path.with_name(derivative_path.name + ".tmp")
+    with open(temp_path, "wb") as f:
+        f.write(encoded)
+    os.replace(temp_path, derivative_path)
+    return derivative_path
 
 
 def encode_image_base64(file_path: Path) -> str:
-    """Encode an image file to base64."""
+    """Encode an image file to base64, using the precomputed encoding if there is one."""
+    derivative_path = get_image_derivative_path(file_path)
+    if derivative_path.exists() and derivative_path.stat().st_mtime >= file_path.stat().st_mtime:
+        return derivative_path.read_text()
+
     with open(file_path, "rb") as f:
         return base64.b64encode(f.read()).decode("utf-8")
 
@@ -70,10 +78,106 @@ def generate_task_summary(
         task_title: The title of the task
         notes_content: Text notes for the task
         attachments: List of attachment dicts with keys:
-                    task_id, stored_filename, filename, content_type
+                    id, task_id, stored_filename, filename, content_type
 
     Returns a dict with detailed summary sections.
     """
+    problem = _check_summary_inputs(notes_content, attachments)
+    if problem:
+        return problem
+
+    try:
+        messages, section_tokens, content_budget, map_stats = _summary_request(
+            task_title, notes_content, attachments or []
+        )
+    except Exception as e:
+        print(f"[AI Service] Error summarizing inputs: {str(e)}")
+        return _failed_summary(e)
+
+    summary_route = route_messages("study_guide", messages)
+    result = _generate_summary(messages, summary_route)
+    result["prompt_version"] = _prompt_version(map_stats)
+
+    result["token_usage"] = token_report(
+        section_tokens, content_budget, summary_route["max_tokens"], result.pop("token_usage", None), summary_route
+    )
+    if map_stats:
+        result["token_usage"]["map"] = map_stats
+        if map_stats["incomplete"]:
+            # Merged without some parts' summaries: fine to show, not to reuse
+            result["cacheable"] = False
+    log_token_report("[AI Service]", result["token_usage"])
+    return result
+
+
+def stream_task_summary(
+    task_title: str,
+    notes_content: str,
+    attachments: list = None
+):
+    """
+    Generate the same study guide as generate_task_summary, streaming the response.
+
+    Yields ("section", (name, value)) for each section as soon as the model
+    has finished writing it, then ("done", result) with the full result.
+    """
+    problem = _check_summary_inputs(notes_content, attachments)
+    if problem:
+        yield "done", problem
+        return
+
+    try:
+        messages, section_tokens, content_budget, map_stats = _summary_request(
+            task_title, notes_content, attachments or []
+        )
+    except Exception as e:
+        print(f"[AI Service] Error summarizing inputs: {str(e)}")
+        yield "done", _failed_summary(e)
+        return
+
+    summary_route = route_messages("study_guide", messages)
+    parser = JsonStream()
+    usage = None
+
+    try:
+        for chunk in stream_chat_completion(
+            model=summary_route["model"],
+            messages=messages,
+            temperature=0.3,
+            max_tokens=summary_route["max_tokens"],
+            stream_options={"include_usage": True}
+        ):
+            if chunk.usage:
+                usage = response_usage(chunk)
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            for path, value in parser.feed(chunk.choices[0].delta.content):
+                if len(path) == 1 and path[0] in SUMMARY_SECTIONS:
+                    yield "section", (path[0], value)
+
+    except Exception as e:
+        print(f"[AI Service] Error streaming summary: {str(e)}")
+        yield "done", _failed_summary(e)
+        return
+
+    print(f"[AI Service] Streamed response received: {len(parser.text)} chars")
+    result = _parse_detailed_response(parser.text)
+    result["prompt_version"] = _prompt_version(map_stats)
+    result["model"] = summary_route["model"]
+    result["token_usage"] = token_report(
+        section_tokens, content_budget, summary_route["max_tokens"], usage, summary_route
+    )
+    if map_stats:
+        result["token_usage"]["map"] = map_stats
+        if map_stats["incomplete"]:
+            # Merged without some parts' summaries: fine to show, not to reuse
+            result["cacheable"] = False
+    log_token_report("[AI Service]", result["token_usage"])
+    yield "done", result
+
+
+def _check_summary_inputs(notes_content: str, attachments: list | None) -> dict | None:
+    """The result to return instead of calling the model, if there's nothing to summarize."""
     if not OPENAI_API_KEY:
         return {
             "summary": "OpenAI API key not configured. Please set OPENAI_API_KEY environment variable.",
@@ -84,11 +188,7 @@ def generate_task_summary(
             "error": True
         }
 
-    attachments = attachments or []
-    has_notes = notes_content and notes_content.strip()
-    has_attachments = len(attachments) > 0
-
-    if not has_notes and not has_attachments:
+    if not (notes_content and notes_content.strip()) and not attachments:
         return {
             "summary": "No notes or attachments available to summarize. Add some content first!",
             "key_points": [],
@@ -97,12 +197,30 @@ def generate_task_summary(
             "study_tips": [],
             "error": False
         }
+    return None
+
+
+def _summary_request(
+    task_title: str,
+    notes_content: str,
+    attachments: list
+) -> tuple[list, list[dict], int, dict | None]:
+    """
+    Chat messages for a study guide, with the per-section token plan, the content budget and map stats.
+
+    A single text input that fits the budget is sent to the model as is.
+    Anything more is summarized input by input first (the map step, cached
+    per input) and the study guide is written from those partial summaries.
+    """
+    has_notes = notes_content and notes_content.strip()
+    content_budget = input_budget(MAX_CONTENT_TOKENS, SUMMARY_RESPONSE_TOKENS)
+    query = f"{task_title}\n{notes_content[:2000] if has_notes else ''}"
 
-    client = OpenAI(api_key=OPENAI_API_KEY)
+    text_inputs = []
+    image_parts = []
 
-    # Process attachments
-    pdf_contents = []
-    image_contents = []
+    if has_notes:
+        text_inputs.append(("USER'S NOTES", notes_content))
 
     print(f"[AI Service] Processing {len(attachments)} attachments...")
 
@@ -121,260 +239,113 @@ def generate_task_summary(
             continue
 
         if content_type == "application/pdf":
-            # Extract text from PDF
-            pdf_text = extract_pdf_text(file_path)
-            pdf_contents.append({
-                "filename": filename,
-                "content": pdf_text
-            })
-            print(f"[AI Service] PDF '{filename}' extracted: {len(pdf_text)} chars")
+            # Each PDF is summarized on its own, so it gets its own reading budget
+            pdf_text = get_attachment_text(
+                attachment.get("id"), file_path,
+                budget=PARTIAL_SEGMENT_TOKENS * MAX_SEGMENTS_PER_INPUT, measure=count_tokens
+            )
+            text_inputs.append((f"PDF DOCUMENT: {filename}", pdf_text))
+            print(f"[AI Service] PDF '{filename}' extracted: {len(pdf_text)} chars, {count_tokens(pdf_text)} tokens")
 
         elif content_type.startswith("image/"):
             # Prepare image for vision API
             try:
-                base64_image = encode_image_base64(file_path)
-                media_type = get_image_media_type(content_type)
-                image_contents.append({
-                    "filename": filename,
-                    "base64": base64_image,
-                    "media_type": media_type
-                })
+                image_parts.append(image_part(
+                    f"IMAGE: {filename}", encode_image_base64(file_path), get_image_media_type(content_type)
+                ))
                 print(f"[AI Service] Image '{filename}' encoded for vision API")
             except Exception as e:
                 print(f"[AI Service] Error encoding image: {str(e)}")
 
-    # Build comprehensive content for the AI
-    content_sections = []
-
-    if has_notes:
-        content_sections.append(f"=== USER'S NOTES ===\n{notes_content}")
-
-    if pdf_contents:
-        for pdf in pdf_contents:
-            content_sections.append(
-                f"=== PDF DOCUMENT: {pdf['filename']} ===\n{pdf['content']}"
-            )
-
-    combined_text = "\n\n" + "\n\n".join(content_sections) if content_sections else ""
-
-    print(f"[AI Service] Total content length: {len(combined_text)} characters")
-
-    # Use GPT-4o-mini for vision if we have images, otherwise GPT-4o-mini for better quality
-    if image_contents:
-        return _generate_with_vision(client, task_title, combined_text, image_contents)
-    else:
-        return _generate_detailed_summary(client, task_title, combined_text)
-
-
-def _generate_detailed_summary(client: OpenAI, task_title: str, content: str) -> dict:
-    """Generate a detailed, comprehensive summary for studying."""
-
-    # Truncate content if too long (GPT-4o-mini has ~128k context but we want to be safe)
-    max_content_length = 100000
-    if len(content) > max_content_length:
-        content = content[:max_content_length] + "\n\n[Content truncated due to length...]"
-
-    prompt = f"""You are an expert academic assistant helping a student understand and complete their assignment.
-
-TASK/ASSIGNMENT: {task_title}
-
-CONTENT TO ANALYZE:
-{content}
-
-Based on ALL the content provided (notes and PDF documents), create a comprehensive study guide. Read through the ENTIRE content carefully and extract the most important information.
-
-Provide your response in the following JSON format:
-{{
-    "summary": "A detailed 4-6 sentence summary that explains what this assignment/topic is about, the main themes, and what the student needs to understand. Be specific and reference actual content from the documents.",
-
-    "key_points": [
-        "Detailed key point 1 - explain the concept fully",
-        "Detailed key point 2 - include specific facts, dates, or figures if mentioned",
-        "Detailed key point 3 - explain relationships between concepts",
-        "Detailed key point 4 - highlight any important definitions or terms",
-        "Detailed key point 5 - note any critical arguments or theories"
-    ],
-
-    "concepts": [
-        "Important concept or term 1 with brief explanation",
-        "Important concept or term 2 with brief explanation",
-        "Important concept or term 3 with brief explanation"
-    ],
-
-    "action_items": [
-        "Specific action the student should take to complete this assignment",
-        "Another specific task or step",
-        "Things to research or review further"
-    ],
-
-    "study_tips": [
-        "Specific study recommendation based on the content",
-        "How to approach understanding this material",
-        "What to focus on for success"
-    ]
-}}
-
-IMPORTANT INSTRUCTIONS:
-1. Actually READ and ANALYZE the full content - don't just describe what files are attached
-2. Extract SPECIFIC information, facts, concepts, and arguments from the documents
-3. Be DETAILED and THOROUGH - this summary should help the student study
-4. Include actual content from the PDFs - quotes, statistics, key arguments, etc.
-5. If there are multiple documents, synthesize information across all of them
-6. Make the key_points comprehensive enough that a student could study from them
-7. for the key points and concepts section make sure that you make it very detailed and make sure that you properly teach the user about all the topics in all the documents so they can apply it to any questions they get"""
-
+    text_tokens = sum(count_tokens(text) for _, text in text_inputs)
+    if not image_parts and len(text_inputs) <= 1 and text_tokens <= content_budget:
+        # Nothing to merge: one prompt over the content itself
+        context, section_tokens = pack_sections(
+            [(f"=== {label} ===", text) for label, text in text_inputs], query, content_budget
+        )
+        combined_text = "\n\n" + context if context else ""
+        print(f"[AI Service] Total content length: {len(combined_text)} characters")
+        return _detailed_summary_messages(task_title, combined_text), section_tokens, content_budget, None
+
+    # Map: a partial summary per segment of each text input and per image
+    parts = []
+    for label, text in text_inputs:
+        segments = segment_text(text)
+        for i, segment in enumerate(segments):
+            parts.append(text_part(label if len(segments) == 1 else f"{label} (part {i + 1} of {len(segments)})", segment))
+    parts.extend(image_parts)
+
+    partials, map_stats = summarize_parts(parts)
+
+    # Reduce: the study guide is written from the partial summaries
+    context, section_tokens = pack_sections(
+        [(f"=== SUMMARY OF {part['label']} ===", render_partial(partial)) for part, partial in partials],
+        query,
+        content_budget
+    )
+    combined_text = (
+        "\n\nThe content below is detailed summaries of each part of the student's notes, PDF documents "
+        "and images.\n\n" + context
+    )
+    print(f"[AI Service] Merging {len(partials)} partial summaries: {len(combined_text)} characters")
+    return _detailed_summary_messages(task_title, combined_text), section_tokens, content_budget, map_stats
+
+
+def _detailed_summary_messages(task_title: str, content: str) -> list:
+    """Prompt for a detailed, comprehensive summary for studying."""
+    return STUDY_GUIDE_PROMPT.messages(task_title=task_title, content=content)
+
+
+def _prompt_version(map_stats: dict | None) -> str:
+    """Templates a study guide was generated with (the partial summaries' too, if it was merged from them)."""
+    if map_stats:
+        return f"{STUDY_GUIDE_PROMPT.id},{PARTIAL_SUMMARY_PROMPT.id}"
+    return STUDY_GUIDE_PROMPT.id
+
+
+def _generate_summary(messages: list, summary_route: dict) -> dict:
+    """Request a study guide from the model the router picked and parse it."""
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Using GPT-4o-mini for better comprehension
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert academic tutor who creates detailed, helpful study guides. You thoroughly read all provided content and extract the most important information to help students succeed in their assignments. Always provide specific, actionable insights based on the actual content."
-                },
-                {"role": "user", "content": prompt}
-            ],
+        response = chat_completion(
+            model=summary_route["model"],
+            messages=messages,
             temperature=0.3,  # Lower temperature for more focused, accurate responses
-            max_tokens=2000  # Allow longer responses for detailed summaries
+            max_tokens=summary_route["max_tokens"]  # Larger inputs get room for longer study guides
         )
 
         response_content = response.choices[0].message.content
         print(f"[AI Service] Response received: {len(response_content)} chars")
-        return _parse_detailed_response(response_content)
+        result = _parse_detailed_response(response_content)
+        result["model"] = summary_route["model"]
+        result["token_usage"] = response_usage(response)
+        return result
 
     except Exception as e:
         print(f"[AI Service] Error generating summary: {str(e)}")
-        return {
-            "summary": f"Failed to generate summary: {str(e)}",
-            "key_points": [],
-            "concepts": [],
-            "action_items": [],
-            "study_tips": [],
-            "error": True
-        }
-
-
-def _generate_with_vision(
-    client: OpenAI,
-    task_title: str,
-    text_content: str,
-    image_contents: list
-) -> dict:
-    """Generate detailed summary using vision model to analyze images."""
-
-    # Build message content with images
-    message_content = []
-
-    # Add text prompt
-    text_prompt = f"""You are an expert academic assistant helping a student understand and complete their assignment.
-
-TASK/ASSIGNMENT: {task_title}
-
-TEXT CONTENT TO ANALYZE:
-{text_content}
-
-I'm also providing {len(image_contents)} image(s) attached to this task. Please analyze the images thoroughly - they may contain diagrams, charts, text, equations, or other important information.
-
-Based on ALL the content (text notes, PDFs, and images), create a comprehensive study guide. Read through EVERYTHING carefully and extract the most important information.
-
-Provide your response in the following JSON format:
-{{
-    "summary": "A detailed 4-6 sentence summary that explains what this assignment/topic is about, the main themes, and what the student needs to understand. Be specific and reference actual content from the documents and images.",
-
-    "key_points": [
-        "Detailed key point 1 - explain the concept fully",
-        "Detailed key point 2 - include specific facts, dates, or figures if mentioned",
-        "Detailed key point 3 - explain relationships between concepts",
-        "Detailed key point 4 - highlight any important definitions or terms",
-        "Detailed key point 5 - note any critical arguments or theories"
-    ],
-
-    "concepts": [
-        "Important concept or term 1 with brief explanation",
-        "Important concept or term 2 with brief explanation",
-        "Important concept or term 3 with brief explanation"
-    ],
-
-    "action_items": [
-        "Specific action the student should take to complete this assignment",
-        "Another specific task or step",
-        "Things to research or review further"
-    ],
-
-    "study_tips": [
-        "Specific study recommendation based on the content",
-        "How to approach understanding this material",
-        "What to focus on for success"
-    ]
-}}
-
-IMPORTANT: Actually analyze the images and extract specific information from them. Describe what you see and how it relates to the assignment."""
-
-    message_content.append({
-        "type": "text",
-        "text": text_prompt
-    })
-
-    # Add images
-    for img in image_contents:
-        message_content.append({
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:{img['media_type']};base64,{img['base64']}",
-                "detail": "high"  # Use high detail for better analysis
-            }
-        })
-
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Vision-capable model
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert academic tutor who creates detailed, helpful study guides. You thoroughly analyze all provided content including images, diagrams, and documents. Always provide specific, actionable insights based on the actual content."
-                },
-                {"role": "user", "content": message_content}
-            ],
-            temperature=0.3,
-            max_tokens=2000
-        )
+        return _failed_summary(e)
 
-        response_content = response.choices[0].message.content
-        return _parse_detailed_response(response_content)
 
-    except Exception as e:
-        return {
-            "summary": f"Failed to generate summary: {str(e)}",
-            "key_points": [],
-            "concepts": [],
-            "action_items": [],
-            "study_tips": [],
-            "error": True
-        }
+def _failed_summary(error: Exception) -> dict:
+    return {
+        "summary": f"Failed to generate summary: {str(error)}",
+        "key_points": [],
+        "concepts": [],
+        "action_items": [],
+        "study_tips": [],
+        "error": True
+    }
 
 
 def _parse_detailed_response(content: str) -> dict:
-    """Parse JSON response from OpenAI."""
-    try:
-        # Try to extract JSON from the response
-        # Sometimes the model wraps it in markdown code blocks
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            parts = content.split("```")
-            if len(parts) >= 2:
-                content = parts[1]
-
-        result = json.loads(content.strip())
-        return {
-            "summary": result.get("summary", ""),
-            "key_points": result.get("key_points", []),
-            "concepts": result.get("concepts", []),
-            "action_items": result.get("action_items", []),
-            "study_tips": result.get("study_tips", []),
-            "error": False
-        }
-    except json.JSONDecodeError as e:
-        print(f"[AI Service] JSON parse error: {str(e)}")
+    """
+    Parse JSON response from OpenAI, keeping the finished sections of a truncated one.
+
+    Only a complete, parsed study guide is marked cacheable; the raw-text
+    fallback and truncated guides are shown once but never reused.
+    """
+    result, complete = parse_json_response(content)
+    if not isinstance(result, dict) or not any(section in result for section in SUMMARY_SECTIONS):
+        print("[AI Service] JSON parse error: no study guide sections in response")
         print(f"[AI Service] Raw content: {content[:500]}...")
         # If JSON parsing fails, try to return something useful
         return {
@@ -383,5 +354,18 @@ def _parse_detailed_response(content: str) -> dict:
             "concepts": [],
             "action_items": [],
             "study_tips": [],
-            "error": False
+            "error": False,
+            "cacheable": False
         }
+
+    if not complete:
+        print(f"[AI Service] Response was cut off, kept sections: {', '.join(result)}")
+    return {
+        "summary": result.get("summary", ""),
+        "key_points": result.get("key_points", []),
+        "concepts": result.get("concepts", []),
+        "action_items": result.get("action_items", []),
+        "study_tips": result.get("study_tips", []),
+        "error": False,
+        "cacheable": complete
+    }
\ No newline at end of file
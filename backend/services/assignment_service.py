@@ -1,8 +1,35 @@
-import json
+import contextvars
+import re
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from openai import OpenAI
-from config import OPENAI_API_KEY, UPLOAD_DIR
-from services.ai_service import extract_pdf_text, encode_image_base64, get_image_media_type
+from config import OPENAI_API_KEY, UPLOAD_DIR, ASSIGNMENT_SOLVE_WORKERS
+from services.llm_client import chat_completion
+from services.ai_service import encode_image_base64, get_image_media_type
+from services.pdf_service import extract_pdf_text, get_attachment_text
+from services.context_builder import CANDIDATE_MULTIPLIER
+from services.tokenizer import count_tokens, truncate_to_tokens
+from services.token_budget import input_budget, pack_sections, response_usage, token_report, log_token_report
+from services.json_stream import parse_json_response
+from services.prompts import ASSIGNMENT_PROMPT, ASSIGNMENT_VISION_PROMPT, QUESTION_SEGMENTS_PROMPT
+from services.model_router import IMAGE_TOKENS, max_response_tokens, message_tokens, route, route_messages
+
+# Prompt limits in tokens
+MAX_CONTEXT_TOKENS = 12500
+MAX_ASSIGNMENT_TOKENS = 7500  # Assignment text solved in one request, and per segmentation window
+MAX_MATERIAL_TOKENS = 3750  # Read per study material PDF (times CANDIDATE_MULTIPLIER, for ranking)
+# Room left for the largest response any assignment tier allows
+SOLUTION_RESPONSE_TOKENS = max(max_response_tokens("assignment"), max_response_tokens("assignment_vision"))
+
+# Per-question solving: a quick pass finds where each question starts, then
+# small groups of questions are solved in parallel, each with the study
+# material most relevant to it
+QUESTIONS_PER_REQUEST = 3
+QUESTION_GROUP_TOKENS = 2000  # Most assignment text solved in one request
+QUESTION_CONTEXT_TOKENS = 6000  # Study material sent with each request
+QUESTION_RESPONSE_TOKENS = 1500  # Per question in a request
+PREAMBLE_TOKENS = 500  # Assignment instructions repeated with every request
+MAX_ASSIGNMENT_READ_TOKENS = 60000  # Assignment text read for per-question solving
 
 
 def solve_assignment(
@@ -11,11 +38,16 @@ def solve_assignment(
     context_attachments: list,
     assignment_file_path: Path,
     assignment_content_type: str,
-    assignment_filename: str
+    assignment_filename: str,
+    progress: Callable[[str], None] | None = None
 ) -> dict:
     """
     Analyze an assignment and generate solution approaches using notes as context.
 
+    Text assignments with several questions are split up and the questions
+    solved in parallel; single questions and image assignments are solved
+    in one request.
+
     Args:
         task_title: The title of the task
         notes_content: User's notes for context
@@ -23,6 +55,7 @@ def solve_assignment(
         assignment_file_path: Path to the uploaded assignment file
         assignment_content_type: MIME type of the assignment file
         assignment_filename: Original filename of the assignment
+        progress: Optional callback for progress messages
 
     Returns a dict with questions and solution approaches.
     """
@@ -32,13 +65,11 @@ def solve_assignment(
             "error": "OpenAI API key not configured. Please set OPENAI_API_KEY environment variable."
         }
 
-    client = OpenAI(api_key=OPENAI_API_KEY)
-
     # Build context from notes and attachments
     context_sections = []
 
     if notes_content and notes_content.strip():
-        context_sections.append(f"=== STUDENT'S NOTES ===\n{notes_content}")
+        context_sections.append(("=== STUDENT'S NOTES ===", notes_content))
 
     # Process context attachments (study materials)
     for attachment in context_attachments:
@@ -53,18 +84,22 @@ def solve_assignment(
             continue
 
         if content_type == "application/pdf":
-            pdf_text = extract_pdf_text(file_path)
+            # Read more than fits so the most relevant passages can be picked below
+            pdf_text = get_attachment_text(
+                attachment.get("id"), file_path, budget=MAX_MATERIAL_TOKENS * CANDIDATE_MULTIPLIER, measure=count_tokens
+            )
             if pdf_text and not pdf_text.startswith("["):
-                context_sections.append(f"=== STUDY MATERIAL: {filename} ===\n{pdf_text[:15000]}")
-
-    context_text = "\n\n".join(context_sections) if context_sections else "No additional study materials provided."
+                context_sections.append((f"=== STUDY MATERIAL: {filename} ===", pdf_text))
 
     # Extract assignment content
     assignment_content = ""
     assignment_images = []
 
     if assignment_content_type == "application/pdf":
-        assignment_content = extract_pdf_text(assignment_file_path)
+        # One extra token so the truncation note is still added when needed
+        assignment_content = extract_pdf_text(
+            assignment_file_path, budget=MAX_ASSIGNMENT_READ_TOKENS + 1, measure=count_tokens
+        )
         print(f"[Assignment Service] Extracted {len(assignment_content)} chars from assignment PDF")
     elif assignment_content_type.startswith("image/"):
         try:
@@ -80,190 +115,406 @@ def solve_assignment(
             print(f"[Assignment Service] Error encoding image: {str(e)}")
             return {"questions": [], "error": f"Failed to process image: {str(e)}"}
 
+    # The assignment gets its own share of the budget; study material gets the
+    # rest, keeping the passages most relevant to the assignment's questions
+    content_budget = input_budget(MAX_CONTEXT_TOKENS + MAX_ASSIGNMENT_TOKENS, SOLUTION_RESPONSE_TOKENS)
+    assignment_tokens = count_tokens(assignment_content)
+
+    if assignment_content.strip() and not assignment_images:
+        # Every question is solved, each within its group's own cap, so the
+        # whole assignment is split (up to MAX_ASSIGNMENT_READ_TOKENS)
+        if assignment_tokens > MAX_ASSIGNMENT_READ_TOKENS:
+            print(f"[Assignment Service] Assignment is {assignment_tokens} tokens, reading the first {MAX_ASSIGNMENT_READ_TOKENS}")
+            assignment_content = truncate_to_tokens(assignment_content, MAX_ASSIGNMENT_READ_TOKENS)
+        if progress:
+            progress("Finding questions")
+        segmented = segment_assignment(assignment_content)
+        if segmented and len(segmented[1]) > 1:
+            result = _solve_by_question(task_title, context_sections, segmented[0], segmented[1], progress)
+            result["prompt_version"] = f"{QUESTION_SEGMENTS_PROMPT.id},{ASSIGNMENT_PROMPT.id}"
+            read_section = {
+                "section": "ASSIGNMENT",
+                "tokens": assignment_tokens,
+                "allocated": MAX_ASSIGNMENT_READ_TOKENS,
+                "used": min(assignment_tokens, MAX_ASSIGNMENT_READ_TOKENS)
+            }
+            result["token_usage"] = token_report(
+                [read_section], QUESTION_CONTEXT_TOKENS, QUESTION_RESPONSE_TOKENS, result.pop("token_usage", None)
+            ) | {"questions": result.pop("question_stats")}
+            log_token_report("[Assignment Service]", result["token_usage"])
+            return result
+
+    # Solved in one request, so the assignment has to fit its share of the prompt
+    if assignment_tokens > MAX_ASSIGNMENT_TOKENS:
+        assignment_content = truncate_to_tokens(assignment_content, MAX_ASSIGNMENT_TOKENS) + "\n\n[Assignment truncated...]"
+    assignment_section = {
+        "section": "ASSIGNMENT",
+        "tokens": assignment_tokens,
+        "allocated": MAX_ASSIGNMENT_TOKENS,
+        "used": min(assignment_tokens, MAX_ASSIGNMENT_TOKENS)
+    }
+
+    if progress:
+        progress("Solving assignment")
+    context_text, section_tokens = pack_sections(
+        context_sections,
+        query=f"{task_title}\n{assignment_content}",
+        budget=min(MAX_CONTEXT_TOKENS, content_budget - assignment_section["used"])
+    )
+    context_text = context_text or "No additional study materials provided."
+
     # Generate solutions using appropriate method
     if assignment_images:
-        return _solve_with_vision(client, task_title, context_text, assignment_images)
+        result = _solve_with_vision(task_title, context_text, assignment_images)
+        result["prompt_version"] = ASSIGNMENT_VISION_PROMPT.id
     else:
-        return _solve_from_text(client, task_title, context_text, assignment_content)
-
-
-def _solve_from_text(client: OpenAI, task_title: str, context: str, assignment_text: str) -> dict:
-    """Generate solutions from text-based assignment."""
-
-    # Truncate if needed
-    max_context = 50000
-    max_assignment = 30000
-
-    if len(context) > max_context:
-        context = context[:max_context] + "\n\n[Context truncated...]"
-    if len(assignment_text) > max_assignment:
-        assignment_text = assignment_text[:max_assignment] + "\n\n[Assignment truncated...]"
-
-    prompt = f"""You are an expert tutor helping a student solve their homework assignment. The student has provided study notes and materials for context.
-
-TASK/SUBJECT: {task_title}
-
-=== STUDY CONTEXT (Notes and Materials) ===
-{context}
-
-=== ASSIGNMENT TO SOLVE ===
-{assignment_text}
-
-Your job is to:
-1. Identify each question/problem in the assignment
-2. For each question, provide a detailed approach to solving it using the study materials as reference
-3. Do NOT give direct answers - instead guide the student through the solution process
-
-Provide your response in the following JSON format:
-{{
-    "questions": [
-        {{
-            "question_number": "1" or "1a" or "Question 1",
-            "question_text": "The actual question text (summarize if very long)",
-            "approach": "A detailed explanation of how to approach this problem, referencing relevant concepts from the study materials",
-            "key_concepts": ["Concept 1 from notes", "Concept 2 needed", "Formula or theorem to use"],
-            "solution_steps": [
-                "Step 1: First, identify...",
-                "Step 2: Apply the concept of...",
-                "Step 3: Calculate/analyze...",
-                "Step 4: Verify your answer by..."
-            ],
-            "tips": "Helpful tips or common mistakes to avoid"
-        }}
-    ]
-}}
-
-IMPORTANT INSTRUCTIONS:
-1. Identify ALL questions in the assignment
-2. Reference specific concepts from the study materials when applicable
-3. Provide step-by-step guidance, not direct answers
-4. If a concept isn't in the notes, still explain it but note that additional study may be needed
-5. Be thorough - the goal is to help the student learn while completing their assignment
-6. For math problems, show the approach and formulas without calculating final numerical answers
-7. For essay questions, provide an outline and key points to cover"""
+        result = _solve_from_text(task_title, context_text, assignment_content)
+        result["prompt_version"] = ASSIGNMENT_PROMPT.id
+
+    model_route = result.pop("model_route", None)
+    result["token_usage"] = token_report(
+        section_tokens + [assignment_section],
+        content_budget,
+        model_route["max_tokens"] if model_route else SOLUTION_RESPONSE_TOKENS,
+        result.pop("token_usage", None),
+        model_route
+    )
+    log_token_report("[Assignment Service]", result["token_usage"])
+    return result
+
+
+def _find_marker(text: str, marker: str, start: int) -> int:
+    """Where a question's first words appear in text at or after start (-1 if they don't)."""
+    words = re.findall(r"\w+", marker)[:8]
+    if not words:
+        return -1
+    match = re.compile(r"\W*".join(re.escape(word) for word in words), re.IGNORECASE).search(text, start)
+    return match.start() if match else -1
+
+
+def segment_questions(assignment_text: str) -> tuple[str, list[tuple[str, str]]] | None:
+    """
+    Split an assignment into (instructions before the first question, [(label, question text)]).
+
+    The model only names where each question starts, so the split is cheap
+    and every question keeps its exact original text. Questions whose start
+    can't be found stay part of the question before them. None if the
+    assignment couldn't be segmented.
+    """
+    messages = QUESTION_SEGMENTS_PROMPT.messages(assignment=assignment_text)
+    segment_route = route_messages("question_segments", messages)
+    try:
+        response = chat_completion(
+            model=segment_route["model"],
+            messages=messages,
+            temperature=0,
+            max_tokens=segment_route["max_tokens"],
+            response_format={"type": "json_object"}
+        )
+    except Exception as e:
+        print(f"[Assignment Service] Question segmentation failed: {str(e)}")
+        return None
+
+    parsed, _ = parse_json_response(response.choices[0].message.content or "")
+    markers = parsed.get("questions") if isinstance(parsed, dict) else None
+    if not isinstance(markers, list):
+        print("[Assignment Service] Question segmentation gave no questions")
+        return None
+
+    starts = []
+    position = 0
+    for marker in markers:
+        if not isinstance(marker, dict):
+            continue
+        found = _find_marker(assignment_text, str(marker.get("starts_with", "")), position)
+        if found == -1:
+            continue
+        starts.append((found, str(marker.get("question_number", len(starts) + 1))))
+        position = found + 1
+
+    if not starts:
+        return None
+
+    preamble = assignment_text[:starts[0][0]].strip()
+    questions = []
+    for i, (start, label) in enumerate(starts):
+        end = starts[i + 1][0] if i + 1 < len(starts) else len(assignment_text)
+        questions.append((label, assignment_text[start:end].strip()))
+
+    print(f"[Assignment Service] Found {len(questions)} of {len(markers)} questions in the assignment")
+    return preamble, questions
+
+
+def _assignment_windows(text: str, max_tokens: int = MAX_ASSIGNMENT_TOKENS) -> list[str]:
+    """Consecutive pieces of an assignment of about max_tokens each, split between paragraphs."""
+    windows = []
+    current = ""
+    current_tokens = 0
+    for paragraph in re.split(r"(?<=\n)\s*\n", text):
+        tokens = count_tokens(paragraph)
+        if current and current_tokens + tokens > max_tokens:
+            windows.append(current)
+            current = ""
+            current_tokens = 0
+        current += paragraph + "\n"
+        current_tokens += tokens
+    if current.strip():
+        windows.append(current)
+    return windows
+
+
+def segment_assignment(assignment_text: str) -> tuple[str, list[tuple[str, str]]] | None:
+    """
+    segment_questions for an assignment of any length: windows of about
+    MAX_ASSIGNMENT_TOKENS are segmented in parallel and joined. Text before
+    a window's first question belongs to the last question of the windows
+    before it (a question split by the window edge), and so does a window
+    that couldn't be segmented. None if no questions were found.
+    """
+    windows = _assignment_windows(assignment_text)
+    if len(windows) <= 1:
+        return segment_questions(assignment_text)
+
+    print(f"[Assignment Service] Finding questions in {len(windows)} windows of the assignment")
+    with ThreadPoolExecutor(max_workers=max(1, ASSIGNMENT_SOLVE_WORKERS)) as pool:
+        segmented = list(pool.map(
+            lambda window: contextvars.copy_context().run(segment_questions, window), windows
+        ))
+
+    preamble = ""
+    questions: list[tuple[str, str]] = []
+    for window, result in zip(windows, segmented):
+        lead, found = result if result else (window.strip(), [])
+        if lead and questions:
+            label, text = questions[-1]
+            questions[-1] = (label, f"{text}\n\n{lead}")
+        elif lead:
+            preamble = f"{preamble}\n\n{lead}".strip()
+        questions.extend(found)
+
+    return (preamble, questions) if questions else None
+
+
+def _group_questions(questions: list[tuple[str, str]]) -> list[list[tuple[str, str]]]:
+    """Consecutive questions in groups of at most QUESTIONS_PER_REQUEST and about QUESTION_GROUP_TOKENS."""
+    groups = []
+    current = []
+    current_tokens = 0
+    for label, text in questions:
+        tokens = count_tokens(text)
+        if current and (len(current) >= QUESTIONS_PER_REQUEST or current_tokens + tokens > QUESTION_GROUP_TOKENS):
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append((label, text))
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _solve_group(task_title: str, context_sections: list, preamble: str, group: list[tuple[str, str]]) -> dict:
+    """Solve a few consecutive questions with the study material most relevant to them."""
+    group_text = "\n\n".join(text for _, text in group)
+    if count_tokens(group_text) > MAX_ASSIGNMENT_TOKENS:
+        group_text = truncate_to_tokens(group_text, MAX_ASSIGNMENT_TOKENS) + "\n\n[Question truncated...]"
+
+    context_text, _ = pack_sections(context_sections, query=f"{task_title}\n{group_text}", budget=QUESTION_CONTEXT_TOKENS)
+    context_text = context_text or "No additional study materials provided."
+
+    assignment_text = group_text
+    if preamble:
+        assignment_text = (
+            f"[General instructions for the whole assignment, for reference]\n{truncate_to_tokens(preamble, PREAMBLE_TOKENS)}\n\n"
+            f"[Questions to solve]\n{group_text}"
+        )
+    return _solve_from_text(task_title, context_text, assignment_text, QUESTION_RESPONSE_TOKENS * len(group))
+
+
+def _unsolved_question(label: str, text: str) -> dict:
+    return {
+        "question_number": label,
+        "question_text": text[:500],
+        "approach": "Guidance for this question could not be generated. Please try solving the assignment again.",
+        "key_concepts": [],
+        "solution_steps": [],
+        "tips": ""
+    }
+
+
+def _question_key(label) -> str:
+    """A question label compared loosely: "Question 2)", "Q2" and "2." are all "2"."""
+    key = str(label).strip().lower()
+    key = re.sub(r"^(question|q)\s*", "", key)
+    return re.sub(r"[\s.:)]+$", "", key)
 
+
+def _match_group_answers(group: list[tuple[str, str]], answers: list[dict]) -> tuple[list[dict], int]:
+    """
+    A group's answers in question order, with a placeholder for each question
+    the response left out (e.g. it was cut off), and how many were left out.
+    Answers that match none of the labels (sub-parts, say) are kept at the end.
+    """
+    keys = [_question_key(label) for label, _ in group]
+    by_key: dict[str, list[dict]] = {}
+    for answer in answers:
+        by_key.setdefault(_question_key(answer.get("question_number", "")), []).append(answer)
+    if not by_key.keys() & set(keys):
+        # Numbered differently from the assignment, so take them in order
+        by_key = {key: [answer] for key, answer in zip(keys, answers)}
+        by_key[""] = answers[len(keys):]
+
+    merged = []
+    missing = 0
+    for key, (label, text) in zip(keys, group):
+        matched = by_key.pop(key, None)
+        if matched:
+            merged.extend(matched)
+        else:
+            missing += 1
+            merged.append(_unsolved_question(label, text))
+    for extra in by_key.values():
+        merged.extend(extra)
+    return merged, missing
+
+
+def _solve_by_question(
+    task_title: str,
+    context_sections: list,
+    preamble: str,
+    questions: list[tuple[str, str]],
+    progress: Callable[[str], None] | None = None
+) -> dict:
+    """
+    Solve question groups in parallel and merge them in assignment order.
+
+    A group that fails is kept as placeholders for its questions, as is each
+    question a group's response left out, so the rest of the solution isn't
+    lost; the whole solve fails only if every group did. question_stats
+    counts the questions left as placeholders in "failed".
+    """
+    groups = _group_questions(questions)
+    print(f"[Assignment Service] Solving {len(questions)} questions in {len(groups)} parallel requests")
+
+    results = [None] * len(groups)
+    with ThreadPoolExecutor(max_workers=max(1, ASSIGNMENT_SOLVE_WORKERS)) as pool:
+        # Each group runs in a copy of this context, so the usage ledger knows what it's for
+        futures = {
+            pool.submit(contextvars.copy_context().run, _solve_group, task_title, context_sections, preamble, group): index
+            for index, group in enumerate(groups)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                results[index] = {"questions": [], "error": f"Failed to generate solutions: {str(e)}"}
+            if progress:
+                progress(f"Solved {done}/{len(groups)} question groups")
+
+    merged = []
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached_tokens": 0}
+    failed = 0
+    failed_requests = 0
+    for group, result in zip(groups, results):
+        result.pop("model_route", None)
+        for key in usage:
+            usage[key] += (result.get("token_usage") or {}).get(key) or 0
+        if result.get("error") or not result.get("questions"):
+            print(f"[Assignment Service] Question group {group[0][0]}-{group[-1][0]} failed: {result.get('error')}")
+            failed += len(group)
+            failed_requests += 1
+            merged.extend(_unsolved_question(label, text) for label, text in group)
+        else:
+            answers, missing = _match_group_answers(group, result["questions"])
+            if missing:
+                print(f"[Assignment Service] Question group {group[0][0]}-{group[-1][0]} left out {missing} questions")
+            failed += missing
+            merged.extend(answers)
+
+    stats = {"questions": len(questions), "requests": len(groups), "failed": failed, "failed_requests": failed_requests}
+    if failed_requests == len(groups):
+        return {"questions": [], "error": results[0].get("error") or "Failed to generate solutions", "question_stats": stats}
+    return {"questions": merged, "error": None, "token_usage": usage, "question_stats": stats}
+
+
+def _solve_from_text(
+    task_title: str,
+    context: str,
+    assignment_text: str,
+    response_tokens: int | None = None
+) -> dict:
+    """
+    Generate solutions from text-based assignment.
+
+    The model and response budget are routed by prompt size; response_tokens
+    overrides the budget (question groups size it by their question count).
+    """
+    messages = ASSIGNMENT_PROMPT.messages(task_title=task_title, context=context, assignment=assignment_text)
+    model_route = route_messages("assignment", messages)
+    if response_tokens:
+        model_route["max_tokens"] = response_tokens
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert academic tutor. Your goal is to guide students to solutions rather than giving direct answers. Reference their study materials when possible and help them understand the concepts needed to solve each problem."
-                },
-                {"role": "user", "content": prompt}
-            ],
+        response = chat_completion(
+            model=model_route["model"],
+            messages=messages,
             temperature=0.3,
-            max_tokens=4000
+            max_tokens=model_route["max_tokens"]
         )
 
         response_content = response.choices[0].message.content
         print(f"[Assignment Service] Response received: {len(response_content)} chars")
-        return _parse_solution_response(response_content)
+        result = _parse_solution_response(response_content)
+        result["token_usage"] = response_usage(response)
+        result["model_route"] = model_route
+        return result
 
     except Exception as e:
         print(f"[Assignment Service] Error: {str(e)}")
         return {"questions": [], "error": f"Failed to generate solutions: {str(e)}"}
 
 
-def _solve_with_vision(client: OpenAI, task_title: str, context: str, assignment_images: list) -> dict:
+def _solve_with_vision(task_title: str, context: str, assignment_images: list) -> dict:
     """Generate solutions from image-based assignment using vision."""
-
-    # Truncate context if needed
-    max_context = 50000
-    if len(context) > max_context:
-        context = context[:max_context] + "\n\n[Context truncated...]"
-
-    message_content = []
-
-    text_prompt = f"""You are an expert tutor helping a student solve their homework assignment. The student has provided study notes and materials for context.
-
-TASK/SUBJECT: {task_title}
-
-=== STUDY CONTEXT (Notes and Materials) ===
-{context}
-
-=== ASSIGNMENT ===
-I'm providing an image of the assignment. Please analyze it carefully and identify all questions/problems.
-
-Your job is to:
-1. Identify each question/problem in the assignment image
-2. For each question, provide a detailed approach to solving it using the study materials as reference
-3. Do NOT give direct answers - instead guide the student through the solution process
-
-Provide your response in the following JSON format:
-{{
-    "questions": [
-        {{
-            "question_number": "1" or "1a" or "Question 1",
-            "question_text": "The actual question text as shown in the image",
-            "approach": "A detailed explanation of how to approach this problem, referencing relevant concepts from the study materials",
-            "key_concepts": ["Concept 1 from notes", "Concept 2 needed", "Formula or theorem to use"],
-            "solution_steps": [
-                "Step 1: First, identify...",
-                "Step 2: Apply the concept of...",
-                "Step 3: Calculate/analyze...",
-                "Step 4: Verify your answer by..."
-            ],
-            "tips": "Helpful tips or common mistakes to avoid"
-        }}
-    ]
-}}
-
-IMPORTANT: Read the assignment image carefully and identify ALL questions. Reference concepts from the study materials when applicable."""
-
-    message_content.append({"type": "text", "text": text_prompt})
-
-    # Add assignment images
-    for img in assignment_images:
-        message_content.append({
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:{img['media_type']};base64,{img['base64']}",
-                "detail": "high"
-            }
-        })
-
+    text_tokens, _ = message_tokens(ASSIGNMENT_VISION_PROMPT.messages(task_title=task_title, context=context))
+    model_route = route(
+        "assignment_vision", text_tokens + IMAGE_TOKENS["high"] * len(assignment_images), images=len(assignment_images)
+    )
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert academic tutor who helps students understand and solve their assignments. You guide them through the problem-solving process without giving direct answers."
-                },
-                {"role": "user", "content": message_content}
-            ],
+        response = chat_completion(
+            model=model_route["model"],
+            messages=ASSIGNMENT_VISION_PROMPT.messages(
+                images=assignment_images, detail=model_route["detail"], task_title=task_title, context=context
+            ),
             temperature=0.3,
-            max_tokens=4000
+            max_tokens=model_route["max_tokens"]
         )
 
         response_content = response.choices[0].message.content
-        return _parse_solution_response(response_content)
+        result = _parse_solution_response(response_content)
+        result["token_usage"] = response_usage(response)
+        result["model_route"] = model_route
+        return result
 
     except Exception as e:
         return {"questions": [], "error": f"Failed to generate solutions: {str(e)}"}
 
 
 def _parse_solution_response(content: str) -> dict:
-    """Parse JSON response from OpenAI."""
-    try:
-        # Extract JSON from potential markdown wrapping
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            parts = content.split("```")
-            if len(parts) >= 2:
-                content = parts[1]
-
-        result = json.loads(content.strip())
-        return {
-            "questions": result.get("questions", []),
-            "error": None
-        }
-    except json.JSONDecodeError as e:
-        print(f"[Assignment Service] JSON parse error: {str(e)}")
+    """Parse JSON response from OpenAI, keeping the finished questions of a truncated one."""
+    result, complete = parse_json_response(content)
+    questions = result.get("questions") if isinstance(result, dict) else None
+    if not isinstance(questions, list) or (not complete and not questions):
+        print("[Assignment Service] JSON parse error: no questions in response")
         print(f"[Assignment Service] Raw content: {content[:500]}...")
         return {
             "questions": [],
             "error": "Failed to parse AI response. Please try again."
         }
+
+    if not complete:
+        print(f"[Assignment Service] Response was cut off, kept {len(questions)} complete questions")
+    return {
+        "questions": [q for q in questions if isinstance(q, dict)],
+        "error": None
+    }
@@ -0,0 +1,180 @@
+import math
+import re
+from collections import Counter
+from collections.abc import Callable
+
+# Chunks are at most this many characters
+MAX_CHUNK_LENGTH = 1500
+
+# How much more text than the prompt budget to read as ranking candidates
+CANDIDATE_MULTIPLIER = 4
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+PAGE_MARKER = re.compile(r"^--- Page \d+ ---$")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "how", "in",
+    "is", "it", "its", "of", "on", "or", "that", "the", "this", "to", "was", "were", "what",
+    "when", "which", "with", "you", "your", "do", "does", "not", "can", "will", "using", "use"
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase word tokens without stopwords, for ranking."""
+    return [t for t in re.findall(r"\w{2,}", text.lower()) if t not in STOPWORDS]
+
+
+def _split_long_block(block: str, max_length: int) -> list[str]:
+    """Split a block on line boundaries (or hard-wrap) into pieces of at most max_length."""
+    pieces = []
+    current = ""
+    for line in block.split("\n"):
+        while len(line) > max_length:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:max_length])
+            line = line[max_length:]
+        if current and len(current) + 1 + len(line) > max_length:
+            pieces.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(text: str, max_length: int = MAX_CHUNK_LENGTH) -> list[str]:
+    """
+    Split text into chunks of at most about max_length characters.
+
+    Paragraphs (blank-line separated) are kept together where they fit.
+    PDF page markers ("--- Page N ---") are repeated on every chunk from
+    that page so the model still knows where the text came from.
+    """
+    chunks = []
+    page_marker = None
+
+    for block in re.split(r"\n\s*\n", text):
+        block = block.strip()
+        if not block:
+            continue
+
+        first_line, _, rest = block.partition("\n")
+        if PAGE_MARKER.match(first_line):
+            page_marker = first_line
+            block = rest.strip()
+            if not block:
+                continue
+
+        for piece in _split_long_block(block, max_length):
+            chunks.append(f"{page_marker}\n{piece}" if page_marker else piece)
+
+    return chunks
+
+
+def bm25_scores(query: str, documents: list[str]) -> list[float]:
+    """Score each document against the query with Okapi BM25."""
+    query_terms = set(tokenize(query))
+    if not query_terms or not documents:
+        return [0.0] * len(documents)
+
+    doc_terms = [Counter(tokenize(doc)) for doc in documents]
+    doc_lengths = [sum(terms.values()) for terms in doc_terms]
+    avg_length = (sum(doc_lengths) / len(doc_lengths)) or 1.0
+
+    doc_freq = Counter()
+    for terms in doc_terms:
+        doc_freq.update(query_terms & terms.keys())
+
+    n = len(documents)
+    scores = []
+    for terms, length in zip(doc_terms, doc_lengths):
+        score = 0.0
+        for term in query_terms:
+            tf = terms.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+        scores.append(score)
+    return scores
+
+
+def _render(sections: list[tuple[str, list[tuple[int, str]]]]) -> str:
+    parts = []
+    for header, chunks in sections:
+        body = []
+        previous = None
+        for index, chunk in chunks:
+            if previous is not None and index != previous + 1:
+                body.append("[...]")
+            body.append(chunk)
+            previous = index
+        parts.append(f"{header}\n" + "\n\n".join(body))
+    return "\n\n".join(parts)
+
+
+def build_context(
+    sections: list[tuple[str, str]],
+    query: str,
+    budget: int,
+    measure: Callable[[str], int] = len
+) -> str:
+    """
+    Assemble prompt context from (header, text) sections within a budget.
+
+    If everything fits it is returned unchanged. Otherwise every section is
+    chunked, chunks are ranked against the query with BM25, and the best
+    chunks are packed into the budget (the first chunk of each section is
+    always kept, for coverage). Chosen chunks are put back in document
+    order, with "[...]" marking gaps.
+    """
+    sections = [(header, text) for header, text in sections if text and text.strip()]
+    full = "\n\n".join(f"{header}\n{text}" for header, text in sections)
+    full_size = measure(full)
+    if full_size <= budget:
+        return full
+
+    # (section index, chunk index, text)
+    chunks = [
+        (s, c, chunk)
+        for s, (_, text) in enumerate(sections)
+        for c, chunk in enumerate(chunk_text(text))
+    ]
+    scores = bm25_scores(query, [chunk for _, _, chunk in chunks])
+
+    # Headers are always sent; count every chunk as if a gap marker follows it
+    separator_size = measure("\n\n[...]\n\n")
+    used = sum(measure(header) + separator_size for header, _ in sections)
+    leading = [i for i, (_, c, _) in enumerate(chunks) if c == 0]
+    leading_set = set(leading)
+    ranked = sorted(
+        (i for i in range(len(chunks)) if i not in leading_set),
+        key=lambda i: (-scores[i], i)
+    )
+
+    selected = set()
+    for i in leading + ranked:
+        size = measure(chunks[i][2]) + separator_size
+        if used + size > budget:
+            continue
+        selected.add(i)
+        used += size
+
+    rendered_sections = []
+    for s, (header, _) in enumerate(sections):
+        picked = [(c, chunk) for i, (cs, c, chunk) in enumerate(chunks) if cs == s and i in selected]
+        if picked:
+            rendered_sections.append((header, picked))
+
+    context = _render(rendered_sections)
+    print(
+        f"[Context Builder] Packed {len(selected)}/{len(chunks)} chunks: "
+        f"{measure(context)} of {full_size} (budget {budget})"
+    )
+    return context
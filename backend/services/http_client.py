@@ -0,0 +1,50 @@
+"""
+Process-wide HTTP sessions for calls that don't go through the OpenAI client.
+
+Each named session (e.g. "perplexity", "url_check") keeps a pool of
+keep-alive connections per host, so repeated calls to the same host reuse
+a connection instead of a new TCP and TLS handshake each time. Pool sizes
+and the connect timeout come from config; read timeouts are set per call.
+Sessions don't keep cookies, since they're shared by every request.
+"""
+import threading
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+from config import HTTP_POOL_HOSTS, HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT
+
+_sessions: dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def _new_session() -> requests.Session:
+    session = requests.Session()
+    # Retries are done by the caller (the rate limiter, or not at all for URL checks)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+def get_session(name: str) -> requests.Session:
+    """The shared session with the given name, created on first use."""
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = _sessions[name] = _new_session()
+            print(f"[HTTP Client] Created {name} session ({HTTP_POOL_HOSTS} hosts, {HTTP_POOL_SIZE} connections per host)")
+        return session
+
+
+def request_timeout(read_timeout: float) -> tuple[float, float]:
+    """(connect, read) timeout for a call, never letting the connect part exceed the whole."""
+    return min(HTTP_CONNECT_TIMEOUT, read_timeout), read_timeout
+
+
+def close_http_sessions():
+    """Close every session's connections (on shutdown)."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,119 @@
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from models.job import Job
+from models.task_attachment import TaskAttachment
+from config import UPLOAD_DIR
+from services.job_queue import enqueue_job, register_job_failure_handler, register_job_handler, update_job_progress
+from services.pdf_service import get_attachment_pages, PDF_SUPPORT
+from services.ai_service import write_image_derivative
+from services.search_service import index_attachment
+from services.tokenizer import count_tokens
+
+
+INGEST_JOB_KIND = "ingest_attachment"
+
+
+def queue_attachment_ingestion(db: Session, attachment: TaskAttachment, user_id: int | None = None) -> Job:
+    """Mark an attachment as pending and queue its preprocessing."""
+    attachment.ingestion_status = "pending"
+    db.commit()
+
+    return enqueue_job(
+        db,
+        INGEST_JOB_KIND,
+        task_id=attachment.task_id,
+        user_id=user_id,
+        attachment_id=attachment.id
+    )
+
+
+def _set_status(db: Session, attachment: TaskAttachment, status: str):
+    attachment.ingestion_status = status
+    db.commit()
+
+
+@register_job_handler(INGEST_JOB_KIND)
+def ingest_attachment(job: dict) -> dict:
+    """
+    Do all expensive preprocessing for a new attachment ahead of AI calls.
+
+    PDFs: extract and store every page (in the extraction process pool),
+    count characters/tokens and add the text to the search index.
+    Images: precompute the base64 encoding used by the vision API.
+    """
+    db: Session = SessionLocal()
+    try:
+        attachment = db.query(TaskAttachment).filter(
+            TaskAttachment.id == job["attachment_id"]
+        ).first()
+
+        if not attachment:
+            return {"skipped": "Attachment no longer exists"}
+
+        _set_status(db, attachment, "processing")
+        file_path = UPLOAD_DIR / str(attachment.task_id) / attachment.stored_filename
+
+        try:
+            if not file_path.exists():
+                raise FileNotFoundError(f"File not found: {file_path}")
+
+            result = {"page_count": None, "char_count": None, "token_count": None}
+
+            if attachment.content_type == "application/pdf" and PDF_SUPPORT:
+                update_job_progress(job["id"], "Extracting PDF text")
+                pages = get_attachment_pages(attachment.id, file_path)
+                result["page_count"] = len(pages)
+                result["char_count"] = sum(len(text) for text in pages)
+                result["token_count"] = sum(count_tokens(text) for text in pages)
+
+                update_job_progress(job["id"], "Indexing text for search")
+                index_attachment(db, attachment, pages)
+                db.commit()
+
+            elif attachment.content_type.startswith("image/"):
+                update_job_progress(job["id"], "Encoding image")
+                write_image_derivative(file_path)
+
+            _set_status(db, attachment, "ready")
+            print(f"[Ingestion] Attachment {attachment.id} ready: {result}")
+            return result
+
+        except Exception:
+            # Pending while the queue retries it; ingestion_failed marks it failed once it gives up
+            _set_status(db, attachment, "pending")
+            raise
+    finally:
+        db.close()
+
+
+@register_job_failure_handler(INGEST_JOB_KIND)
+def ingestion_failed(job: dict):
+    """Mark the attachment failed once its ingest job has no attempts left, even if its worker died mid-job."""
+    db: Session = SessionLocal()
+    try:
+        attachment = db.query(TaskAttachment).filter(TaskAttachment.id == job["attachment_id"]).first()
+        if attachment:
+            _set_status(db, attachment, "failed")
+            print(f"[Ingestion] Attachment {attachment.id} failed")
+    finally:
+        db.close()
+
+
+def get_attachment_status(db: Session, attachment: TaskAttachment) -> dict:
+    """Ingestion status of an attachment, with details from its latest job."""
+    job = db.query(Job).filter(
+        Job.kind == INGEST_JOB_KIND,
+        Job.attachment_id == attachment.id
+    ).order_by(Job.created_at.desc()).first()
+
+    result = (job.result or {}) if job else {}
+
+    return {
+        "attachment_id": attachment.id,
+        "status": attachment.ingestion_status,
+        "page_count": result.get("page_count"),
+        "char_count": result.get("char_count"),
+        "token_count": result.get("token_count"),
+        "error": job.error if job and attachment.ingestion_status != "ready" else None,
+        "updated_at": (job.finished_at or job.started_at or job.created_at) if job else None
+    }
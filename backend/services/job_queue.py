@@ -0,0 +1,292 @@
+import threading
+import uuid
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from models.job import Job
+from config import JOB_WORKERS, JOB_POLL_INTERVAL, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+
+
+class JobFailedError(Exception):
+    """Raised by a handler for failures that retrying won't fix; the job fails right away."""
+
+
+# Job kind -> handler(job: dict) -> result dict
+# Handlers are registered by the services that own the work.
+JOB_HANDLERS: dict[str, Callable[[dict], dict | None]] = {}
+
+
+def register_job_handler(kind: str):
+    """Decorator registering a function as the handler for a job kind."""
+    def decorator(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+# Job kind -> on_failed(job: dict), called once the queue gives up on a job of
+# that kind: its handler failed on the last attempt (or for good), or its
+# worker stopped responding on every attempt
+JOB_FAILURE_HANDLERS: dict[str, Callable[[dict], None]] = {}
+
+
+def register_job_failure_handler(kind: str):
+    """Decorator registering a function to call when a job of a kind has failed for good."""
+    def decorator(fn):
+        JOB_FAILURE_HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def _job_data(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "priority": job.priority,
+        "task_id": job.task_id,
+        "user_id": job.user_id,
+        "attachment_id": job.attachment_id,
+        "payload": job.payload or {},
+        "attempts": job.attempts
+    }
+
+
+def _job_failed(job_data: dict):
+    on_failed = JOB_FAILURE_HANDLERS.get(job_data["kind"])
+    if on_failed is None:
+        return
+    try:
+        on_failed(job_data)
+    except Exception as e:
+        print(f"[Job Queue] Failure handler for {job_data['kind']} job {job_data['id']} failed: {str(e)}")
+
+
+# Set whenever a job is enqueued in this process, so idle workers wake up
+_wakeup = threading.Event()
+
+
+def enqueue_job(
+    db: Session,
+    kind: str,
+    task_id: int | None = None,
+    user_id: int | None = None,
+    attachment_id: int | None = None,
+    payload: dict | None = None,
+    priority: int = 0
+) -> Job:
+    """Add a job to the queue and commit it."""
+    job = Job(
+        id=str(uuid.uuid4()),
+        kind=kind,
+        status="pending",
+        priority=priority,
+        task_id=task_id,
+        user_id=user_id,
+        attachment_id=attachment_id,
+        payload=payload or {},
+        attempts=0
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    _wakeup.set()
+    print(f"[Job Queue] Enqueued {kind} job {job.id}")
+    return job
+
+
+def _claim_next_job(db: Session) -> Job | None:
+    """
+    Atomically claim the next runnable job.
+
+    Picks the highest-priority pending job, or a running job whose lease
+    expired (its worker died) and that has attempts left; expired jobs
+    without attempts left are failed instead, so a job that keeps crashing
+    its worker isn't retried forever. The conditional UPDATE makes the
+    claim safe across threads and processes sharing the database.
+    """
+    now = datetime.utcnow()
+    expired = and_(Job.status == "running", Job.lease_expires_at < now)
+
+    exhausted = [_job_data(job) for job in db.query(Job).filter(expired, Job.attempts >= JOB_MAX_ATTEMPTS).all()]
+    for job_data in exhausted:
+        failed = db.query(Job).filter(Job.id == job_data["id"], expired, Job.attempts == job_data["attempts"]).update({
+            Job.status: "failed",
+            Job.error: f"Worker stopped responding on each of {JOB_MAX_ATTEMPTS} attempts",
+            Job.lease_expires_at: None,
+            Job.finished_at: now
+        }, synchronize_session=False)
+        db.commit()
+        if failed:
+            # Another worker may have failed it first; only one calls the failure handler
+            print(f"[Job Queue] {job_data['kind']} job {job_data['id']} failed: its worker stopped responding too many times")
+            _job_failed(job_data)
+
+    runnable = or_(
+        Job.status == "pending",
+        and_(expired, Job.attempts < JOB_MAX_ATTEMPTS)
+    )
+
+    candidates = db.query(Job.id).filter(
+        runnable,
+        Job.kind.in_(list(JOB_HANDLERS))
+    ).order_by(Job.priority.desc(), Job.created_at).limit(5).all()
+
+    for (job_id,) in candidates:
+        claimed = db.query(Job).filter(Job.id == job_id, runnable).update({
+            Job.status: "running",
+            Job.attempts: Job.attempts + 1,
+            Job.started_at: now,
+            Job.lease_expires_at: now + timedelta(seconds=JOB_LEASE_SECONDS)
+        }, synchronize_session=False)
+        db.commit()
+
+        if claimed:
+            return db.query(Job).filter(Job.id == job_id).first()
+
+    return None
+
+
+def update_job_progress(job_id: str, progress: str):
+    """Record a progress message for a running job (which also renews its lease)."""
+    db: Session = SessionLocal()
+    try:
+        db.query(Job).filter(Job.id == job_id, Job.status == "running").update({
+            Job.progress: progress,
+            Job.lease_expires_at: datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+        }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _renew_lease(job_id: str, attempt: int) -> bool:
+    """Extend the lease of a job this worker still holds. False if it was reclaimed or finished."""
+    db: Session = SessionLocal()
+    try:
+        renewed = db.query(Job).filter(
+            Job.id == job_id, Job.status == "running", Job.attempts == attempt
+        ).update({
+            Job.lease_expires_at: datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+        }, synchronize_session=False)
+        db.commit()
+        return bool(renewed)
+    finally:
+        db.close()
+
+
+def _heartbeat(job_id: str, attempt: int, done: threading.Event):
+    """Keep renewing a running job's lease, so long jobs aren't reclaimed and run twice."""
+    while not done.wait(JOB_LEASE_SECONDS / 3):
+        try:
+            if not _renew_lease(job_id, attempt):
+                return
+        except Exception as e:
+            print(f"[Job Queue] Could not renew lease of job {job_id}: {str(e)}")
+
+
+def _finish_job(job_id: str, attempt: int, status: str, result: dict | None = None, error: str | None = None) -> bool:
+    db: Session = SessionLocal()
+    try:
+        # Only the worker holding the current attempt may record the outcome
+        finished = db.query(Job).filter(
+            Job.id == job_id, Job.status == "running", Job.attempts == attempt
+        ).update({
+            Job.status: status,
+            Job.result: result,
+            Job.error: error,
+            Job.lease_expires_at: None,
+            Job.finished_at: datetime.utcnow() if status in ("done", "failed") else None
+        }, synchronize_session=False)
+        db.commit()
+        if not finished:
+            print(f"[Job Queue] Job {job_id} was reclaimed by another worker, discarding attempt {attempt}")
+        return bool(finished)
+    finally:
+        db.close()
+
+
+def run_next_job() -> bool:
+    """Claim and run one job. Returns False if the queue had nothing to run."""
+    db: Session = SessionLocal()
+    try:
+        job = _claim_next_job(db)
+        if job is None:
+            return False
+        job_data = _job_data(job)
+    finally:
+        db.close()
+
+    handler = JOB_HANDLERS[job_data["kind"]]
+    print(f"[Job Queue] Running {job_data['kind']} job {job_data['id']} (attempt {job_data['attempts']})")
+
+    attempt = job_data["attempts"]
+    done = threading.Event()
+    threading.Thread(
+        target=_heartbeat, args=(job_data["id"], attempt, done), name=f"job-heartbeat-{job_data['id'][:8]}", daemon=True
+    ).start()
+
+    try:
+        result = handler(job_data)
+        _finish_job(job_data["id"], attempt, "done", result=result)
+        print(f"[Job Queue] Finished {job_data['kind']} job {job_data['id']}")
+    except Exception as e:
+        if attempt < JOB_MAX_ATTEMPTS and not isinstance(e, JobFailedError):
+            _finish_job(job_data["id"], attempt, "pending", error=str(e))
+            print(f"[Job Queue] {job_data['kind']} job {job_data['id']} failed, will retry: {str(e)}")
+        else:
+            print(f"[Job Queue] {job_data['kind']} job {job_data['id']} failed: {str(e)}")
+            if _finish_job(job_data["id"], attempt, "failed", error=str(e)):
+                _job_failed(job_data)
+    finally:
+        done.set()
+
+    return True
+
+
+# Worker threads for this process
+_workers: list[threading.Thread] = []
+_stop = threading.Event()
+
+
+def _worker_loop():
+    while not _stop.is_set():
+        try:
+            ran = run_next_job()
+        except Exception as e:
+            print(f"[Job Queue] Worker error: {str(e)}")
+            ran = False
+
+        if not ran:
+            _wakeup.wait(JOB_POLL_INTERVAL)
+            _wakeup.clear()
+
+
+def start_job_workers(count: int = JOB_WORKERS):
+    """Start background worker threads that drain the job queue."""
+    if _workers:
+        print("[Job Queue] Workers already running")
+        return
+
+    _stop.clear()
+    for i in range(count):
+        thread = threading.Thread(target=_worker_loop, name=f"job-worker-{i}", daemon=True)
+        thread.start()
+        _workers.append(thread)
+
+    print(f"[Job Queue] Started {count} workers")
+
+
+def stop_job_workers():
+    """Stop the worker threads, letting running jobs finish."""
+    if not _workers:
+        return
+
+    _stop.set()
+    _wakeup.set()
+    for thread in _workers:
+        thread.join(timeout=5)
+    _workers.clear()
+    print("[Job Queue] Workers stopped")
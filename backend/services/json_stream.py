@@ -0,0 +1,218 @@
+import json
+import re
+
+# The body of a Markdown code block (```json ... ```), closed or cut off
+_FENCED_BLOCK = re.compile(r"```[\w-]*[ \t]*\n(.*?)(?:\n[ \t]*```|$)", re.DOTALL)
+
+# Sentinel for an element that couldn't be parsed
+_INVALID = object()
+
+
+class _Frame:
+    """An object or array the parser is inside of."""
+
+    def __init__(self, kind: str, path: tuple, parse_items: bool, start: int):
+        self.kind = kind  # "{" or "["
+        self.path = path
+        self.parse_items = parse_items
+        self.item_start = start
+        self.index = 0
+        self.open_key = None  # Key of the object member being written
+        self.items: list[tuple[object, object]] = []  # Completed (key or index, value) pairs
+
+
+class JsonStream:
+    """
+    Incremental parser for a JSON object or array that arrives in pieces (a
+    streamed, or possibly truncated, model response).
+
+    feed() returns the (path, value) pairs completed by that piece: top-level
+    members or elements, and the elements of the collections directly inside
+    them (up to item_depth levels), e.g. (("summary",), "...") or
+    (("questions", 2), {...}). Each one can be used as soon as the model has
+    finished writing it. Anything before the opening bracket (such as a
+    ```json fence or a sentence of preamble) and after the closing one is
+    ignored. A bracket in that preamble ("[see below]", "{note}") parses to
+    an empty or scalar-only value, so scanning goes on: the next root that
+    holds any objects or arrays replaces it.
+
+    result() gives the whole value - if the text stopped early, everything
+    that was complete by then: finished members and array items, never a
+    half-written object.
+    """
+
+    def __init__(self, root: str = "{", item_depth: int = 2):
+        self.root = root
+        self.item_depth = item_depth
+        self.text = ""
+        self._pos = 0
+        self._stack: list[_Frame] = []
+        self._in_string = False
+        self._escaped = False
+        self._value = None
+
+    def feed(self, chunk: str) -> list[tuple[tuple, object]]:
+        self.text += chunk
+        completed = []
+
+        while self._pos < len(self.text) and _rank(self._value) < 2:
+            char = self.text[self._pos]
+
+            if not self._stack:
+                if char == self.root:
+                    self._open(char)
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._open(char)
+            elif char in "}]":
+                frame = self._stack.pop()
+                completed.extend(self._close_item(frame))
+                if not self._stack:
+                    value = self._container(frame)
+                    if self._value is None or _rank(value) > _rank(self._value):
+                        self._value = value
+            elif char == ",":
+                frame = self._stack[-1]
+                completed.extend(self._close_item(frame))
+                frame.item_start = self._pos + 1
+
+            self._pos += 1
+
+        return completed
+
+    @property
+    def finished(self) -> bool:
+        """Whether result() is a root that was closed, not the partial one still being written."""
+        return self._value is not None and not (self._stack and self._partial())
+
+    def result(self):
+        """The parsed value; for unfinished text, the members and elements completed so far (None if none)."""
+        if not self._stack:
+            return self._value
+        partial = self._partial()
+        # A later root that has nothing yet doesn't replace the one before it
+        return partial if partial or self._value is None else self._value
+
+    def _partial(self):
+        # Fold each open collection into its parent, innermost first
+        value = None
+        for frame in reversed(self._stack):
+            if not frame.parse_items:
+                continue
+            container = self._container(frame)
+            if value is not None:
+                # The partial collection being written
+                if frame.kind == "[":
+                    container.append(value)
+                elif frame.open_key is not None:
+                    container[frame.open_key] = value
+            else:
+                # A last item that was finished but not yet followed by , or a closing bracket
+                key, pending = self._parse_item(frame, self.text[frame.item_start:].strip())
+                if pending is not _INVALID:
+                    if frame.kind == "[":
+                        container.append(pending)
+                    else:
+                        container[key] = pending
+            # A partial object would be missing fields, so only the root and arrays are kept
+            value = container if frame.kind == "[" or frame is self._stack[0] else None
+        return value
+
+    def _open(self, char: str):
+        parent = self._stack[-1] if self._stack else None
+        if parent is None:
+            path = ()
+        elif parent.kind == "{":
+            parent.open_key = self._member_key(parent)
+            path = parent.path + (parent.open_key,)
+        else:
+            path = parent.path + (parent.index,)
+
+        parse_items = len(self._stack) < self.item_depth
+        self._stack.append(_Frame(char, path, parse_items, self._pos + 1))
+
+    def _member_key(self, frame: _Frame):
+        key_text = self.text[frame.item_start:self._pos].strip().rstrip(":").strip()
+        try:
+            return json.loads(key_text)
+        except json.JSONDecodeError:
+            return None
+
+    def _close_item(self, frame: _Frame) -> list[tuple[tuple, object]]:
+        """Parse the element or member that ends at the current position."""
+        item = self.text[frame.item_start:self._pos].strip()
+        frame.open_key = None
+        if not item or not frame.parse_items:
+            return []
+
+        key, value = self._parse_item(frame, item)
+        if frame.kind == "[":
+            frame.index += 1
+        if value is _INVALID:
+            print(f"[JSON Stream] Skipping unparseable item: {item[:80]}")
+            return []
+
+        frame.items.append((key, value))
+        return [(frame.path + (key,), value)]
+
+    @staticmethod
+    def _parse_item(frame: _Frame, item: str) -> tuple[object, object]:
+        try:
+            if frame.kind == "{":
+                members = json.loads("{" + item + "}")
+                if len(members) != 1:
+                    return None, _INVALID
+                return next(iter(members.items()))
+            return frame.index, json.loads(item)
+        except json.JSONDecodeError:
+            return None, _INVALID
+
+    @staticmethod
+    def _container(frame: _Frame):
+        if frame.kind == "{":
+            return {key: value for key, value in frame.items}
+        return [value for _, value in frame.items]
+
+
+def _rank(value) -> int:
+    """0 for nothing or an empty collection, 1 for one of scalars only, 2 if it holds objects or arrays."""
+    if not value:
+        return 0
+    items = value.values() if isinstance(value, dict) else value
+    return 2 if any(isinstance(item, (dict, list)) for item in items) else 1
+
+
+def parse_json_response(content: str, root: str = "{") -> tuple[object, bool]:
+    r"""
+    Parse a model's JSON response, with or without markdown fences or text
+    around it. The first fenced block is parsed on its own if it has the
+    root bracket, so brackets in the sentence before it don't count.
+
+    Returns (value, complete). A truncated or partly malformed response
+    gives whatever members and items were well formed, with complete=False;
+    value is None if there was nothing usable.
+
+    >>> parse_json_response('Answers [see below]:\n```json\n[{"q": 1}]\n```', root="[")
+    ([{'q': 1}], True)
+    >>> parse_json_response('Sources [1] follow. [{"title": "A"}]', root="[")
+    ([{'title': 'A'}], True)
+    >>> parse_json_response('A {note} first.\n```\n{"points": ["a", "b"]}\n```')
+    ({'points': ['a', 'b']}, True)
+    >>> parse_json_response('{"questions": [{"n": 1}, {"n": 2}, {"n"')
+    ({'questions': [{'n': 1}, {'n': 2}]}, False)
+    """
+    fenced = _FENCED_BLOCK.search(content)
+    if fenced and root in fenced.group(1):
+        content = fenced.group(1)
+
+    parser = JsonStream(root=root)
+    parser.feed(content)
+    return parser.result(), parser.finished
@@ -0,0 +1,309 @@
+"""
+Process-wide OpenAI client.
+
+One client (and one HTTP connection pool) is shared by every AI call in the
+process, so connections are kept alive and reused (over HTTP/2 when the h2
+package is installed) instead of a new TLS handshake per request. Calls go
+through a concurrency cap; callers beyond it wait in line for up to
+LLM_QUEUE_TIMEOUT seconds before failing with LLMBusyError. Requests also
+go through the cross-worker rate limiter, which does the retrying (the
+SDK's own retries are off so they can't bypass it).
+"""
+import json
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+import httpx
+import openai
+from openai import OpenAI
+from config import (
+    OPENAI_API_KEY, OPENAI_BASE_URL, LLM_TIMEOUT, LLM_CONNECT_TIMEOUT, LLM_MAX_CONNECTIONS,
+    LLM_KEEPALIVE_SECONDS, LLM_HTTP2, LLM_MAX_CONCURRENCY, LLM_QUEUE_TIMEOUT, AI_RECORD_FILE
+)
+from services.rate_limiter import RETRY_STATUSES, call_with_retries, parse_retry_after
+from services.model_router import message_tokens
+from services.token_budget import response_usage
+from services.usage_ledger import current_usage_context, record_call
+
+try:
+    import h2  # noqa: F401 - required by httpx for HTTP/2
+    HTTP2_SUPPORT = True
+except ImportError:
+    HTTP2_SUPPORT = False
+
+
+class LLMBusyError(Exception):
+    """Raised when no concurrency slot frees up within LLM_QUEUE_TIMEOUT."""
+
+
+_client: OpenAI | None = None
+_client_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+_record_lock = threading.Lock()
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    "requests": 0,
+    "new_connections": 0,
+    "http_versions": {},
+    "in_flight": 0,
+    "waiting": 0,
+    "queue_timeouts": 0,
+    "queue_wait_seconds_total": 0.0,
+    "queue_wait_seconds_max": 0.0,
+    "calls": 0,
+    "errors": 0,
+    "prompt_tokens": 0,
+    "cached_prompt_tokens": 0
+}
+
+
+class _MeteredTransport(httpx.HTTPTransport):
+    """HTTP transport that records whether each request opened a new connection."""
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        connected = []
+        previous_trace = request.extensions.get("trace")
+
+        def trace(event: str, info: dict):
+            if event == "connection.connect_tcp.complete":
+                connected.append(True)
+            if previous_trace:
+                previous_trace(event, info)
+
+        request.extensions["trace"] = trace
+        response = super().handle_request(request)
+
+        version = response.extensions.get("http_version", b"").decode() or "unknown"
+        with _metrics_lock:
+            _metrics["requests"] += 1
+            _metrics["new_connections"] += 1 if connected else 0
+            _metrics["http_versions"][version] = _metrics["http_versions"].get(version, 0) + 1
+        return response
+
+
+def get_openai_client() -> OpenAI:
+    """The shared OpenAI client, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            timeout = httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+            http_client = httpx.Client(
+                transport=_MeteredTransport(
+                    http2=LLM_HTTP2 and HTTP2_SUPPORT,
+                    limits=httpx.Limits(
+                        max_connections=LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                        keepalive_expiry=LLM_KEEPALIVE_SECONDS
+                    )
+                ),
+                timeout=timeout
+            )
+            _client = OpenAI(
+                api_key=OPENAI_API_KEY,
+                base_url=OPENAI_BASE_URL,
+                http_client=http_client,
+                timeout=timeout,
+                max_retries=0  # Retried by the rate limiter
+            )
+            print(f"[LLM Client] Created shared client (HTTP/2: {LLM_HTTP2 and HTTP2_SUPPORT}, "
+                  f"max concurrency: {LLM_MAX_CONCURRENCY})")
+        return _client
+
+
+def close_llm_client():
+    """Close the shared client's connections (on shutdown)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+@contextmanager
+def llm_slot():
+    """Hold one of the process's LLM concurrency slots, waiting in line if needed."""
+    started = time.perf_counter()
+    with _metrics_lock:
+        _metrics["waiting"] += 1
+
+    acquired = _slots.acquire(timeout=LLM_QUEUE_TIMEOUT)
+    waited = time.perf_counter() - started
+
+    with _metrics_lock:
+        _metrics["waiting"] -= 1
+        _metrics["queue_wait_seconds_total"] += waited
+        _metrics["queue_wait_seconds_max"] = max(_metrics["queue_wait_seconds_max"], waited)
+        if acquired:
+            _metrics["in_flight"] += 1
+        else:
+            _metrics["queue_timeouts"] += 1
+
+    if not acquired:
+        raise LLMBusyError(f"AI service is busy, no slot free after {waited:.0f}s. Please try again.")
+
+    try:
+        yield
+    finally:
+        _slots.release()
+        with _metrics_lock:
+            _metrics["in_flight"] -= 1
+
+
+def estimate_request_tokens(kwargs: dict) -> int:
+    """Upper estimate of the tokens a chat completion request will use (prompt plus max_tokens)."""
+    return message_tokens(kwargs.get("messages", []))[0] + (kwargs.get("max_tokens") or 0)
+
+
+def _record_request(kwargs: dict):
+    """Append a request to AI_RECORD_FILE, as an input for the model routing evaluation."""
+    record = {key: kwargs.get(key) for key in ("model", "max_tokens", "messages")}
+    try:
+        with _record_lock, open(AI_RECORD_FILE, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"[LLM Client] Could not record request: {str(e)}")
+
+
+def _retry_after(error: Exception) -> float | None:
+    """How the rate limiter should treat an OpenAI error: None if not worth retrying, else Retry-After seconds."""
+    if isinstance(error, openai.APIConnectionError):  # Includes timeouts
+        return 0.0
+    if isinstance(error, openai.APIStatusError) and error.status_code in RETRY_STATUSES:
+        return parse_retry_after(error.response.headers)
+    return None
+
+
+def _record_usage(usage):
+    """Count prompt tokens and how many the provider served from its prompt cache."""
+    if usage is None:
+        return
+    cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None) or 0
+    with _metrics_lock:
+        _metrics["prompt_tokens"] += usage.prompt_tokens or 0
+        _metrics["cached_prompt_tokens"] += cached
+
+
+def _error_outcome(error: Exception) -> str:
+    """Ledger outcome of a failed OpenAI call."""
+    if isinstance(error, openai.RateLimitError):
+        return "rate_limited"
+    if isinstance(error, openai.APITimeoutError):
+        return "timeout"
+    return "error"
+
+
+def _response_outcome(finish_reason: str | None) -> str:
+    return "truncated" if finish_reason == "length" else "ok"
+
+
+def _create_completion(kwargs: dict):
+    with llm_slot():
+        started = time.perf_counter()
+        try:
+            response = get_openai_client().chat.completions.create(**kwargs)
+            _record_usage(getattr(response, "usage", None))
+            record_call(
+                "openai", kwargs.get("model", ""), time.perf_counter() - started, response_usage(response),
+                _response_outcome(response.choices[0].finish_reason if response.choices else None)
+            )
+        except Exception as e:
+            with _metrics_lock:
+                _metrics["errors"] += 1
+            record_call("openai", kwargs.get("model", ""), time.perf_counter() - started, outcome=_error_outcome(e))
+            raise
+        finally:
+            with _metrics_lock:
+                _metrics["calls"] += 1
+        return response
+
+
+def chat_completion(**kwargs):
+    """Create a chat completion on the shared client, within the concurrency cap and rate limits."""
+    if AI_RECORD_FILE:
+        _record_request(kwargs)
+    return call_with_retries(
+        "openai",
+        kwargs.get("model", ""),
+        estimate_request_tokens(kwargs),
+        lambda: _create_completion(kwargs),
+        _retry_after,
+        used_tokens=lambda response: getattr(getattr(response, "usage", None), "total_tokens", None)
+    )
+
+
+def stream_chat_completion(**kwargs):
+    """
+    Stream a chat completion's chunks from the shared client.
+
+    The concurrency slot is taken for each attempt to open the stream (not
+    while the rate limiter waits or backs off between attempts), then held
+    until the stream is read to the end or closed, since the connection
+    stays busy the whole time.
+    """
+    if AI_RECORD_FILE:
+        _record_request(kwargs)
+    model = kwargs.get("model", "")
+    # The generator may be resumed in other contexts, so the ledger tags are taken now
+    context = current_usage_context()
+    slot = ExitStack()
+    started = time.perf_counter()
+    usage = None
+    finish_reason = None
+
+    def create():
+        nonlocal started
+        slot.enter_context(llm_slot())
+        started = time.perf_counter()
+        try:
+            return get_openai_client().chat.completions.create(stream=True, **kwargs)
+        except Exception as e:
+            # Free the slot for others while this call waits to retry
+            slot.close()
+            record_call("openai", model, time.perf_counter() - started, outcome=_error_outcome(e), context=context)
+            raise
+
+    opened = False
+    outcome = None
+    try:
+        stream = call_with_retries("openai", model, estimate_request_tokens(kwargs), create, _retry_after)
+        opened = True
+        with stream:
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    _record_usage(chunk.usage)
+                    usage = response_usage(chunk)
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                yield chunk
+        outcome = _response_outcome(finish_reason)
+    except Exception as e:
+        with _metrics_lock:
+            _metrics["errors"] += 1
+        outcome = _error_outcome(e)
+        raise
+    finally:
+        slot.close()
+        if opened:
+            # No outcome means the reader stopped early (e.g. the client disconnected)
+            record_call("openai", model, time.perf_counter() - started, usage, outcome or "cancelled", context=context)
+        with _metrics_lock:
+            _metrics["calls"] += 1
+
+
+def get_llm_metrics() -> dict:
+    """Snapshot of client usage for this process, including connection reuse."""
+    with _metrics_lock:
+        metrics = dict(_metrics, http_versions=dict(_metrics["http_versions"]))
+
+    requests = metrics["requests"]
+    metrics["reused_connections"] = requests - metrics["new_connections"]
+    metrics["connection_reuse_ratio"] = metrics["reused_connections"] / requests if requests else 0.0
+    waits = metrics["calls"] + metrics["queue_timeouts"]
+    wait_total = metrics.pop("queue_wait_seconds_total")
+    metrics["queue_wait_seconds_avg"] = wait_total / waits if waits else 0.0
+    prompt_tokens = metrics["prompt_tokens"]
+    metrics["prompt_cache_hit_ratio"] = metrics["cached_prompt_tokens"] / prompt_tokens if prompt_tokens else 0.0
+    metrics["max_concurrency"] = LLM_MAX_CONCURRENCY
+    metrics["http2_enabled"] = LLM_HTTP2 and HTTP2_SUPPORT
+    return metrics
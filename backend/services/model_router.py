@@ -0,0 +1,130 @@
+"""
+Model routing for AI requests.
+
+Each workload (named after its prompt template) has a tier table. A request
+goes to the first tier that matches its modality (text or image) and whose
+max_input_tokens its input fits in; the tier sets the model, the response
+budget (max_tokens) and the image detail. Small inputs get a cheap, fast
+configuration and large ones get room to answer. MODEL_ROUTES replaces the
+table of any workload, and benchmarks/model_routing_eval.py compares the
+tiers on recorded inputs.
+"""
+import hashlib
+import json
+from config import MODEL_ROUTES
+from services.tokenizer import count_tokens
+
+# Tokens an input image costs at each detail level (high is the most a 1024px-ish image costs)
+IMAGE_TOKENS = {"high": 1100, "low": 85}
+
+# Tiers are tried in order; max_input_tokens None matches any size and
+# modality None matches both text and images. detail only applies to images.
+DEFAULT_ROUTES = {
+    "study_guide": [
+        {"tier": "small", "max_input_tokens": 1500, "model": "gpt-4o-mini", "max_tokens": 1500},
+        {"tier": "standard", "max_input_tokens": 15000, "model": "gpt-4o-mini", "max_tokens": 2000},
+        {"tier": "large", "max_input_tokens": None, "model": "gpt-4o-mini", "max_tokens": 3000}
+    ],
+    "partial_summary": [
+        {"tier": "image", "modality": "image", "model": "gpt-4o-mini", "max_tokens": 800, "detail": "high"},
+        {"tier": "small", "max_input_tokens": 1500, "model": "gpt-4o-mini", "max_tokens": 500},
+        {"tier": "standard", "max_input_tokens": None, "model": "gpt-4o-mini", "max_tokens": 800}
+    ],
+    "question_segments": [
+        {"tier": "small", "max_input_tokens": 3000, "model": "gpt-4.1-nano", "max_tokens": 800},
+        {"tier": "standard", "max_input_tokens": None, "model": "gpt-4o-mini", "max_tokens": 1500}
+    ],
+    "assignment": [
+        {"tier": "small", "max_input_tokens": 3000, "model": "gpt-4o-mini", "max_tokens": 2500},
+        {"tier": "standard", "max_input_tokens": None, "model": "gpt-4o-mini", "max_tokens": 4000}
+    ],
+    "assignment_vision": [
+        {"tier": "standard", "max_input_tokens": None, "model": "gpt-4o-mini", "max_tokens": 4000, "detail": "high"}
+    ]
+}
+
+# USD per million tokens: (input, cached input, output)
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "sonar": (1.00, 1.00, 1.00)
+}
+
+
+def get_routes(workload: str) -> list[dict]:
+    """The tier table for a workload."""
+    return MODEL_ROUTES.get(workload) or DEFAULT_ROUTES[workload]
+
+
+def routes_signature(*workloads: str) -> str:
+    """Short hash of the tier tables, for cache keys of results that depend on routing."""
+    tables = {workload: get_routes(workload) for workload in workloads}
+    return hashlib.sha256(json.dumps(tables, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def max_response_tokens(workload: str) -> int:
+    """Largest max_tokens any tier of a workload uses (what prompt budgets must leave room for)."""
+    return max(tier["max_tokens"] for tier in get_routes(workload))
+
+
+def route(workload: str, input_tokens: int, images: int = 0) -> dict:
+    """Model, max_tokens and image detail for a request of `input_tokens` tokens (images included)."""
+    modality = "image" if images else "text"
+    tiers = get_routes(workload)
+    chosen = tiers[-1]
+    for tier in tiers:
+        if tier.get("modality") not in (None, modality):
+            continue
+        limit = tier.get("max_input_tokens")
+        if limit is None or input_tokens <= limit:
+            chosen = tier
+            break
+
+    return {
+        "workload": workload,
+        "tier": chosen["tier"],
+        "model": chosen["model"],
+        "max_tokens": chosen["max_tokens"],
+        "detail": chosen.get("detail", "high")
+    }
+
+
+def message_tokens(messages: list) -> tuple[int, int]:
+    """(input tokens, number of images) of chat messages."""
+    tokens = 0
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += count_tokens(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    tokens += count_tokens(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    images += 1
+                    tokens += IMAGE_TOKENS.get(part["image_url"].get("detail", "high"), IMAGE_TOKENS["high"])
+    return tokens, images
+
+
+def route_messages(workload: str, messages: list) -> dict:
+    """route() for a request whose messages are already built."""
+    tokens, images = message_tokens(messages)
+    return route(workload, tokens, images)
+
+
+def estimate_cost(model: str, usage: dict) -> float | None:
+    """Cost in USD of one request from its response_usage() counts (None for unknown models)."""
+    prices = MODEL_PRICES.get(model)
+    if not prices or usage.get("prompt_tokens") is None:
+        return None
+    input_price, cached_price, output_price = prices
+    cached = usage.get("cached_tokens") or 0
+    return (
+        (usage["prompt_tokens"] - cached) * input_price
+        + cached * cached_price
+        + (usage.get("completion_tokens") or 0) * output_price
+    ) / 1_000_000
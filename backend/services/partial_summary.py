@@ -0,0 +1,287 @@
+"""
+Per-input partial summaries for map-reduce study guides.
+
+Every input of a task (a segment of the notes, a segment of a PDF, an
+image) is summarized on its own - in parallel - and the partial summary is
+cached by a hash of that input's content. A study guide is then merged from
+the partials, so changing one input only re-summarizes that input, and no
+document has to be cut down to share a single prompt with the others.
+"""
+import contextvars
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from models.partial_summary import PartialSummary
+from config import PARTIAL_SUMMARY_WORKERS, PARTIAL_SUMMARY_MAX_ENTRIES, SUMMARY_CACHE_TTL_DAYS
+from services.llm_client import chat_completion
+from services.context_builder import chunk_text
+from services.tokenizer import count_tokens
+from services.token_budget import response_usage
+from services.json_stream import parse_json_response
+from services.prompts import PARTIAL_SUMMARY_PROMPT
+from services.model_router import route, IMAGE_TOKENS
+
+# Part of the cache key, so partials are regenerated when the template's version is bumped
+PARTIAL_PROMPT_VERSION = PARTIAL_SUMMARY_PROMPT.version
+
+# Largest piece of text summarized in one call; longer inputs are split
+PARTIAL_SEGMENT_TOKENS = 12000
+# Segments read from any one PDF (or the notes), so huge documents stay bounded
+MAX_SEGMENTS_PER_INPUT = 8
+
+
+def segment_text(text: str, max_tokens: int = PARTIAL_SEGMENT_TOKENS) -> list[str]:
+    """
+    Split text into segments of at most about max_tokens tokens.
+
+    Segments are built from the start of the text, so an edit only changes
+    the segment it falls in and the ones after it, and earlier segments keep
+    their cached partial summaries.
+    """
+    if count_tokens(text) <= max_tokens:
+        return [text]
+
+    segments = []
+    current = []
+    current_tokens = 0
+    for chunk in chunk_text(text):
+        tokens = count_tokens(chunk)
+        if current and current_tokens + tokens > max_tokens:
+            segments.append("\n\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(chunk)
+        current_tokens += tokens
+    if current:
+        segments.append("\n\n".join(current))
+    return segments
+
+
+def text_part(label: str, text: str) -> dict:
+    return {"label": label, "kind": "text", "text": text, "content_hash": hashlib.sha256(text.encode()).hexdigest()}
+
+
+def image_part(label: str, base64_image: str, media_type: str) -> dict:
+    return {
+        "label": label,
+        "kind": "image",
+        "base64": base64_image,
+        "media_type": media_type,
+        "content_hash": hashlib.sha256(base64_image.encode()).hexdigest()
+    }
+
+
+def part_route(part: dict) -> dict:
+    """Model, response budget and image detail for summarizing a part, by its size and kind."""
+    if part["kind"] == "image":
+        return route("partial_summary", IMAGE_TOKENS["high"], images=1)
+    return route("partial_summary", count_tokens(part["text"]))
+
+
+def partial_fingerprint(part: dict, part_model_route: dict) -> str:
+    key = {
+        "kind": part["kind"],
+        "content": part["content_hash"],
+        "prompt_version": PARTIAL_PROMPT_VERSION,
+        "model": part_model_route["model"],
+        "max_tokens": part_model_route["max_tokens"],
+        "detail": part_model_route["detail"] if part["kind"] == "image" else None
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def render_partial(partial: dict) -> str:
+    """A partial summary as text for the reduce prompt."""
+    lines = [partial.get("summary", "")]
+    if partial.get("key_points"):
+        lines.append("Key points:")
+        lines.extend(f"- {point}" for point in partial["key_points"])
+    if partial.get("concepts"):
+        lines.append("Concepts:")
+        lines.extend(f"- {concept}" for concept in partial["concepts"])
+    return "\n".join(lines)
+
+
+def _partial_messages(part: dict, detail: str = "high") -> list:
+    if part["kind"] == "image":
+        return PARTIAL_SUMMARY_PROMPT.messages(
+            images=[part],
+            detail=detail,
+            piece=f"The piece is the image {part['label']}. Describe and extract everything relevant in it."
+        )
+    return PARTIAL_SUMMARY_PROMPT.messages(piece=f"PIECE ({part['label']}):\n{part['text']}")
+
+
+def _summarize_part(part: dict, part_model_route: dict) -> dict:
+    response = chat_completion(
+        model=part_model_route["model"],
+        messages=_partial_messages(part, part_model_route["detail"]),
+        temperature=0.2,
+        max_tokens=part_model_route["max_tokens"],
+        response_format={"type": "json_object"}
+    )
+    content = response.choices[0].message.content
+    parsed, complete = parse_json_response(content)
+    if isinstance(parsed, dict) and parsed:
+        result = {
+            "summary": parsed.get("summary", ""),
+            "key_points": parsed.get("key_points", []),
+            "concepts": parsed.get("concepts", [])
+        }
+    else:
+        print(f"[Partial Summary] JSON parse error for {part['label']}, keeping raw text")
+        result = {"summary": content, "key_points": [], "concepts": []}
+        complete = False
+    # Raw text and cut-off summaries are used this once, but not cached
+    return {"result": result, "usage": response_usage(response), "complete": complete}
+
+
+def _expiry_cutoff() -> datetime | None:
+    if SUMMARY_CACHE_TTL_DAYS <= 0:
+        return None
+    return datetime.now(timezone.utc) - timedelta(days=SUMMARY_CACHE_TTL_DAYS)
+
+
+def _load_cached(db: Session, fingerprints: list[str]) -> dict[str, dict]:
+    entries = db.query(PartialSummary).filter(PartialSummary.fingerprint.in_(fingerprints)).all()
+    cutoff = _expiry_cutoff()
+    now = datetime.now(timezone.utc)
+
+    cached = {}
+    for entry in entries:
+        created_at = entry.created_at
+        if created_at and created_at.tzinfo is None:
+            # SQLite hands back naive UTC timestamps
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        if cutoff and created_at and created_at < cutoff:
+            continue
+        entry.hit_count += 1
+        entry.last_used_at = now
+        cached[entry.fingerprint] = dict(entry.result)
+    db.commit()
+    return cached
+
+
+def _store(db: Session, fingerprint: str, kind: str, model: str, result: dict):
+    now = datetime.now(timezone.utc)
+    entry = db.query(PartialSummary).filter(PartialSummary.fingerprint == fingerprint).first()
+    if entry:
+        # Expired - replace it
+        entry.result = result
+        entry.created_at = now
+        entry.last_used_at = now
+        entry.hit_count = 0
+    else:
+        db.add(PartialSummary(
+            fingerprint=fingerprint,
+            kind=kind,
+            model=model,
+            prompt_version=PARTIAL_PROMPT_VERSION,
+            result=result,
+            created_at=now,
+            last_used_at=now
+        ))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another request summarized the same input first
+        db.rollback()
+
+
+def evict_partial_summaries(db: Session) -> int:
+    """Drop expired partials and trim to PARTIAL_SUMMARY_MAX_ENTRIES. Returns entries removed."""
+    removed = 0
+
+    cutoff = _expiry_cutoff()
+    if cutoff:
+        removed += db.query(PartialSummary).filter(PartialSummary.created_at < cutoff).delete()
+
+    excess = db.query(PartialSummary).count() - PARTIAL_SUMMARY_MAX_ENTRIES
+    if excess > 0:
+        oldest = db.query(PartialSummary.id).order_by(PartialSummary.last_used_at).limit(excess).all()
+        removed += db.query(PartialSummary).filter(
+            PartialSummary.id.in_([row.id for row in oldest])
+        ).delete(synchronize_session=False)
+
+    db.commit()
+    if removed:
+        print(f"[Partial Summary] Evicted {removed} entries")
+    return removed
+
+
+def summarize_parts(parts: list[dict]) -> tuple[list[tuple[dict, dict]], dict]:
+    """
+    Partial summaries for every part, from the cache or generated in parallel.
+
+    Returns (part, partial) pairs in input order - parts that failed to
+    summarize are left out - and usage stats for the map step. The stats'
+    "incomplete" is true if any part failed or its summary didn't parse
+    completely; a study guide merged from such partials mustn't be cached.
+    Raises if every part failed.
+    """
+    routes = [part_route(part) for part in parts]
+    fingerprints = [partial_fingerprint(part, part_model_route) for part, part_model_route in zip(parts, routes)]
+
+    db: Session = SessionLocal()
+    try:
+        partials = _load_cached(db, fingerprints)
+        missing = [
+            (fp, (part, part_model_route))
+            for fp, part, part_model_route in zip(fingerprints, parts, routes) if fp not in partials
+        ]
+        missing = list({fp: item for fp, item in missing}.items())  # identical inputs once
+
+        stats = {
+            "parts": len(parts),
+            "cached": len(parts) - len(missing),
+            "generated": 0,
+            "failed": 0,
+            "unparsed": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0
+        }
+        print(f"[Partial Summary] {stats['cached']}/{len(parts)} parts cached, summarizing {len(missing)}")
+
+        errors = []
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, PARTIAL_SUMMARY_WORKERS)) as pool:
+                # Each call runs in a copy of this context, so the usage ledger knows what it's for
+                futures = [
+                    (fp, part, part_model_route, pool.submit(
+                        contextvars.copy_context().run, _summarize_part, part, part_model_route
+                    ))
+                    for fp, (part, part_model_route) in missing
+                ]
+                for fp, part, part_model_route, future in futures:
+                    try:
+                        generated = future.result()
+                    except Exception as e:
+                        print(f"[Partial Summary] Failed to summarize {part['label']}: {str(e)}")
+                        errors.append(str(e))
+                        stats["failed"] += 1
+                        continue
+
+                    partials[fp] = generated["result"]
+                    if generated["complete"]:
+                        _store(db, fp, part["kind"], part_model_route["model"], generated["result"])
+                    else:
+                        stats["unparsed"] += 1
+                    stats["generated"] += 1
+                    for key in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+                        stats[key] += generated["usage"].get(key) or 0
+
+            evict_partial_summaries(db)
+    finally:
+        db.close()
+
+    if parts and not partials:
+        raise RuntimeError(errors[0] if errors else "No partial summaries")
+
+    stats["incomplete"] = bool(stats["failed"] or stats["unparsed"])
+
+    return [(part, partials[fp]) for fp, part in zip(fingerprints, parts) if fp in partials], stats
@@ -0,0 +1,165 @@
+from pathlib import Path
+from config import PDF_BACKEND
+
+# Each backend library is optional; PyPDF2 is the default and the only one in requirements.txt
+try:
+    from PyPDF2 import PdfReader
+    PYPDF2_AVAILABLE = True
+except ImportError:
+    PYPDF2_AVAILABLE = False
+
+try:
+    import pypdfium2
+    PYPDFIUM2_AVAILABLE = True
+except ImportError:
+    PYPDFIUM2_AVAILABLE = False
+
+try:
+    from pdfminer.converter import PDFPageAggregator
+    from pdfminer.layout import LAParams, LTTextContainer
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfparser import PDFParser
+    PDFMINER_AVAILABLE = True
+except ImportError:
+    PDFMINER_AVAILABLE = False
+
+
+class PdfBackend:
+    """
+    A PDF text extraction library.
+
+    open() returns a backend-specific document handle that the other
+    methods take; close() must be called when done with it.
+    """
+    name = ""
+    available = False
+
+    def open(self, file_path: Path):
+        raise NotImplementedError
+
+    def page_count(self, doc) -> int:
+        raise NotImplementedError
+
+    def extract_page(self, doc, index: int) -> str:
+        raise NotImplementedError
+
+    def close(self, doc):
+        pass
+
+
+class PyPDF2Backend(PdfBackend):
+    """Pure-Python extraction with PyPDF2 (default)."""
+    name = "pypdf2"
+    available = PYPDF2_AVAILABLE
+
+    def open(self, file_path: Path):
+        return PdfReader(str(file_path))
+
+    def page_count(self, doc) -> int:
+        return len(doc.pages)
+
+    def extract_page(self, doc, index: int) -> str:
+        return doc.pages[index].extract_text() or ""
+
+
+class PdfiumBackend(PdfBackend):
+    """Extraction with PDFium (Chrome's PDF engine) via pypdfium2 - much faster."""
+    name = "pypdfium2"
+    available = PYPDFIUM2_AVAILABLE
+
+    def open(self, file_path: Path):
+        return pypdfium2.PdfDocument(str(file_path))
+
+    def page_count(self, doc) -> int:
+        return len(doc)
+
+    def extract_page(self, doc, index: int) -> str:
+        page = doc[index]
+        try:
+            textpage = page.get_textpage()
+            try:
+                return textpage.get_text_range().replace("\r\n", "\n")
+            finally:
+                textpage.close()
+        finally:
+            page.close()
+
+    def close(self, doc):
+        doc.close()
+
+
+class PdfminerBackend(PdfBackend):
+    """Layout-aware extraction with pdfminer.six - better reading order, slower."""
+    name = "pdfminer"
+    available = PDFMINER_AVAILABLE
+
+    def open(self, file_path: Path):
+        fp = open(file_path, "rb")
+        try:
+            document = PDFDocument(PDFParser(fp))
+            pages = list(PDFPage.create_pages(document))
+        except Exception:
+            fp.close()
+            raise
+        return {"fp": fp, "pages": pages, "resources": PDFResourceManager()}
+
+    def page_count(self, doc) -> int:
+        return len(doc["pages"])
+
+    def extract_page(self, doc, index: int) -> str:
+        device = PDFPageAggregator(doc["resources"], laparams=LAParams())
+        try:
+            PDFPageInterpreter(doc["resources"], device).process_page(doc["pages"][index])
+            layout = device.get_result()
+        finally:
+            device.close()
+        return "".join(obj.get_text() for obj in layout if isinstance(obj, LTTextContainer))
+
+    def close(self, doc):
+        doc["fp"].close()
+
+
+PDF_BACKENDS: dict[str, PdfBackend] = {
+    backend.name: backend
+    for backend in (PyPDF2Backend(), PdfiumBackend(), PdfminerBackend())
+}
+
+PDF_SUPPORT = any(backend.available for backend in PDF_BACKENDS.values())
+
+
+def get_backend_order(preferred: str | None = None) -> list[PdfBackend]:
+    """
+    Available backends to try, in order.
+
+    The preferred backend (PDF_BACKEND by default) comes first, then PyPDF2,
+    then any other installed backend. Unknown or uninstalled names are skipped.
+    """
+    names = [preferred or PDF_BACKEND, "pypdf2", *PDF_BACKENDS]
+    order = []
+    for name in names:
+        backend = PDF_BACKENDS.get(name)
+        if backend and backend.available and backend not in order:
+            order.append(backend)
+    return order
+
+
+def open_document(file_path: Path, preferred: str | None = None) -> tuple[PdfBackend, object]:
+    """
+    Open a PDF with the first backend that can read it.
+
+    Falls back to the next backend if one is missing or fails to open
+    the file. Raises the first error if none can open it.
+    """
+    first_error = None
+    for backend in get_backend_order(preferred):
+        try:
+            return backend, backend.open(file_path)
+        except Exception as e:
+            print(f"[PDF Backends] {backend.name} could not open {file_path.name}: {str(e)}")
+            first_error = first_error or e
+
+    if first_error:
+        raise first_error
+    raise RuntimeError("No PDF backend installed")
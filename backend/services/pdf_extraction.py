@@ -0,0 +1,287 @@
+import math
+import signal
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from config import PDF_EXTRACT_WORKERS, PDF_PAGE_TIMEOUT, PDF_MIN_PAGES_PER_CHUNK
+from services.pdf_backends import open_document
+
+
+SKIPPED_PAGE_MARKER = "[Page {page_number} skipped: {reason}]"
+# Reasons that say nothing about the page itself, so extracting it again may work
+WORKER_CRASHED = "extraction worker crashed"
+WORKER_STUCK = "extraction worker stopped responding"
+
+# Per-page alarms need SIGALRM, which is not available on Windows
+_TIMER_SUPPORT = hasattr(signal, "setitimer")
+
+
+class PageTimeoutError(Exception):
+    pass
+
+
+def _raise_page_timeout(signum, frame):
+    raise PageTimeoutError()
+
+
+def _extract_page_range(
+    file_path: str,
+    start: int,
+    end: int,
+    page_timeout: float,
+    backend_name: str | None = None
+) -> list[str]:
+    """
+    Extract pages [start, end) of a PDF. Runs inside a pool worker process.
+
+    Per-page timeouts use SIGALRM, so they only apply when running in a
+    process's main thread (always true for pool workers).
+    """
+    backend, doc = open_document(Path(file_path), backend_name)
+    use_timer = _TIMER_SUPPORT and page_timeout > 0
+    if use_timer:
+        try:
+            previous_handler = signal.signal(signal.SIGALRM, _raise_page_timeout)
+        except ValueError:
+            # Not the main thread - no per-page timeout available
+            use_timer = False
+
+    pages = []
+    try:
+        for i in range(start, end):
+            try:
+                if use_timer:
+                    signal.setitimer(signal.ITIMER_REAL, page_timeout)
+                text = backend.extract_page(doc, i)
+                pages.append(text.strip() if text else "")
+            except PageTimeoutError:
+                pages.append(SKIPPED_PAGE_MARKER.format(
+                    page_number=i + 1, reason=f"timed out after {page_timeout:g}s"
+                ))
+            except Exception as e:
+                pages.append(SKIPPED_PAGE_MARKER.format(page_number=i + 1, reason=str(e) or type(e).__name__))
+            finally:
+                if use_timer:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+    finally:
+        if use_timer:
+            signal.signal(signal.SIGALRM, previous_handler)
+        backend.close(doc)
+
+    return pages
+
+
+# Process pool shared by all extractions in this process (request and ingestion
+# threads alike), so it's only created or replaced under the lock
+_pool: ProcessPoolExecutor | None = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None and _pool_workers != workers:
+            # Ranges already submitted by other extractions still finish on the old pool
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+            print(f"[PDF Extraction] Started process pool with {workers} workers")
+        return _pool
+
+
+def _replace_broken_pool(broken: ProcessPoolExecutor, workers: int, stuck: bool = False) -> ProcessPoolExecutor:
+    """
+    A working pool in place of one found broken. Only the first thread to
+    report a given pool replaces it; the others get that replacement.
+
+    stuck means a worker stopped responding: the pool doesn't say which
+    one, so all of its workers are killed rather than left holding slots.
+    Other extractions on it see a broken pool and retry their ranges.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            if stuck:
+                for process in list((broken._processes or {}).values()):
+                    process.kill()
+            broken.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+            print(f"[PDF Extraction] Process pool {'stuck' if stuck else 'broken'}, replacing it")
+    return _get_pool(workers)
+
+
+def shutdown_extraction_pool():
+    """Stop the extraction process pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+            print("[PDF Extraction] Process pool stopped")
+
+
+def split_page_ranges(
+    page_count: int,
+    workers: int,
+    start_page: int = 0,
+    min_chunk: int = PDF_MIN_PAGES_PER_CHUNK
+) -> list[tuple[int, int]]:
+    """
+    Split pages [start_page, page_count) into contiguous [start, end) ranges.
+
+    Aims for about two ranges per worker, but keeps ranges small enough
+    that a caller who stops early doesn't wait on a huge range.
+    """
+    remaining = page_count - start_page
+    if remaining <= 0:
+        return []
+    chunk = max(min_chunk, min(math.ceil(remaining / max(1, workers * 2)), min_chunk * 4))
+    return [(start, min(start + chunk, page_count)) for start in range(start_page, page_count, chunk)]
+
+
+def get_page_count(file_path: Path, backend_name: str | None = None) -> int:
+    """Number of pages in a PDF. Raises if the PDF cannot be opened."""
+    backend, doc = open_document(file_path, backend_name)
+    try:
+        return backend.page_count(doc)
+    finally:
+        backend.close(doc)
+
+
+def _failed_range(start: int, end: int, reason: str) -> list[str]:
+    return [SKIPPED_PAGE_MARKER.format(page_number=i + 1, reason=reason) for i in range(start, end)]
+
+
+def iter_pages(
+    file_path: Path,
+    start_page: int = 0,
+    page_count: int | None = None,
+    workers: int = PDF_EXTRACT_WORKERS,
+    page_timeout: float = PDF_PAGE_TIMEOUT,
+    backend_name: str | None = None
+) -> Iterator[str]:
+    """
+    Lazily yield the text of each page of a PDF, in order, from start_page.
+
+    Only a few page ranges (one per worker) are extracted ahead of the
+    consumer, so a caller that stops iterating early stops the parsing too.
+    Pages that fail or time out are yielded as skip markers.
+    backend_name overrides the configured PDF_BACKEND.
+    Raises if the PDF itself cannot be opened.
+    """
+    started = time.perf_counter()
+    if page_count is None:
+        page_count = get_page_count(file_path, backend_name)
+    ranges = deque(split_page_ranges(page_count, workers, start_page))
+    yielded = 0
+
+    try:
+        if workers <= 0:
+            while ranges:
+                start, end = ranges.popleft()
+                for text in _extract_page_range(str(file_path), start, end, page_timeout, backend_name):
+                    yielded += 1
+                    yield text
+            return
+
+        pool = _get_pool(workers)
+        in_flight: deque = deque()
+
+        def submit(start: int, end: int) -> Future:
+            nonlocal pool
+            try:
+                return pool.submit(_extract_page_range, str(file_path), start, end, page_timeout, backend_name)
+            except (BrokenProcessPool, RuntimeError):
+                # Broken, or replaced by another thread in the meantime
+                pool = _replace_broken_pool(pool, workers)
+                return pool.submit(_extract_page_range, str(file_path), start, end, page_timeout, backend_name)
+
+        try:
+            while ranges or in_flight:
+                # Keep one range per worker extracting ahead of the consumer
+                while ranges and len(in_flight) < workers:
+                    start, end = ranges.popleft()
+                    in_flight.append((start, end, submit(start, end), False))
+
+                start, end, future, retried = in_flight.popleft()
+                # Backstop in case a worker gets stuck where the alarm can't reach it
+                range_timeout = page_timeout * (end - start) + 30 if page_timeout > 0 else None
+                try:
+                    texts = future.result(timeout=range_timeout)
+                except BrokenProcessPool:
+                    if retried:
+                        texts = _failed_range(start, end, WORKER_CRASHED)
+                    else:
+                        # Every range still on the broken pool is lost with it (ranges are in page
+                        # order, so none of them has been retried yet): retry each once on a fresh pool
+                        pool = _replace_broken_pool(pool, workers)
+                        lost = [(start, end)] + [(s, e) for s, e, _, _ in in_flight]
+                        in_flight = deque((s, e, submit(s, e), True) for s, e in lost)
+                        continue
+                except FutureTimeoutError:
+                    # The worker is stuck for good; the rest of the pool's ranges go to a fresh one
+                    texts = _failed_range(start, end, WORKER_STUCK)
+                    pool = _replace_broken_pool(pool, workers, stuck=True)
+                    in_flight = deque((s, e, submit(s, e), r) for s, e, _, r in in_flight)
+                except Exception as e:
+                    texts = _failed_range(start, end, str(e) or type(e).__name__)
+
+                for text in texts:
+                    yielded += 1
+                    yield text
+        finally:
+            for _, _, future, _ in in_flight:
+                future.cancel()
+    finally:
+        seconds = time.perf_counter() - started
+        pages_per_second = yielded / seconds if seconds > 0 else 0.0
+        print(
+            f"[PDF Extraction] {file_path.name}: {yielded} of {page_count} pages in {seconds:.2f}s "
+            f"({pages_per_second:.1f} pages/sec)"
+        )
+
+
+def extract_pages(
+    file_path: Path,
+    workers: int = PDF_EXTRACT_WORKERS,
+    page_timeout: float = PDF_PAGE_TIMEOUT,
+    backend_name: str | None = None
+) -> dict:
+    """
+    Extract the text of every page of a PDF, in parallel where possible.
+
+    Returns a dict with:
+        pages: one string per page (a skip marker for pages that failed)
+        skipped: 1-based numbers of skipped pages
+        seconds: wall-clock extraction time
+        pages_per_second: extraction throughput
+
+    Raises if the PDF itself cannot be opened.
+    """
+    started = time.perf_counter()
+    pages = list(iter_pages(file_path, workers=workers, page_timeout=page_timeout, backend_name=backend_name))
+    seconds = time.perf_counter() - started
+
+    return {
+        "pages": pages,
+        "skipped": [i + 1 for i, text in enumerate(pages) if is_skipped_page(text)],
+        "seconds": seconds,
+        "pages_per_second": len(pages) / seconds if seconds > 0 else 0.0
+    }
+
+
+def is_skipped_page(text: str) -> bool:
+    """Whether a page text is a skip marker produced by the engine."""
+    return text.startswith("[Page ") and " skipped: " in text
+
+
+def is_retryable_skip(text: str) -> bool:
+    """Whether a skip marker is for a worker crash or hang rather than the page itself failing or timing out."""
+    return is_skipped_page(text) and text.endswith((f"{WORKER_CRASHED}]", f"{WORKER_STUCK}]"))
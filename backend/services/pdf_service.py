@@ -0,0 +1,209 @@
+import hashlib
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import closing
+from pathlib import Path
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from models.attachment_page import AttachmentPage
+from services.pdf_extraction import extract_pages, iter_pages, get_page_count, is_skipped_page, is_retryable_skip
+from services.pdf_backends import PDF_SUPPORT
+from config import PDF_PAGE_MAX_ATTEMPTS
+
+
+NO_PDF_SUPPORT_MESSAGE = "[PDF text extraction not available - please install PyPDF2, pypdfium2 or pdfminer.six]"
+NO_TEXT_MESSAGE = "[No extractable text found in PDF - the PDF may contain only images or scanned content]"
+
+
+def compute_file_hash(file_path: Path) -> str:
+    """Compute the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_pdf_pages(file_path: Path) -> list[str]:
+    """
+    Extract the text of every page of a PDF.
+
+    Returns one (stripped) string per page, empty for pages without text.
+    Pages that fail or time out are replaced by a skip marker.
+    Raises if the PDF cannot be opened.
+    """
+    return extract_pages(file_path)["pages"]
+
+
+def format_pdf_text(
+    pages: Iterable[str],
+    budget: int | None = None,
+    measure: Callable[[str], int] = len
+) -> str:
+    """
+    Join page texts into a single document with page markers.
+
+    With a budget, pages are consumed only until the joined text measures
+    at least `budget` (characters by default, or whatever `measure` counts),
+    so lazily extracted pages past that point are never parsed. The result
+    can exceed the budget by up to one page; callers still trim it.
+    """
+    text_parts = []
+    used = 0
+
+    for i, text in enumerate(pages):
+        if not text:
+            continue
+        part = f"--- Page {i + 1} ---\n{text}"
+        text_parts.append(part)
+        used += measure(part)
+        if budget is not None and used >= budget:
+            break
+
+    if not text_parts:
+        return NO_TEXT_MESSAGE
+
+    return "\n\n".join(text_parts)
+
+
+def extract_pdf_text(file_path: Path, budget: int | None = None, measure: Callable[[str], int] = len) -> str:
+    """Extract text content from a PDF file, stopping once the budget is met."""
+    if not PDF_SUPPORT:
+        return NO_PDF_SUPPORT_MESSAGE
+
+    try:
+        with closing(iter_pages(file_path)) as pages:
+            full_text = format_pdf_text(pages, budget, measure)
+        print(f"[PDF Service] Extracted {len(full_text)} characters from PDF")
+        return full_text
+
+    except Exception as e:
+        print(f"[PDF Service] Error reading PDF: {str(e)}")
+        return f"[Error reading PDF: {str(e)}]"
+
+
+def _flush_pages(db: Session, pending: list[AttachmentPage]):
+    """Persist buffered pages (and retried ones updated in place), ignoring pages another request already stored."""
+    if not pending and not db.dirty:
+        return
+    try:
+        db.add_all(pending)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+    pending.clear()
+
+
+def iter_attachment_pages(attachment_id: int, file_path: Path) -> Iterator[str]:
+    """
+    Lazily yield the page texts of a PDF attachment, extracting each page once.
+
+    Text is stored per attachment and content hash. Stored pages are read
+    back from the database; pages not stored yet are extracted on demand
+    and persisted as they are produced, so a caller that stops early only
+    pays for the pages it used and later calls continue where it stopped.
+    Pages that failed or timed out are stored as their skip marker, so they
+    cost no more time on later reads. Only a page whose worker crashed or
+    hung is extracted again, up to PDF_PAGE_MAX_ATTEMPTS times in all.
+    Raises if the PDF has to be extracted and cannot be opened.
+    """
+    content_hash = compute_file_hash(file_path)
+
+    db: Session = SessionLocal()
+    try:
+        rows = db.query(AttachmentPage).filter(
+            AttachmentPage.attachment_id == attachment_id,
+            AttachmentPage.content_hash == content_hash
+        ).order_by(AttachmentPage.page_number).all()
+
+        if not rows:
+            # Drop text stored for an older version of the file
+            delete_attachment_pages(db, attachment_id)
+            db.commit()
+
+        stored = {row.page_number: row.text for row in rows if row.status != "retry"}
+        retry_rows = {row.page_number: row for row in rows if row.status == "retry"}
+        page_count = rows[0].page_count if rows else get_page_count(file_path)
+
+        pending: list[AttachmentPage] = []
+        try:
+            page_number = 1
+            while page_number <= page_count:
+                if page_number in stored:
+                    yield stored[page_number]
+                    page_number += 1
+                    continue
+
+                # Extract the run of pages up to the next stored one
+                run_end = page_number
+                while run_end < page_count and run_end + 1 not in stored:
+                    run_end += 1
+                print(f"[PDF Service] Extracting attachment {attachment_id} pages {page_number}-{run_end} of {page_count}")
+
+                with closing(iter_pages(file_path, start_page=page_number - 1, page_count=run_end)) as pages:
+                    for text in pages:
+                        row = retry_rows.get(page_number)
+                        if row is None:
+                            row = AttachmentPage(
+                                attachment_id=attachment_id,
+                                content_hash=content_hash,
+                                page_number=page_number,
+                                page_count=page_count
+                            )
+                            pending.append(row)
+                        row.text = text
+                        if is_skipped_page(text):
+                            row.attempts = (row.attempts or 0) + 1
+                            retry = is_retryable_skip(text) and row.attempts < PDF_PAGE_MAX_ATTEMPTS
+                            row.status = "retry" if retry else "failed"
+                        else:
+                            row.status = None
+                        if len(pending) >= 16:
+                            _flush_pages(db, pending)
+                        page_number += 1
+                        yield text
+        finally:
+            _flush_pages(db, pending)
+    finally:
+        db.close()
+
+
+def get_attachment_pages(attachment_id: int, file_path: Path) -> list[str]:
+    """Get every page text of a PDF attachment through the extracted-text store."""
+    with closing(iter_attachment_pages(attachment_id, file_path)) as pages:
+        return list(pages)
+
+
+def get_attachment_text(
+    attachment_id: int | None,
+    file_path: Path,
+    budget: int | None = None,
+    measure: Callable[[str], int] = len
+) -> str:
+    """
+    Get the text of a PDF attachment from the extracted-text store.
+
+    Pages are read lazily and only until `budget` is met (see format_pdf_text).
+    Falls back to a one-off extraction when there is no attachment id
+    (e.g. an uploaded assignment file). Error cases return the same
+    bracketed messages as extract_pdf_text.
+    """
+    if attachment_id is None:
+        return extract_pdf_text(file_path, budget, measure)
+
+    if not PDF_SUPPORT:
+        return NO_PDF_SUPPORT_MESSAGE
+
+    try:
+        with closing(iter_attachment_pages(attachment_id, file_path)) as pages:
+            return format_pdf_text(pages, budget, measure)
+    except Exception as e:
+        print(f"[PDF Service] Error reading PDF: {str(e)}")
+        return f"[Error reading PDF: {str(e)}]"
+
+
+def delete_attachment_pages(db: Session, attachment_id: int):
+    """Remove stored text for an attachment (caller commits)."""
+    db.query(AttachmentPage).filter(
+        AttachmentPage.attachment_id == attachment_id
+    ).delete()
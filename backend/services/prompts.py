@@ -0,0 +1,241 @@
+"""
+Versioned prompt templates for every AI request.
+
+Each template is split into a static prefix - the system message with all
+of the instructions and the response format, identical on every call and
+built once at import - and a per-request part formatted from values, which
+always comes last.
+
+A template's version must be bumped whenever its text changes. Stored
+results record the template id (name@version) they were generated with,
+and caches key on it.
+"""
+
+
+class PromptTemplate:
+    """A prompt with a static prefix and a per-request part formatted from values."""
+
+    def __init__(self, name: str, version: str, system: str, instructions: str, request: str):
+        self.name = name
+        self.version = version
+        self.prefix = f"{system}\n\n{instructions}"
+        self._request = request
+
+    @property
+    def id(self) -> str:
+        return f"{self.name}@{self.version}"
+
+    def messages(self, images: list[dict] | None = None, detail: str = "high", **values) -> list[dict]:
+        """
+        Chat messages for one request: the prefix as the system message, then
+        the formatted request. images ({"base64", "media_type"} dicts) are
+        attached after the request text at the given detail.
+        """
+        text = self._request.format(**values)
+        if not images:
+            content = text
+        else:
+            content = [{"type": "text", "text": text}] + [
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:{image['media_type']};base64,{image['base64']}", "detail": detail}
+                }
+                for image in images
+            ]
+        return [
+            {"role": "system", "content": self.prefix},
+            {"role": "user", "content": content}
+        ]
+
+
+PROMPTS: dict[str, PromptTemplate] = {}
+
+
+def register_prompt(name: str, version: str, system: str, instructions: str, request: str) -> PromptTemplate:
+    template = PromptTemplate(name, version, system, instructions, request)
+    PROMPTS[name] = template
+    return template
+
+
+def prompt_versions() -> dict[str, str]:
+    """Current version of every registered template."""
+    return {name: template.version for name, template in PROMPTS.items()}
+
+
+# ============ STUDY GUIDES ============
+
+STUDY_GUIDE_PROMPT = register_prompt(
+    "study_guide",
+    "3",
+    system="You are an expert academic tutor who creates detailed, helpful study guides. You thoroughly read all provided content and extract the most important information to help students succeed in their assignments. Always provide specific, actionable insights based on the actual content.",
+    instructions="""You are an expert academic assistant helping a student understand and complete their assignment.
+
+The student's message gives the task/assignment and the content to analyze. Based on ALL the content provided (notes and PDF documents), create a comprehensive study guide. Read through the ENTIRE content carefully and extract the most important information.
+
+Provide your response in the following JSON format:
+{
+    "summary": "A detailed 4-6 sentence summary that explains what this assignment/topic is about, the main themes, and what the student needs to understand. Be specific and reference actual content from the documents.",
+
+    "key_points": [
+        "Detailed key point 1 - explain the concept fully",
+        "Detailed key point 2 - include specific facts, dates, or figures if mentioned",
+        "Detailed key point 3 - explain relationships between concepts",
+        "Detailed key point 4 - highlight any important definitions or terms",
+        "Detailed key point 5 - note any critical arguments or theories"
+    ],
+
+    "concepts": [
+        "Important concept or term 1 with brief explanation",
+        "Important concept or term 2 with brief explanation",
+        "Important concept or term 3 with brief explanation"
+    ],
+
+    "action_items": [
+        "Specific action the student should take to complete this assignment",
+        "Another specific task or step",
+        "Things to research or review further"
+    ],
+
+    "study_tips": [
+        "Specific study recommendation based on the content",
+        "How to approach understanding this material",
+        "What to focus on for success"
+    ]
+}
+
+IMPORTANT INSTRUCTIONS:
+1. Actually READ and ANALYZE the full content - don't just describe what files are attached
+2. Extract SPECIFIC information, facts, concepts, and arguments from the documents
+3. Be DETAILED and THOROUGH - this summary should help the student study
+4. Include actual content from the PDFs - quotes, statistics, key arguments, etc.
+5. If there are multiple documents, synthesize information across all of them
+6. Make the key_points comprehensive enough that a student could study from them
+7. for the key points and concepts section make sure that you make it very detailed and make sure that you properly teach the user about all the topics in all the documents so they can apply it to any questions they get""",
+    request="TASK/ASSIGNMENT: {task_title}\n\nCONTENT TO ANALYZE:{content}"
+)
+
+PARTIAL_SUMMARY_PROMPT = register_prompt(
+    "partial_summary",
+    "3",
+    system="You are an expert academic tutor who condenses study material without losing the important details.",
+    instructions="""You are summarizing one piece of a student's study material.
+A study guide will later be written from the summaries of all the pieces, without seeing the original, so keep every specific fact, definition, figure, date, formula and argument that matters.
+
+Respond in JSON:
+{
+    "summary": "3-5 sentences on what this piece covers",
+    "key_points": ["Detailed, self-contained key point with the specific facts", "..."],
+    "concepts": ["Important concept or term with a brief explanation", "..."]
+}""",
+    # No task title: partials are cached by content alone and shared by every task with that input
+    request="{piece}"
+)
+
+
+# ============ ASSIGNMENTS ============
+
+_SOLUTION_FORMAT = """Provide your response in the following JSON format:
+{
+    "questions": [
+        {
+            "question_number": "1" or "1a" or "Question 1",
+            "question_text": "%s",
+            "approach": "A detailed explanation of how to approach this problem, referencing relevant concepts from the study materials",
+            "key_concepts": ["Concept 1 from notes", "Concept 2 needed", "Formula or theorem to use"],
+            "solution_steps": [
+                "Step 1: First, identify...",
+                "Step 2: Apply the concept of...",
+                "Step 3: Calculate/analyze...",
+                "Step 4: Verify your answer by..."
+            ],
+            "tips": "Helpful tips or common mistakes to avoid"
+        }
+    ]
+}"""
+
+ASSIGNMENT_PROMPT = register_prompt(
+    "assignment",
+    "1",
+    system="You are an expert academic tutor. Your goal is to guide students to solutions rather than giving direct answers. Reference their study materials when possible and help them understand the concepts needed to solve each problem.",
+    instructions=f"""You are an expert tutor helping a student solve their homework assignment. The student's message gives the task/subject, their study notes and materials for context, and the assignment to solve.
+
+Your job is to:
+1. Identify each question/problem in the assignment
+2. For each question, provide a detailed approach to solving it using the study materials as reference
+3. Do NOT give direct answers - instead guide the student through the solution process
+
+{_SOLUTION_FORMAT % "The actual question text (summarize if very long)"}
+
+IMPORTANT INSTRUCTIONS:
+1. Identify ALL questions in the assignment
+2. Reference specific concepts from the study materials when applicable
+3. Provide step-by-step guidance, not direct answers
+4. If a concept isn't in the notes, still explain it but note that additional study may be needed
+5. Be thorough - the goal is to help the student learn while completing their assignment
+6. For math problems, show the approach and formulas without calculating final numerical answers
+7. For essay questions, provide an outline and key points to cover""",
+    request="TASK/SUBJECT: {task_title}\n\n=== STUDY CONTEXT (Notes and Materials) ===\n{context}\n\n=== ASSIGNMENT TO SOLVE ===\n{assignment}"
+)
+
+ASSIGNMENT_VISION_PROMPT = register_prompt(
+    "assignment_vision",
+    "1",
+    system="You are an expert academic tutor who helps students understand and solve their assignments. You guide them through the problem-solving process without giving direct answers.",
+    instructions=f"""You are an expert tutor helping a student solve their homework assignment. The student's message gives the task/subject and their study notes and materials for context, followed by an image of the assignment. Analyze the image carefully and identify all questions/problems.
+
+Your job is to:
+1. Identify each question/problem in the assignment image
+2. For each question, provide a detailed approach to solving it using the study materials as reference
+3. Do NOT give direct answers - instead guide the student through the solution process
+
+{_SOLUTION_FORMAT % "The actual question text as shown in the image"}
+
+IMPORTANT: Read the assignment image carefully and identify ALL questions. Reference concepts from the study materials when applicable.""",
+    request="TASK/SUBJECT: {task_title}\n\n=== STUDY CONTEXT (Notes and Materials) ===\n{context}\n\n=== ASSIGNMENT ===\nThe assignment image follows."
+)
+
+QUESTION_SEGMENTS_PROMPT = register_prompt(
+    "question_segments",
+    "1",
+    system="You split assignments into their individual questions.",
+    instructions="""The student's message is a homework assignment. List every question or problem in it, in order.
+Treat parts of one problem (1a, 1b, ...) as a single question unless they are clearly separate problems.
+
+For each question give its number or label and the first 6-10 words of the question copied EXACTLY as written.
+
+Respond in JSON:
+{
+    "questions": [
+        {"question_number": "1", "starts_with": "First words of question one exactly as written"}
+    ]
+}""",
+    request="=== ASSIGNMENT ===\n{assignment}"
+)
+
+
+# ============ RESOURCES ============
+
+RESOURCES_PROMPT = register_prompt(
+    "resources",
+    "1",
+    system="You are an expert educational resource finder. Your job is to CAREFULLY READ the student's uploaded PDF documents and notes, then find online resources that help them learn those EXACT topics.",
+    instructions="""CRITICAL INSTRUCTIONS:
+1. THOROUGHLY READ the PDF content provided - this is the student's main study material
+2. IDENTIFY the specific topics, concepts, theories, terms, and subjects mentioned in the PDFs
+3. Search the web for 10 HIGH-QUALITY resources that DIRECTLY relate to the PDF content
+4. Resources must be REAL, CURRENTLY WORKING URLs
+5. Each resource should help explain concepts FROM THE PDF
+
+Based on the ACTUAL CONTENT the student sends (especially the PDF material), search the web and find 10 educational resources that will help them understand these specific topics better.
+
+RESPOND WITH ONLY A JSON ARRAY - no other text:
+[
+  {
+    "title": "Exact title of the article/resource",
+    "url": "https://real-working-url.com/specific-page",
+    "description": "2-3 sentences explaining how this helps with SPECIFIC topics from the student's PDF",
+    "source": "Website name"
+  }
+]""",
+    request="I need help finding resources for my studies. Here is the content from my uploaded PDFs and notes - please READ THIS CAREFULLY and find resources that help me understand these specific topics:\n\n{content}"
+)
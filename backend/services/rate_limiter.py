@@ -0,0 +1,313 @@
+"""
+Rate limiting and retries for upstream AI providers.
+
+Every provider/model pair has a token bucket in the database for requests
+per minute and one for model tokens per minute. Because the buckets live
+in the database (rows updated with a conditional UPDATE, like job claims),
+all gunicorn workers draw from the same budget instead of each sending its
+own share. When a provider still answers 429 with Retry-After, the bucket
+is blocked for that long, so every worker backs off - not just the one
+that got the error. Failed calls are retried with exponential backoff.
+"""
+import random
+import threading
+import time
+from collections.abc import Callable
+from email.utils import parsedate_to_datetime
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from models.rate_limit import RateLimitBucket
+from config import (
+    RATE_LIMIT_ENABLED, OPENAI_RPM, OPENAI_TPM, PERPLEXITY_RPM, PERPLEXITY_TPM, RATE_LIMIT_OVERRIDES,
+    RATE_LIMIT_MAX_WAIT, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX, LLM_MAX_RETRIES
+)
+
+# HTTP statuses worth retrying
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+DEFAULT_LIMITS = {
+    "openai": (OPENAI_RPM, OPENAI_TPM),
+    "perplexity": (PERPLEXITY_RPM, PERPLEXITY_TPM),
+}
+
+
+class RateLimitedError(Exception):
+    """Raised when a call can't get through within RATE_LIMIT_MAX_WAIT."""
+
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    "calls": 0,
+    "throttled": 0,
+    "throttle_seconds_total": 0.0,
+    "retries": 0,
+    "provider_rate_limits": 0,
+    "rejected": 0
+}
+
+
+def _count(key: str, amount: float = 1):
+    with _metrics_lock:
+        _metrics[key] += amount
+
+
+def get_limits(provider: str, model: str) -> tuple[int, int]:
+    """(requests per minute, tokens per minute) for a provider and model; 0 means unlimited."""
+    rpm, tpm = DEFAULT_LIMITS.get(provider, (0, 0))
+    override = RATE_LIMIT_OVERRIDES.get(f"{provider}:{model}", {})
+    return override.get("rpm", rpm), override.get("tpm", tpm)
+
+
+def parse_retry_after(headers) -> float:
+    """Seconds to wait according to a response's retry-after-ms or Retry-After header (0 if absent)."""
+    if not headers:
+        return 0.0
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return 0.0
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _take(db: Session, key: str, rpm: int, tpm: int, tokens: int) -> float:
+    """
+    Try to take one request and `tokens` tokens from a bucket.
+
+    Returns 0 if they were taken, otherwise the seconds until they will be
+    available. Buckets refill continuously and hold at most a minute's worth.
+    """
+    # A request larger than the whole budget still goes through once the bucket is full
+    tokens = min(tokens, tpm) if tpm else 0
+
+    for _ in range(10):
+        db.expire_all()
+        now = time.time()
+        bucket = db.query(RateLimitBucket).filter(RateLimitBucket.key == key).first()
+        if bucket is None:
+            db.add(RateLimitBucket(key=key, requests=float(rpm), tokens=float(tpm), updated_at=now, blocked_until=0.0))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another worker created it first
+                db.rollback()
+            continue
+
+        if bucket.blocked_until > now:
+            return bucket.blocked_until - now
+
+        elapsed = max(0.0, now - bucket.updated_at)
+        requests = min(float(rpm), bucket.requests + elapsed * rpm / 60)
+        available = min(float(tpm), bucket.tokens + elapsed * tpm / 60)
+
+        waits = []
+        if rpm and requests < 1:
+            waits.append((1 - requests) * 60 / rpm)
+        if tpm and available < tokens:
+            waits.append((tokens - available) * 60 / tpm)
+        if waits:
+            return max(waits)
+
+        # Only applies if no other worker changed the bucket since it was read
+        taken = db.query(RateLimitBucket).filter(
+            RateLimitBucket.key == key,
+            RateLimitBucket.updated_at == bucket.updated_at
+        ).update({
+            RateLimitBucket.requests: requests - 1 if rpm else 0.0,
+            RateLimitBucket.tokens: available - tokens if tpm else 0.0,
+            RateLimitBucket.updated_at: now
+        }, synchronize_session=False)
+        db.commit()
+        if taken:
+            return 0.0
+
+    # Heavy contention - try again shortly
+    return 0.05
+
+
+def acquire(provider: str, model: str, tokens: int, deadline: float):
+    """Wait until the provider/model budget allows a request of `tokens` tokens, or raise RateLimitedError."""
+    rpm, tpm = get_limits(provider, model)
+    if not rpm and not tpm:
+        return
+
+    key = f"{provider}:{model}"
+    started = time.monotonic()
+    db: Session = SessionLocal()
+    try:
+        while True:
+            try:
+                wait = _take(db, key, rpm, tpm, tokens)
+            except SQLAlchemyError as e:
+                # Never let the limiter's own storage take AI features down
+                db.rollback()
+                print(f"[Rate Limiter] Bucket store unavailable, not limiting {key}: {str(e)}")
+                return
+            if wait <= 0:
+                break
+            if time.monotonic() + wait > deadline:
+                _count("rejected")
+                raise RateLimitedError(f"{provider} rate limit reached for {model}. Please try again shortly.")
+            # Small jitter so waiting workers don't all retry at the same instant
+            time.sleep(wait + random.uniform(0, 0.05))
+    finally:
+        db.close()
+
+    waited = time.monotonic() - started
+    if waited > 0.01:
+        _count("throttled")
+        _count("throttle_seconds_total", waited)
+        print(f"[Rate Limiter] Waited {waited:.2f}s for {key} budget")
+
+
+def settle(provider: str, model: str, reserved: int, used: int | None):
+    """Correct a bucket once a request's real token count is known."""
+    rpm, tpm = get_limits(provider, model)
+    if not tpm or used is None:
+        return
+    reserved = min(reserved, tpm)
+    if used == reserved:
+        return
+
+    key = f"{provider}:{model}"
+    db: Session = SessionLocal()
+    try:
+        for _ in range(10):
+            db.expire_all()
+            now = time.time()
+            bucket = db.query(RateLimitBucket).filter(RateLimitBucket.key == key).first()
+            if bucket is None:
+                return
+
+            # Refilled up to now, as _take would, since moving updated_at ends that refill period
+            elapsed = max(0.0, now - bucket.updated_at)
+            requests = min(float(rpm), bucket.requests + elapsed * rpm / 60) if rpm else 0.0
+            available = min(float(tpm), bucket.tokens + elapsed * tpm / 60)
+
+            # Guarded like _take, so neither overwrites the other's change
+            settled = db.query(RateLimitBucket).filter(
+                RateLimitBucket.key == key,
+                RateLimitBucket.updated_at == bucket.updated_at
+            ).update({
+                RateLimitBucket.requests: requests,
+                RateLimitBucket.tokens: min(float(tpm), available + (reserved - used)),
+                RateLimitBucket.updated_at: now
+            }, synchronize_session=False)
+            db.commit()
+            if settled:
+                return
+    finally:
+        db.close()
+
+
+def block(provider: str, model: str, seconds: float) -> bool:
+    """Stop every worker calling a provider/model for the given time (after a 429). False if it has no bucket."""
+    key = f"{provider}:{model}"
+    until = time.time() + seconds
+    db: Session = SessionLocal()
+    try:
+        db.query(RateLimitBucket).filter(
+            RateLimitBucket.key == key,
+            RateLimitBucket.blocked_until < until
+        ).update({RateLimitBucket.blocked_until: until}, synchronize_session=False)
+        db.commit()
+        return db.query(RateLimitBucket.key).filter(RateLimitBucket.key == key).first() is not None
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"[Rate Limiter] Could not block {key}: {str(e)}")
+        return False
+    finally:
+        db.close()
+
+
+def backoff_delay(attempt: int, retry_after: float = 0.0) -> float:
+    """Exponential backoff with jitter for a 1-based retry attempt, never shorter than Retry-After."""
+    delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+    return max(delay, retry_after)
+
+
+def call_with_retries(
+    provider: str,
+    model: str,
+    estimated_tokens: int,
+    send: Callable[[], object],
+    retry_after: Callable[[Exception], float | None],
+    used_tokens: Callable[[object], int | None] | None = None
+):
+    """
+    Make an upstream call within the shared rate limit, retrying failures.
+
+    retry_after(error) says whether an error is worth retrying: None if not,
+    otherwise the provider's Retry-After in seconds (0 if it gave none). A
+    non-zero Retry-After blocks the provider/model for every worker.
+    used_tokens(result) gives the real token count, to correct the budget.
+    The last error is re-raised once retries or RATE_LIMIT_MAX_WAIT run out.
+    """
+    _count("calls")
+    deadline = time.monotonic() + RATE_LIMIT_MAX_WAIT
+    attempt = 0
+
+    while True:
+        if RATE_LIMIT_ENABLED:
+            acquire(provider, model, estimated_tokens, deadline)
+
+        try:
+            result = send()
+        except Exception as e:
+            hint = retry_after(e)
+            if hint is None:
+                raise
+
+            attempt += 1
+            blocked = False
+            if hint > 0:
+                _count("provider_rate_limits")
+                if RATE_LIMIT_ENABLED:
+                    blocked = block(provider, model, hint)
+
+            delay = backoff_delay(attempt, hint)
+            if attempt > LLM_MAX_RETRIES or time.monotonic() + delay > deadline:
+                print(f"[Rate Limiter] Giving up on {provider}:{model} after {attempt} attempts: {str(e)}")
+                raise
+
+            _count("retries")
+            print(f"[Rate Limiter] {provider}:{model} failed ({str(e)[:100]}), retry {attempt} in {delay:.1f}s")
+            # A block already makes acquire() wait out Retry-After
+            time.sleep(delay - hint if blocked else delay)
+            continue
+
+        if RATE_LIMIT_ENABLED and used_tokens:
+            try:
+                settle(provider, model, estimated_tokens, used_tokens(result))
+            except Exception as e:
+                print(f"[Rate Limiter] Could not settle token usage: {str(e)}")
+        return result
+
+
+def get_rate_limit_status(db: Session) -> dict:
+    """Configured limits, current bucket levels and this process's throttling counters."""
+    now = time.time()
+    buckets = []
+    for bucket in db.query(RateLimitBucket).order_by(RateLimitBucket.key).all():
+        provider, _, model = bucket.key.partition(":")
+        rpm, tpm = get_limits(provider, model)
+        elapsed = max(0.0, now - bucket.updated_at)
+        buckets.append({
+            "key": bucket.key,
+            "rpm": rpm,
+            "tpm": tpm,
+            "requests_available": round(min(float(rpm), bucket.requests + elapsed * rpm / 60), 2),
+            "tokens_available": round(min(float(tpm), bucket.tokens + elapsed * tpm / 60)),
+            "blocked_for_seconds": round(max(0.0, bucket.blocked_until - now), 2)
+        })
+
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    return {"enabled": RATE_LIMIT_ENABLED, "buckets": buckets, "process": metrics}
@@ -0,0 +1,212 @@
+"""
+Cache of verified resource suggestions, keyed by the study material they were found for.
+
+Students in the same course upload the same syllabus and lecture PDFs, so
+resources found for one task are reused for any other task whose material
+matches. The material (notes plus extracted PDF text, without file names)
+is normalized to lowercase words, then matched by:
+    1. exact content hash, then
+    2. near-duplicate: MinHash of the material's word shingles, compared
+       with the entries sharing at least one LSH band (a run of
+       BAND_ROWS signature values) with it; the closest one whose estimated
+       Jaccard similarity is at least RESOURCE_CACHE_SIMILARITY matches.
+
+Band keys are indexed, so a lookup only reads its candidates, not the
+whole cache. With 16 bands of 4 rows, material that is 85% similar shares
+a band with near certainty, and material 30% similar about one time in eight.
+
+Entries expire after RESOURCE_CACHE_TTL_HOURS (links go stale), and the
+least recently used are evicted beyond RESOURCE_CACHE_MAX_ENTRIES.
+"""
+import hashlib
+import random
+import re
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models.resource_cache import ResourceCache
+from models.resource_cache_band import ResourceCacheBand
+from config import RESOURCE_CACHE_TTL_HOURS, RESOURCE_CACHE_SIMILARITY, RESOURCE_CACHE_MAX_ENTRIES
+from services.prompts import RESOURCES_PROMPT
+
+RESOURCE_FIELDS = ("title", "url", "description", "source")
+
+# Words per shingle, and hash functions per MinHash signature (more = closer estimates)
+SHINGLE_WORDS = 5
+MINHASH_PERMUTATIONS = 64
+# Signature values per LSH band; MINHASH_PERMUTATIONS / BAND_ROWS bands
+BAND_ROWS = 4
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240617)  # Fixed, so signatures stay comparable across processes
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+
+def material_text(notes_content: str, pdf_documents: list[tuple[str, str]]) -> str:
+    """The study material resources are found for, independent of file names and upload order."""
+    return "\n\n".join([notes_content or ""] + sorted(text for _, text in pdf_documents))
+
+
+def _words(text: str) -> list[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def material_fingerprint(words: list[str]) -> str:
+    key = f"{RESOURCES_PROMPT.id}\n{' '.join(words)}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def minhash_signature(words: list[str]) -> list[int]:
+    """MinHash of the text's SHINGLE_WORDS-word shingles (the whole text is one shingle if shorter)."""
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for shingle in shingles
+    ]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_keys(signature: list[int]) -> list[str]:
+    """LSH band keys of a MinHash signature: a hash of each band's number and values."""
+    keys = []
+    for start in range(0, len(signature), BAND_ROWS):
+        band = f"{start // BAND_ROWS}:{','.join(map(str, signature[start:start + BAND_ROWS]))}"
+        keys.append(hashlib.blake2b(band.encode(), digest_size=8).hexdigest())
+    return keys
+
+
+def estimate_similarity(first: list[int], second: list[int]) -> float:
+    """Estimated Jaccard similarity of two texts' shingle sets, from their MinHash signatures."""
+    if len(first) != len(second) or not first:
+        return 0.0
+    return sum(1 for a, b in zip(first, second) if a == b) / len(first)
+
+
+def _expiry_cutoff() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(hours=RESOURCE_CACHE_TTL_HOURS)
+
+
+def _is_expired(entry: ResourceCache, cutoff: datetime) -> bool:
+    created_at = entry.created_at
+    if created_at and created_at.tzinfo is None:
+        # SQLite hands back naive UTC timestamps
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return bool(created_at and created_at < cutoff)
+
+
+def _find_near_duplicate(db: Session, signature: list[int], cutoff: datetime) -> tuple[ResourceCache | None, float]:
+    candidate_ids = db.query(ResourceCacheBand.entry_id).filter(
+        ResourceCacheBand.band_key.in_(band_keys(signature))
+    ).distinct()
+    candidates = db.query(ResourceCache.id, ResourceCache.minhash, ResourceCache.created_at).filter(
+        ResourceCache.id.in_(candidate_ids),
+        ResourceCache.prompt_version == RESOURCES_PROMPT.id
+    ).all()
+
+    best_id, best_similarity = None, 0.0
+    for row in candidates:
+        if _is_expired(row, cutoff):
+            continue
+        similarity = estimate_similarity(signature, row.minhash)
+        if similarity > best_similarity:
+            best_id, best_similarity = row.id, similarity
+
+    if best_id is None or best_similarity < RESOURCE_CACHE_SIMILARITY:
+        return None, best_similarity
+    return db.query(ResourceCache).filter(ResourceCache.id == best_id).first(), best_similarity
+
+
+def get_cached_resources(db: Session, material: str) -> tuple[list[dict] | None, str | None]:
+    """
+    Stored resources for matching material, and how it matched ("exact" or
+    "similar"), or (None, None). Expired entries don't count.
+    """
+    words = _words(material)
+    if not words:
+        return None, None
+
+    cutoff = _expiry_cutoff()
+    match = "exact"
+    entry = db.query(ResourceCache).filter(ResourceCache.fingerprint == material_fingerprint(words)).first()
+    if entry and _is_expired(entry, cutoff):
+        entry = None
+
+    if entry is None and RESOURCE_CACHE_SIMILARITY < 1:
+        entry, similarity = _find_near_duplicate(db, minhash_signature(words), cutoff)
+        match = f"similar ({similarity:.0%})"
+
+    if entry is None:
+        return None, None
+
+    entry.hit_count += 1
+    entry.last_used_at = datetime.now(timezone.utc)
+    db.commit()
+    return [dict(resource) for resource in entry.resources], match
+
+
+def store_resources(db: Session, material: str, resources: list[dict]):
+    """Cache the verified resources found for some material, then evict expired and least recently used entries."""
+    words = _words(material)
+    if not words or not resources:
+        return
+
+    fingerprint = material_fingerprint(words)
+    data = [{field: resource.get(field) for field in RESOURCE_FIELDS} for resource in resources]
+    now = datetime.now(timezone.utc)
+
+    entry = db.query(ResourceCache).filter(ResourceCache.fingerprint == fingerprint).first()
+    if entry:
+        # Expired (or searched again on purpose) - replace it
+        entry.resources = data
+        entry.created_at = now
+        entry.last_used_at = now
+        entry.hit_count = 0
+    else:
+        entry = ResourceCache(
+            fingerprint=fingerprint,
+            prompt_version=RESOURCES_PROMPT.id,
+            minhash=minhash_signature(words),
+            resources=data,
+            created_at=now,
+            last_used_at=now
+        )
+        db.add(entry)
+
+    try:
+        db.flush()
+        if db.query(ResourceCacheBand.id).filter(ResourceCacheBand.entry_id == entry.id).first() is None:
+            # A new entry, or one cached before band keys were kept
+            db.add_all(ResourceCacheBand(entry_id=entry.id, band_key=key) for key in set(band_keys(entry.minhash)))
+        db.commit()
+    except IntegrityError:
+        # Another request cached the same material first
+        db.rollback()
+        return
+
+    evict_resources(db)
+
+
+def evict_resources(db: Session) -> int:
+    """Drop expired entries and trim the cache to RESOURCE_CACHE_MAX_ENTRIES. Returns entries removed."""
+    removed = _delete_entries(db, db.query(ResourceCache.id).filter(ResourceCache.created_at < _expiry_cutoff()).all())
+
+    excess = db.query(ResourceCache).count() - RESOURCE_CACHE_MAX_ENTRIES
+    if excess > 0:
+        removed += _delete_entries(db, db.query(ResourceCache.id).order_by(ResourceCache.last_used_at).limit(excess).all())
+
+    db.commit()
+    if removed:
+        print(f"[Resource Cache] Evicted {removed} entries")
+    return removed
+
+
+def _delete_entries(db: Session, rows: list) -> int:
+    """Delete entries and their band keys (SQLite doesn't enforce the cascade)."""
+    ids = [row.id for row in rows]
+    if not ids:
+        return 0
+    db.query(ResourceCacheBand).filter(ResourceCacheBand.entry_id.in_(ids)).delete(synchronize_session=False)
+    return db.query(ResourceCache).filter(ResourceCache.id.in_(ids)).delete(synchronize_session=False)
@@ -1,23 +1,69 @@
-import json
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from urllib.parse import urlparse
-from config import PERPLEXITY_API_KEY
-
+from config import (
+    PERPLEXITY_API_KEY, PERPLEXITY_API_URL, PERPLEXITY_TIMEOUT, RESOURCE_VERIFY_WORKERS, RESOURCE_VERIFY_DEADLINE,
+    URL_CHECK_TIMEOUT
+)
+from services.http_client import get_session, request_timeout
+from services.token_budget import input_budget, pack_sections, response_usage, token_report, log_token_report
+from services.tokenizer import count_tokens
+from services.rate_limiter import RETRY_STATUSES, call_with_retries, parse_retry_after
+from services.json_stream import parse_json_response
+from services.prompts import RESOURCES_PROMPT
+from services.usage_ledger import record_call
+from services.url_liveness import lookup_liveness, store_liveness
+
+# Tokens of notes/PDF content sent to Perplexity. Counted with the OpenAI
+# tokenizer, which is close enough for Perplexity's models to budget with.
+MAX_PROMPT_CONTENT_TOKENS = 4000
+RESOURCE_RESPONSE_TOKENS = 3000
+
+
+_CHECK_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+
+
+def check_url(url: str, timeout: float = URL_CHECK_TIMEOUT) -> dict:
+    """
+    Check if a URL is accessible: {"live", "status_code", "final_url", "unreachable"}.
 
-def verify_url(url: str, timeout: int = 5) -> bool:
-    """Check if a URL is accessible."""
+    unreachable means the host couldn't be connected to at all (as opposed
+    to answering with an error or being slow). timeout is shared by the HEAD
+    request and the GET fallback: the GET only gets the time the HEAD left.
+    """
+    result = {"live": False, "status_code": None, "final_url": None, "unreachable": False}
+    session = get_session("url_check")
+    options = {"headers": _CHECK_HEADERS, "allow_redirects": True}
+    deadline = time.monotonic() + timeout
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        }
-        response = requests.head(url, headers=headers, timeout=timeout, allow_redirects=True)
-        return response.status_code < 400
-    except:
+        response = session.head(url, timeout=request_timeout(timeout), **options)
+    except Exception as e:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return result
         try:
-            response = requests.get(url, headers=headers, timeout=timeout, allow_redirects=True, stream=True)
-            return response.status_code < 400
-        except:
-            return False
+            # Only the status is needed; the body is never read, and closing hands the connection back
+            response = session.get(url, stream=True, timeout=request_timeout(remaining), **options)
+        except Exception as retry_error:
+            result["unreachable"] = all(
+                isinstance(error, requests.ConnectionError) and not isinstance(error, requests.Timeout)
+                for error in (e, retry_error)
+            )
+            return result
+
+    with response:
+        result["live"] = response.status_code < 400
+        result["status_code"] = response.status_code
+        result["final_url"] = response.url
+    return result
+
+
+def verify_url(url: str, timeout: float = URL_CHECK_TIMEOUT) -> bool:
+    """Check if a URL is accessible."""
+    return check_url(url, timeout)["live"]
 
 
 def get_source_from_url(url: str) -> str:
@@ -57,10 +103,62 @@ def get_source_from_url(url: str) -> str:
         return "Web"
 
 
-def find_resources_with_perplexity(notes_content: str, pdf_content: str) -> list[dict]:
+def _perplexity_outcome(response: requests.Response) -> tuple[dict | None, str]:
+    """Usage and ledger outcome of a Perplexity response."""
+    if response.status_code == 429:
+        return None, "rate_limited"
+    if response.status_code != 200:
+        return None, "error"
+    try:
+        result = response.json()
+    except ValueError:
+        return None, "error"
+    finish_reason = (result.get("choices") or [{}])[0].get("finish_reason")
+    return response_usage(result), "truncated" if finish_reason == "length" else "ok"
+
+
+def _post_perplexity(headers: dict, payload: dict) -> requests.Response:
+    started = time.perf_counter()
+    try:
+        response = get_session("perplexity").post(
+            PERPLEXITY_API_URL,
+            headers=headers,
+            json=payload,
+            timeout=request_timeout(PERPLEXITY_TIMEOUT)
+        )
+    except requests.RequestException as e:
+        outcome = "timeout" if isinstance(e, requests.Timeout) else "error"
+        record_call("perplexity", payload["model"], time.perf_counter() - started, outcome=outcome)
+        raise
+    usage, outcome = _perplexity_outcome(response)
+    record_call("perplexity", payload["model"], time.perf_counter() - started, usage, outcome)
+
+    if response.status_code in RETRY_STATUSES:
+        # Raise so the rate limiter retries it
+        response.raise_for_status()
+    return response
+
+
+def _perplexity_retry_after(error: Exception) -> float | None:
+    """How the rate limiter should treat a Perplexity error: None if not worth retrying, else Retry-After seconds."""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return 0.0
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return parse_retry_after(error.response.headers)
+    return None
+
+
+def find_resources_with_perplexity(
+    notes_content: str,
+    pdf_content: str,
+    pdf_documents: list[tuple[str, str]] | None = None
+) -> list[dict]:
     """
     Use Perplexity API to find relevant educational resources.
     Perplexity has built-in web search and provides real, live sources.
+
+    pdf_documents ((filename, text) pairs) lets the prompt keep the most
+    relevant passages of each PDF; otherwise pdf_content is used as one block.
     """
     if not PERPLEXITY_API_KEY:
         print("[Resource Service] No Perplexity API key")
@@ -72,18 +170,31 @@ def find_resources_with_perplexity(notes_content: str, pdf_content: str) -> list
         return []
 
     # Build content summary - prioritize PDF content since it's the main study material
-    content_to_analyze = ""
+    sections = []
 
     # Add PDF content FIRST since it's the primary source
-    if pdf_content and pdf_content.strip():
-        content_to_analyze += f"=== MAIN STUDY MATERIAL FROM UPLOADED PDFs ===\n{pdf_content}\n\n"
+    if pdf_documents:
+        for filename, text in pdf_documents:
+            sections.append((f"=== MAIN STUDY MATERIAL FROM UPLOADED PDF: {filename} ===", text))
+        print(f"[Resource Service] Added {len(pdf_documents)} PDFs: {len(pdf_content)} chars")
+    elif pdf_content and pdf_content.strip():
+        sections.append(("=== MAIN STUDY MATERIAL FROM UPLOADED PDFs ===", pdf_content))
         print(f"[Resource Service] Added PDF content: {len(pdf_content)} chars")
 
     # Add notes as supplementary
     if notes_content and notes_content.strip():
-        content_to_analyze += f"=== STUDENT'S ADDITIONAL NOTES ===\n{notes_content}\n\n"
+        sections.append(("=== STUDENT'S ADDITIONAL NOTES ===", notes_content))
         print(f"[Resource Service] Added notes content: {len(notes_content)} chars")
 
+    # Share the token budget between sources, keeping the passages closest
+    # to what the student is studying
+    content_budget = input_budget(MAX_PROMPT_CONTENT_TOKENS, RESOURCE_RESPONSE_TOKENS)
+    content_to_analyze, section_tokens = pack_sections(
+        sections,
+        query=notes_content[:2000] if notes_content.strip() else pdf_content[:2000],
+        budget=content_budget
+    )
+
     print(f"[Resource Service] Total content to analyze: {len(content_to_analyze)} chars")
 
     # Log the actual content being sent (first 1000 chars)
@@ -99,46 +210,19 @@ def find_resources_with_perplexity(notes_content: str, pdf_content: str) -> list
 
         payload = {
             "model": "sonar",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": """You are an expert educational resource finder. Your job is to CAREFULLY READ the student's uploaded PDF documents and notes, then find online resources that help them learn those EXACT topics.
-
-CRITICAL INSTRUCTIONS:
-1. THOROUGHLY READ the PDF content provided - this is the student's main study material
-2. IDENTIFY the specific topics, concepts, theories, terms, and subjects mentioned in the PDFs
-3. Search the web for 10 HIGH-QUALITY resources that DIRECTLY relate to the PDF content
-4. Resources must be REAL, CURRENTLY WORKING URLs
-5. Each resource should help explain concepts FROM THE PDF
-
-RESPOND WITH ONLY A JSON ARRAY - no other text:
-[
-  {
-    "title": "Exact title of the article/resource",
-    "url": "https://real-working-url.com/specific-page",
-    "description": "2-3 sentences explaining how this helps with SPECIFIC topics from the student's PDF",
-    "source": "Website name"
-  }
-]"""
-                },
-                {
-                    "role": "user",
-                    "content": f"""I need help finding resources for my studies. Here is the content from my uploaded PDFs and notes - please READ THIS CAREFULLY and find resources that help me understand these specific topics:
-
-{content_to_analyze[:15000]}
-
-Based on the ACTUAL CONTENT above (especially the PDF material), search the web and find 10 educational resources that will help me understand these specific topics better. Return ONLY a JSON array with real, working URLs."""
-                }
-            ],
+            "messages": RESOURCES_PROMPT.messages(content=content_to_analyze),
             "temperature": 0.2,
-            "max_tokens": 3000
+            "max_tokens": RESOURCE_RESPONSE_TOKENS
         }
 
-        response = requests.post(
-            "https://api.perplexity.ai/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=60
+        # Shared rate limit across workers, with retries on 429s and server errors
+        response = call_with_retries(
+            "perplexity",
+            payload["model"],
+            sum(count_tokens(m["content"]) for m in payload["messages"]) + RESOURCE_RESPONSE_TOKENS,
+            lambda: _post_perplexity(headers, payload),
+            _perplexity_retry_after,
+            used_tokens=lambda r: (r.json().get("usage") or {}).get("total_tokens") if r.status_code == 200 else None
         )
 
         if response.status_code != 200:
@@ -147,45 +231,118 @@ Based on the ACTUAL CONTENT above (especially the PDF material), search the web
             return []
 
         result = response.json()
+        log_token_report(
+            "[Resource Service]",
+            token_report(section_tokens, content_budget, RESOURCE_RESPONSE_TOKENS, response_usage(result))
+        )
         content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
 
         print(f"[Resource Service] Perplexity response: {content[:500]}...")
 
-        # Parse JSON from response
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-
-        # Find JSON array
-        content = content.strip()
-        if not content.startswith("["):
-            start = content.find("[")
-            end = content.rfind("]") + 1
-            if start != -1 and end > start:
-                content = content[start:end]
-
-        resources = json.loads(content)
+        # Keep every complete resource, even if the response was cut off
+        resources, complete = parse_json_response(content, root="[")
 
         if isinstance(resources, list):
+            resources = [r for r in resources if isinstance(r, dict)]
+            if not complete:
+                print(f"[Resource Service] Response was cut off, kept {len(resources)} complete resources")
             print(f"[Resource Service] Perplexity found {len(resources)} resources")
             return resources
 
+        print("[Resource Service] JSON parse error: no resource list in response")
         return []
 
-    except json.JSONDecodeError as e:
-        print(f"[Resource Service] JSON parse error: {str(e)}")
-        return []
     except Exception as e:
         print(f"[Resource Service] Perplexity error: {str(e)}")
         return []
 
 
+def verify_resources(candidates: list[dict], num_resources: int) -> list[dict]:
+    """
+    Up to num_resources candidates whose URLs are live, kept in the order given.
+
+    URLs with a fresh result in the liveness cache aren't requested again:
+    cached live ones pass and cached dead ones (or ones on a dead domain)
+    are skipped. The rest are checked in parallel (RESOURCE_VERIFY_WORKERS
+    at a time, best ranked first), and checking stops once the best-ranked
+    num_resources live URLs are known - none ranked above them is still
+    being checked - or RESOURCE_VERIFY_DEADLINE runs out. A fast,
+    lower-ranked URL doesn't displace a slower, better one that passes in
+    time. URLs not confirmed by the deadline are skipped, and their checks
+    are left to time out in the background.
+    """
+    if not candidates or num_resources <= 0:
+        return []
+
+    deadline = time.monotonic() + RESOURCE_VERIFY_DEADLINE
+    try:
+        cached = lookup_liveness([resource["url"] for resource in candidates])
+    except Exception as e:
+        print(f"[Resource Service] URL liveness cache unavailable: {str(e)}")
+        cached = {}
+
+    def settled() -> bool:
+        # The first num_resources passing URLs, in rank order, have no unchecked URL ranked above them
+        passed = 0
+        for index in range(len(candidates)):
+            if index not in verified:
+                return False
+            passed += verified[index]
+            if passed >= num_resources:
+                return True
+        return True
+
+    verified: dict[int, bool] = {}
+    cold = []
+    for index, resource in enumerate(candidates):
+        if resource["url"] in cached:
+            verified[index] = cached[resource["url"]]
+            mark = "✓ Verified (cached)" if verified[index] else "✗ URL not accessible (cached)"
+            print(f"[Resource Service]   {mark}: {resource['url']}")
+        else:
+            cold.append(index)
+
+    # Results of this run's checks, for the cache
+    checked: dict[str, dict] = {}
+    if cold and not settled():
+        pool = ThreadPoolExecutor(max_workers=max(1, RESOURCE_VERIFY_WORKERS))
+        try:
+            futures = {
+                pool.submit(check_url, candidates[index]["url"], min(URL_CHECK_TIMEOUT, RESOURCE_VERIFY_DEADLINE)): index
+                for index in cold
+            }
+            pending = set(futures)
+            while pending and not settled():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"[Resource Service] URL checks out of time, skipping {len(pending)} unchecked URLs")
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = futures[future]
+                    result = future.result()
+                    checked[candidates[index]["url"]] = result
+                    verified[index] = result["live"]
+                    mark = "✓ Verified" if verified[index] else "✗ URL not accessible"
+                    print(f"[Resource Service]   {mark}: {candidates[index]['url']}")
+        finally:
+            # Don't wait for checks that are no longer needed
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    try:
+        store_liveness(checked)
+    except Exception as e:
+        print(f"[Resource Service] Could not cache URL checks: {str(e)}")
+
+    return [candidates[index] for index in sorted(verified) if verified[index]][:num_resources]
+
+
 def find_resources(
     task_title: str = "",  # Kept for API compatibility but not used
     notes_content: str = "",
     pdf_content: str = "",
-    num_resources: int = 5
+    num_resources: int = 5,
+    pdf_documents: list[tuple[str, str]] | None = None
 ) -> list[dict]:
     """
     Find relevant educational resources using Perplexity API.
@@ -209,46 +366,30 @@ def find_resources(
         return []
 
     # Get resources from Perplexity (asks for 10)
-    all_resources = find_resources_with_perplexity(notes_content, pdf_content)
+    all_resources = find_resources_with_perplexity(notes_content, pdf_content, pdf_documents)
 
     if not all_resources:
         print("[Resource Service] Perplexity returned no resources")
         return []
 
     # Verify URLs and collect valid resources
-    verified_resources = []
-
+    candidates = []
     for resource in all_resources:
-        if len(verified_resources) >= num_resources:
-            break
-
-        url = resource.get("url", "")
+        url = (resource.get("url") or "").strip()
         title = resource.get("title", "")
-
         if not url or not title:
             continue
 
         # Clean up URL
-        url = url.strip()
         if not url.startswith("http"):
             url = "https://" + url
-
-        print(f"[Resource Service] Verifying: {title}")
-        print(f"[Resource Service]   URL: {url}")
-
-        # Verify URL is live
-        if verify_url(url):
-            source = resource.get("source") or get_source_from_url(url)
-
-            verified_resources.append({
-                "title": title,
-                "url": url,
-                "description": resource.get("description", "Educational resource related to your study materials"),
-                "source": source
-            })
-            print(f"[Resource Service]   ✓ Verified and added")
-        else:
-            print(f"[Resource Service]   ✗ URL not accessible, skipping")
-
-    print(f"[Resource Service] Returning {len(verified_resources)} verified resources (top 5 of 10)")
+        candidates.append({
+            "title": title,
+            "url": url,
+            "description": resource.get("description", "Educational resource related to your study materials"),
+            "source": resource.get("source") or get_source_from_url(url)
+        })
+
+    verified_resources = verify_resources(candidates, num_resources)
+    print(f"[Resource Service] Returning {len(verified_resources)} verified resources (top {num_resources} of {len(candidates)})")
     return verified_resources
@@ -1,11 +1,22 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from sqlalchemy.orm import Session
 from db.database import SessionLocal
 from models.task import Task
 from models.user import User
+from models.task_note import TaskNote
+from models.task_attachment import TaskAttachment
+from models.task_summary import TaskSummary
+from models.job import Job
+from config import (
+    SUMMARY_PRECOMPUTE_ENABLED, SUMMARY_PRECOMPUTE_HORIZON_HOURS, SUMMARY_PRECOMPUTE_INTERVAL_MINUTES,
+    SUMMARY_PRECOMPUTE_MAX_JOBS, SUMMARY_PRECOMPUTE_RETRY_HOURS
+)
 from services.email_service import send_deadline_reminder
+from services.workspace_ai import (
+    SUMMARY_JOB_KIND, INTERACTIVE_JOB_PRIORITY, PRECOMPUTE_JOB_PRIORITY, queue_summary_job
+)
 
 
 # Track which tasks have already had reminders sent (in-memory for simplicity)
@@ -91,6 +102,103 @@ def clear_old_reminders():
         db.close()
 
 
+def _as_utc(value: datetime | None) -> datetime | None:
+    """Naive UTC datetime (SQLite returns naive timestamps, Postgres aware ones)."""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _summary_is_stale(db: Session, task: Task) -> bool:
+    """Whether a task has notes or attachments newer than its saved study guide."""
+    note = db.query(TaskNote).filter(TaskNote.task_id == task.id).first()
+    has_notes = bool(note and note.content.strip())
+    attachment_times = [
+        _as_utc(created_at) for (created_at,) in
+        db.query(TaskAttachment.created_at).filter(TaskAttachment.task_id == task.id).all()
+    ]
+    if not has_notes and not attachment_times:
+        return False
+
+    summary = db.query(TaskSummary).filter(TaskSummary.task_id == task.id).first()
+    if not summary:
+        # Never generated, or cleared when an attachment was deleted
+        return True
+
+    summarized_at = _as_utc(summary.updated_at)
+    if summarized_at is None:
+        return True
+    changes = [t for t in attachment_times if t]
+    if has_notes and note.updated_at:
+        changes.append(_as_utc(note.updated_at))
+    return any(changed > summarized_at for changed in changes)
+
+
+def precompute_upcoming_summaries():
+    """
+    Queue study guides for tasks due soon whose notes or attachments changed.
+
+    Runs at the lowest job priority and only while no interactive AI job is
+    waiting, at most SUMMARY_PRECOMPUTE_MAX_JOBS per run, so the click just
+    before a deadline finds a fresh saved study guide instead of waiting on
+    the model when everyone else is too. A task whose precompute failed is
+    left alone for SUMMARY_PRECOMPUTE_RETRY_HOURS, so a generation that
+    keeps failing isn't paid for again on every run.
+    """
+    db: Session = SessionLocal()
+    try:
+        busy = db.query(Job.id).filter(
+            Job.status.in_(["pending", "running"]),
+            Job.priority >= INTERACTIVE_JOB_PRIORITY
+        ).first()
+        if busy:
+            print("[Scheduler] Interactive AI jobs queued, skipping summary precompute")
+            return
+
+        now = datetime.utcnow()
+        upcoming_tasks = db.query(Task).filter(
+            Task.deadline.isnot(None),
+            Task.deadline > now,
+            Task.deadline <= now + timedelta(hours=SUMMARY_PRECOMPUTE_HORIZON_HOURS),
+            Task.completed == False,
+            Task.owner_id.isnot(None)
+        ).order_by(Task.deadline).all()
+
+        # Tasks with a summary job already queued or running
+        queued = {
+            task_id for (task_id,) in db.query(Job.task_id).filter(
+                Job.kind == SUMMARY_JOB_KIND,
+                Job.status.in_(["pending", "running"])
+            ).all()
+        }
+        # Tasks whose precompute failed recently
+        backing_off = {
+            task_id for (task_id,) in db.query(Job.task_id).filter(
+                Job.kind == SUMMARY_JOB_KIND,
+                Job.priority == PRECOMPUTE_JOB_PRIORITY,
+                Job.status == "failed",
+                Job.finished_at >= now - timedelta(hours=SUMMARY_PRECOMPUTE_RETRY_HOURS)
+            ).all()
+        }
+
+        queued_count = 0
+        for task in upcoming_tasks:
+            if queued_count >= SUMMARY_PRECOMPUTE_MAX_JOBS:
+                break
+            if task.id in queued or task.id in backing_off or not _summary_is_stale(db, task):
+                continue
+            queue_summary_job(db, task, task.owner_id, priority=PRECOMPUTE_JOB_PRIORITY)
+            queued_count += 1
+
+        print(f"[Scheduler] Queued {queued_count} study guide precomputes "
+              f"({len(upcoming_tasks)} tasks due in the next {SUMMARY_PRECOMPUTE_HORIZON_HOURS:g}h)")
+
+    except Exception as e:
+        print(f"[Scheduler] Error precomputing summaries: {str(e)}")
+    finally:
+        db.close()
+
+
 # Global scheduler instance
 scheduler: BackgroundScheduler | None = None
 
@@ -123,6 +231,16 @@ def start_scheduler():
         replace_existing=True
     )
 
+    # Refresh study guides for tasks due soon
+    if SUMMARY_PRECOMPUTE_ENABLED:
+        scheduler.add_job(
+            precompute_upcoming_summaries,
+            trigger=IntervalTrigger(minutes=SUMMARY_PRECOMPUTE_INTERVAL_MINUTES),
+            id="precompute_summaries",
+            name="Precompute study guides for upcoming deadlines",
+            replace_existing=True
+        )
+
     scheduler.start()
     print("[Scheduler] Background scheduler started")
 
@@ -0,0 +1,257 @@
+import html
+import re
+import time
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from models.search_document import SearchDocument
+from models.task import Task
+from models.task_note import TaskNote
+from models.task_attachment import TaskAttachment
+from models.attachment_page import AttachmentPage
+from config import SEARCH_MAX_CONTENT_LENGTH
+
+
+# SQLite: FTS5 external-content table kept in sync with search_documents by triggers
+SQLITE_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS search_documents_fts USING fts5(
+        title, content, content='search_documents', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN
+        INSERT INTO search_documents_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN
+        INSERT INTO search_documents_fts(search_documents_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN
+        INSERT INTO search_documents_fts(search_documents_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO search_documents_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+]
+
+# Postgres: weighted tsvector expression (title ranks above content) behind a GIN index.
+# Queries must use the exact same expression for the index to be used.
+POSTGRES_TSVECTOR = (
+    "(setweight(to_tsvector('english', coalesce(d.title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(d.content, '')), 'B'))"
+)
+POSTGRES_INDEX_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_search_documents_tsv ON search_documents USING GIN ({POSTGRES_TSVECTOR.replace('d.', '')})",
+]
+
+# The database marks matches in snippets with these control characters; the
+# snippet is HTML-escaped in Python and only then are they turned into <mark>
+# tags, so user content never reaches the client as markup
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+# Tasks the user owns or has been shared
+ACCESSIBLE_TASK_FILTER = """(t.owner_id = :user_id OR EXISTS (
+    SELECT 1 FROM task_shares s WHERE s.task_id = t.id AND s.shared_with_id = :user_id
+))"""
+
+SQLITE_SEARCH_SQL = f"""
+SELECT d.task_id, t.title AS task_title, d.source_type, d.source_id, d.title,
+       snippet(search_documents_fts, -1, :match_start, :match_end, '…', 16) AS snippet,
+       bm25(search_documents_fts, 5.0, 1.0) AS score
+FROM search_documents_fts
+JOIN search_documents d ON d.id = search_documents_fts.rowid
+JOIN tasks t ON t.id = d.task_id
+WHERE search_documents_fts MATCH :query AND {ACCESSIBLE_TASK_FILTER}
+ORDER BY score
+LIMIT :limit
+"""
+
+POSTGRES_SEARCH_SQL = f"""
+SELECT hits.task_id, hits.task_title, hits.source_type, hits.source_id, hits.title,
+       ts_headline('english', CASE WHEN hits.content = '' THEN hits.title ELSE hits.content END, hits.q,
+                   :headline_options) AS snippet,
+       hits.score
+FROM (
+    SELECT d.task_id, t.title AS task_title, d.source_type, d.source_id, d.title, d.content, q,
+           ts_rank_cd({POSTGRES_TSVECTOR}, q) AS score
+    FROM search_documents d
+    JOIN tasks t ON t.id = d.task_id,
+         websearch_to_tsquery('english', :query) q
+    WHERE {POSTGRES_TSVECTOR} @@ q AND {ACCESSIBLE_TASK_FILTER}
+    ORDER BY score DESC
+    LIMIT :limit
+) hits
+ORDER BY hits.score DESC
+"""
+
+
+POSTGRES_HEADLINE_OPTIONS = f'StartSel="{MATCH_START}", StopSel="{MATCH_END}", MaxFragments=2, MaxWords=20, MinWords=5'
+
+
+def init_search_index(engine: Engine):
+    """Create the database-specific full-text index for search_documents."""
+    ddl = {"sqlite": SQLITE_INDEX_DDL, "postgresql": POSTGRES_INDEX_DDL}.get(engine.dialect.name)
+    if ddl is None:
+        print(f"[Search] Full-text search not supported on {engine.dialect.name}")
+        return
+
+    with engine.begin() as conn:
+        for statement in ddl:
+            conn.execute(text(statement))
+
+
+# ============ INDEXING ============
+
+def _strip_markers(value: str) -> str:
+    return value.replace(MATCH_START, "").replace(MATCH_END, "")
+
+
+def _upsert_document(db: Session, task_id: int, source_type: str, source_id: int, title: str, content: str):
+    doc = db.query(SearchDocument).filter(
+        SearchDocument.source_type == source_type,
+        SearchDocument.source_id == source_id
+    ).first()
+
+    # The match markers can't appear in indexed text, or they'd be highlighted too
+    content = _strip_markers(content[:SEARCH_MAX_CONTENT_LENGTH])
+    title = _strip_markers(title)
+    if doc:
+        doc.task_id = task_id
+        doc.title = title
+        doc.content = content
+    else:
+        db.add(SearchDocument(
+            task_id=task_id,
+            source_type=source_type,
+            source_id=source_id,
+            title=title,
+            content=content
+        ))
+
+
+def index_task(db: Session, task: Task):
+    """Index (or re-index) a task's title. Caller commits."""
+    _upsert_document(db, task.id, "task", task.id, task.title, "")
+
+
+def index_note(db: Session, note: TaskNote):
+    """Index (or re-index) a task's notes. Caller commits."""
+    _upsert_document(db, note.task_id, "note", note.id, "Notes", note.content or "")
+
+
+def index_attachment(db: Session, attachment: TaskAttachment, pages: list[str] | None = None):
+    """
+    Index an attachment's filename and extracted text. Caller commits.
+
+    Without pages only the filename is indexed (e.g. images, or PDFs
+    that haven't been extracted yet).
+    """
+    content = "\n\n".join(text for text in (pages or []) if text)
+    _upsert_document(db, attachment.task_id, "attachment", attachment.id, attachment.filename, content)
+
+
+def remove_from_index(db: Session, source_type: str, source_id: int):
+    """Remove one indexed source. Caller commits."""
+    db.query(SearchDocument).filter(
+        SearchDocument.source_type == source_type,
+        SearchDocument.source_id == source_id
+    ).delete()
+
+
+def remove_task_from_index(db: Session, task_id: int):
+    """Remove everything indexed for a task. Caller commits."""
+    db.query(SearchDocument).filter(SearchDocument.task_id == task_id).delete()
+
+
+def rebuild_search_index_if_empty():
+    """Backfill the index from existing tasks, notes and stored attachment text."""
+    db: Session = SessionLocal()
+    try:
+        if db.query(SearchDocument.id).first() is not None:
+            return
+
+        tasks = db.query(Task).all()
+        if not tasks:
+            return
+
+        for task in tasks:
+            index_task(db, task)
+        for note in db.query(TaskNote).all():
+            index_note(db, note)
+        for attachment in db.query(TaskAttachment).all():
+            rows = db.query(AttachmentPage).filter(
+                AttachmentPage.attachment_id == attachment.id
+            ).order_by(AttachmentPage.page_number).all()
+            index_attachment(db, attachment, [row.text for row in rows])
+
+        db.commit()
+        print(f"[Search] Built search index for {len(tasks)} tasks")
+    finally:
+        db.close()
+
+
+# ============ SEARCH ============
+
+def _sqlite_match_query(query: str) -> str:
+    """
+    Turn free text into a safe FTS5 query.
+
+    Every word must match (as a prefix, so partial words work); FTS5
+    operators and punctuation in the input are treated as plain text.
+    """
+    terms = re.findall(r"\w+", query)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def highlight_snippet(snippet: str) -> str:
+    """HTML-escape a snippet from the database, then wrap its marked matches in <mark> tags."""
+    return html.escape(snippet).replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>")
+
+
+def search(db: Session, user_id: int, query: str, limit: int = 20) -> dict:
+    """
+    Ranked full-text search over the tasks a user can access.
+
+    Returns a dict with the hits (best first; snippets are HTML-escaped
+    text with matches highlighted with <mark>) and the time the query took.
+    """
+    started = time.perf_counter()
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "sqlite":
+        match_query = _sqlite_match_query(query)
+        sql = SQLITE_SEARCH_SQL
+    elif dialect == "postgresql":
+        match_query = query
+        sql = POSTGRES_SEARCH_SQL
+    else:
+        match_query = ""
+        sql = None
+
+    hits = []
+    if sql and match_query.strip():
+        params = {
+            "query": match_query,
+            "user_id": user_id,
+            "limit": limit,
+            "match_start": MATCH_START,
+            "match_end": MATCH_END,
+            "headline_options": POSTGRES_HEADLINE_OPTIONS
+        }
+        rows = db.execute(text(sql), params).mappings().all()
+        hits = [
+            {
+                "task_id": row["task_id"],
+                "task_title": row["task_title"],
+                "source_type": row["source_type"],
+                "source_id": row["source_id"],
+                "title": row["title"],
+                "snippet": highlight_snippet(row["snippet"] or row["title"]),
+                # bm25() is lower-is-better; flip it so higher is better on both databases
+                "score": -row["score"] if dialect == "sqlite" else row["score"]
+            }
+            for row in rows
+        ]
+
+    took_ms = (time.perf_counter() - started) * 1000
+    print(f"[Search] '{query}' -> {len(hits)} hits in {took_ms:.1f}ms")
+    return {"query": query, "hits": hits, "took_ms": took_ms}
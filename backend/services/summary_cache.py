@@ -0,0 +1,111 @@
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models.summary_cache import SummaryCache
+from config import SUMMARY_CACHE_MAX_ENTRIES, SUMMARY_CACHE_TTL_DAYS
+from services.pdf_service import compute_file_hash
+from services.ai_service import SUMMARY_PROMPT_VERSION, SUMMARY_SECTIONS
+from services.model_router import routes_signature
+
+
+def summary_fingerprint(task_title: str, notes_content: str, attachment_paths: list[Path]) -> str:
+    """
+    Fingerprint of everything that determines a study guide.
+
+    Attachments are identified by content, not name or id, so the same
+    files uploaded to different tasks (or by different students) match.
+    """
+    key = {
+        "title": task_title.strip(),
+        "notes": hashlib.sha256((notes_content or "").encode()).hexdigest(),
+        "attachments": sorted(compute_file_hash(path) for path in attachment_paths),
+        "prompt_version": SUMMARY_PROMPT_VERSION,
+        # Changing which model or response budget a size of input gets regenerates its study guides
+        "routes": routes_signature("study_guide", "partial_summary")
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def _expiry_cutoff() -> datetime | None:
+    if SUMMARY_CACHE_TTL_DAYS <= 0:
+        return None
+    return datetime.now(timezone.utc) - timedelta(days=SUMMARY_CACHE_TTL_DAYS)
+
+
+def get_cached_summary(db: Session, fingerprint: str) -> dict | None:
+    """Stored study guide for a fingerprint, or None (expired entries don't count)."""
+    entry = db.query(SummaryCache).filter(SummaryCache.fingerprint == fingerprint).first()
+    if not entry:
+        return None
+
+    cutoff = _expiry_cutoff()
+    created_at = entry.created_at
+    if created_at and created_at.tzinfo is None:
+        # SQLite hands back naive UTC timestamps
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    if cutoff and created_at and created_at < cutoff:
+        return None
+
+    entry.hit_count += 1
+    entry.last_used_at = datetime.now(timezone.utc)
+    db.commit()
+    return dict(entry.result)
+
+
+def store_summary(db: Session, fingerprint: str, result: dict):
+    """Cache a generated study guide, then evict expired and least recently used entries."""
+    data = {field: result.get(field) for field in SUMMARY_SECTIONS}
+    data["prompt_version"] = result.get("prompt_version")
+    now = datetime.now(timezone.utc)
+
+    entry = db.query(SummaryCache).filter(SummaryCache.fingerprint == fingerprint).first()
+    if entry:
+        # Expired (or regenerated on purpose) - replace it, along with what generated it
+        entry.result = data
+        entry.model = result.get("model") or ""
+        entry.prompt_version = SUMMARY_PROMPT_VERSION
+        entry.created_at = now
+        entry.last_used_at = now
+        entry.hit_count = 0
+    else:
+        db.add(SummaryCache(
+            fingerprint=fingerprint,
+            model=result.get("model") or "",
+            prompt_version=SUMMARY_PROMPT_VERSION,
+            result=data,
+            created_at=now,
+            last_used_at=now
+        ))
+
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another request cached the same inputs first
+        db.rollback()
+        return
+
+    evict_summaries(db)
+
+
+def evict_summaries(db: Session) -> int:
+    """Drop expired entries and trim the cache to SUMMARY_CACHE_MAX_ENTRIES. Returns entries removed."""
+    removed = 0
+
+    cutoff = _expiry_cutoff()
+    if cutoff:
+        removed += db.query(SummaryCache).filter(SummaryCache.created_at < cutoff).delete()
+
+    excess = db.query(SummaryCache).count() - SUMMARY_CACHE_MAX_ENTRIES
+    if excess > 0:
+        oldest = db.query(SummaryCache.id).order_by(SummaryCache.last_used_at).limit(excess).all()
+        removed += db.query(SummaryCache).filter(
+            SummaryCache.id.in_([row.id for row in oldest])
+        ).delete(synchronize_session=False)
+
+    db.commit()
+    if removed:
+        print(f"[Summary Cache] Evicted {removed} entries")
+    return removed
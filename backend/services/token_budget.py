@@ -0,0 +1,140 @@
+from services.tokenizer import count_tokens, is_exact
+from services.context_builder import build_context
+
+# Context window of the chat models we call (gpt-4o-mini)
+MODEL_CONTEXT_TOKENS = 128000
+
+# Allowance for the fixed instructions wrapped around the content in each prompt
+PROMPT_OVERHEAD_TOKENS = 1500
+
+SECTION_SEPARATOR = "\n\n"
+
+
+def input_budget(max_content_tokens: int, response_tokens: int) -> int:
+    """
+    Tokens available for notes/document content in one request.
+
+    Capped by the caller's own limit and by what the context window leaves
+    after the instructions and the tokens reserved for the response.
+    """
+    available = MODEL_CONTEXT_TOKENS - PROMPT_OVERHEAD_TOKENS - response_tokens
+    return max(0, min(max_content_tokens, available))
+
+
+def allocate_tokens(demands: list[int], total: int) -> list[int]:
+    """
+    Split a token budget between sections that each need `demand` tokens.
+
+    Sections needing less than an equal share get all they need and the
+    rest is shared equally among the larger ones (max-min fairness), so
+    short notes are never squeezed out by a long PDF or vice versa.
+    """
+    allocations = [0] * len(demands)
+    remaining = max(total, 0)
+    pending = sorted(range(len(demands)), key=lambda i: demands[i])
+
+    while pending:
+        share = remaining // len(pending)
+        index = pending[0]
+        if demands[index] > share:
+            for index in pending:
+                allocations[index] = share
+            break
+        allocations[index] = demands[index]
+        remaining -= demands[index]
+        pending.pop(0)
+
+    return allocations
+
+
+def pack_sections(sections: list[tuple[str, str]], query: str, budget: int) -> tuple[str, list[dict]]:
+    """
+    Fit (header, text) sections into a token budget.
+
+    Each section gets a share of the budget from allocate_tokens and is
+    reduced to its most relevant passages by the context builder if it
+    doesn't fit its share. Returns the packed text and a per-section report
+    of tokens needed, allocated and actually used.
+    """
+    sections = [(header, text) for header, text in sections if text and text.strip()]
+    if not sections:
+        return "", []
+
+    demands = [count_tokens(f"{header}\n{text}") for header, text in sections]
+    separators = count_tokens(SECTION_SEPARATOR) * (len(sections) - 1)
+    allocations = allocate_tokens(demands, budget - separators)
+
+    parts = []
+    report = []
+    for (header, text), demand, allocated in zip(sections, demands, allocations):
+        packed = build_context([(header, text)], query, allocated, measure=count_tokens)
+        used = count_tokens(packed) if packed else 0
+        if packed:
+            parts.append(packed)
+        report.append({"section": header.strip("= "), "tokens": demand, "allocated": allocated, "used": used})
+
+    return SECTION_SEPARATOR.join(parts), report
+
+
+def response_usage(response) -> dict:
+    """
+    Actual token counts reported by the API for one chat completion (SDK object or JSON dict).
+
+    cached_tokens is how much of the prompt the provider served from its
+    prompt-prefix cache (0 if it doesn't say).
+    """
+    usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    if isinstance(usage, dict):
+        counts = {key: usage.get(key) for key in ("prompt_tokens", "completion_tokens", "total_tokens")}
+        counts["cached_tokens"] = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        return counts
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+        "cached_tokens": getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None) or 0
+    }
+
+
+def token_report(sections: list[dict], budget: int, response_tokens: int, usage: dict | None = None,
+                 model_route: dict | None = None) -> dict:
+    """Token accounting for one AI request: planned per section and actual from the API."""
+    report = {
+        "tokenizer": "exact" if is_exact() else "estimated",
+        "budget": budget,
+        "response_reserve": response_tokens,
+        "sections": sections,
+        "content_tokens": sum(section["used"] for section in sections),
+        **(usage or {})
+    }
+    if model_route:
+        report["model"] = model_route["model"]
+        report["tier"] = model_route["tier"]
+    return report
+
+
+def log_token_report(prefix: str, report: dict):
+    for section in report["sections"]:
+        print(
+            f"{prefix} Tokens for '{section['section']}': {section['used']} used, "
+            f"{section['allocated']} allocated, {section['tokens']} available"
+        )
+    print(
+        f"{prefix} Content {report['content_tokens']}/{report['budget']} tokens ({report['tokenizer']}), "
+        f"prompt {report.get('prompt_tokens')} ({report.get('cached_tokens') or 0} cached), "
+        f"completion {report.get('completion_tokens')} "
+        f"(reserve {report['response_reserve']})"
+        + (f", {report['model']} ({report['tier']} tier)" if report.get("model") else "")
+    )
+    if report.get("map"):
+        stats = report["map"]
+        print(
+            f"{prefix} Partial summaries: {stats['cached']}/{stats['parts']} cached, {stats['generated']} generated, "
+            f"{stats['failed']} failed ({stats['prompt_tokens']} prompt, {stats['cached_tokens']} cached, "
+            f"{stats['completion_tokens']} completion tokens)"
+        )
+    if report.get("questions"):
+        stats = report["questions"]
+        print(f"{prefix} Questions: {stats['questions']} solved in {stats['requests']} parallel requests, {stats['failed']} failed")
@@ -0,0 +1,155 @@
+"""
+Token counting for prompt budgets.
+
+Uses tiktoken with the model's encoding when its vocabulary file is
+available locally (in TOKENIZER_CACHE_DIR). Nothing is ever downloaded
+while the app runs - the vocabulary is fetched at build time with:
+
+    python -m services.tokenizer --download
+
+Without tiktoken or the vocabulary file, a conservative estimate based on
+the same word/number/punctuation splitting is used instead.
+"""
+import argparse
+import hashlib
+import math
+import os
+import re
+import threading
+from config import TOKENIZER_ENCODING, TOKENIZER_CACHE_DIR
+
+# tiktoken reads its cache location from the environment, so set it before importing
+os.environ.setdefault("TIKTOKEN_CACHE_DIR", str(TOKENIZER_CACHE_DIR))
+
+try:
+    import tiktoken
+    from tiktoken_ext.openai_public import ENCODING_CONSTRUCTORS
+except ImportError:
+    tiktoken = None
+    ENCODING_CONSTRUCTORS = {}
+
+ENCODING_URLS = {
+    "o200k_base": "https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken",
+    "cl100k_base": "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+}
+
+# Pieces roughly matching how BPE tokenizers pre-split text
+_ESTIMATE_PATTERN = re.compile(
+    "[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]"  # CJK: about one token per character
+    r"|[^\W\d_]+"                                  # words
+    r"|\d{1,3}"                                    # numbers, in groups of up to 3 digits
+    r"|[^\w\s]+"                                   # punctuation runs
+    r"|\s+"
+)
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _cache_path(encoding_name: str) -> str | None:
+    url = ENCODING_URLS.get(encoding_name)
+    if not url:
+        return None
+    # Same file name tiktoken uses for its cache
+    return os.path.join(os.environ["TIKTOKEN_CACHE_DIR"], hashlib.sha1(url.encode()).hexdigest())
+
+
+def _get_encoding():
+    """
+    The tiktoken encoding, or None if it can't be loaded without a download.
+
+    Loaded once per process: concurrent first calls wait for the same load,
+    and if it fails every caller keeps using the estimate.
+    """
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+
+    with _encoding_lock:
+        if _encoding_loaded:
+            return _encoding
+
+        cache_path = _cache_path(TOKENIZER_ENCODING)
+        if tiktoken is None:
+            print("[Tokenizer] tiktoken not installed, estimating token counts")
+        elif not cache_path or not os.path.exists(cache_path):
+            print(f"[Tokenizer] No local vocabulary for {TOKENIZER_ENCODING}, estimating token counts")
+        else:
+            try:
+                _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                print(f"[Tokenizer] Using {TOKENIZER_ENCODING}")
+            except Exception as e:
+                print(f"[Tokenizer] Could not load {TOKENIZER_ENCODING}, estimating token counts: {e}")
+        # Only set once the decision is made, so no caller sees the estimate while the encoding is loading
+        _encoding_loaded = True
+    return _encoding
+
+
+def is_exact() -> bool:
+    """Whether token counts come from the real tokenizer rather than the estimate."""
+    return _get_encoding() is not None
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokenizer-free token count; errs on the high side for English text."""
+    count = 0
+    for piece in _ESTIMATE_PATTERN.findall(text):
+        first = piece[0]
+        if first.isspace():
+            # A single space merges into the next word
+            count += 1 if (len(piece) > 1 or first != " ") else 0
+        elif first.isalpha():
+            count += 1 if len(piece) == 1 else math.ceil(len(piece) / 5)
+        elif first.isdigit():
+            count += 1
+        else:
+            count += math.ceil(len(piece) / 2)
+    return count
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens the model will see for this text."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to at most max_tokens tokens."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+    tokens = estimate_tokens(text)
+    while tokens > max_tokens:
+        # Shrink proportionally (a little extra so this converges quickly)
+        text = text[:int(len(text) * max_tokens / tokens * 0.95)]
+        tokens = estimate_tokens(text)
+    return text
+
+
+def download_vocabulary(encoding_name: str = TOKENIZER_ENCODING):
+    """Fetch the tokenizer vocabulary into the local cache (build step)."""
+    if tiktoken is None:
+        raise SystemExit("tiktoken is not installed")
+    os.makedirs(os.environ["TIKTOKEN_CACHE_DIR"], exist_ok=True)
+    # Loading once from the network fills tiktoken's cache directory
+    ENCODING_CONSTRUCTORS[encoding_name]()
+    print(f"[Tokenizer] Cached {encoding_name} in {os.environ['TIKTOKEN_CACHE_DIR']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tokenizer vocabulary management")
+    parser.add_argument("--download", action="store_true", help="Download the vocabulary for TOKENIZER_ENCODING")
+    args = parser.parse_args()
+    if args.download:
+        download_vocabulary()
+    else:
+        print(f"Encoding: {TOKENIZER_ENCODING} ({'exact' if is_exact() else 'estimated'})")
@@ -0,0 +1,149 @@
+"""
+Shared cache of resource URL checks.
+
+Popular resources (Khan Academy, Wikipedia, MIT OCW, ...) are suggested
+for many tasks, so whether a URL is live is stored in the database, keyed
+by the normalized URL, and reused by every worker until it expires: live
+results after URL_LIVE_TTL_HOURS, and pages the site says are gone (404,
+410) after URL_DEAD_TTL_HOURS. Any other failure - a timeout, a refused
+connection, a server error or rate limit - may be a passing problem on
+either end, so it's only kept for URL_UNREACHABLE_TTL_MINUTES. A host that
+couldn't be reached at all (DNS failure, connection refused) is cached as
+a dead domain for that short time too, so its other URLs in the same burst
+of checks are skipped without a request.
+"""
+import hashlib
+from datetime import datetime, timedelta
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from models.url_liveness import UrlLiveness
+from config import URL_LIVE_TTL_HOURS, URL_DEAD_TTL_HOURS, URL_UNREACHABLE_TTL_MINUTES
+
+# Query parameters that only track where a click came from
+_TRACKING_PARAMS = {"fbclid", "gclid"}
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+# Responses that mean the page itself is gone, not that the check failed
+_GONE_STATUSES = {404, 410}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of a URL for the cache: lowercase scheme and host, no
+    default port, fragment or tracking parameters, and "/" for an empty path.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = urlencode([
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith("utm_") and name.lower() not in _TRACKING_PARAMS
+    ])
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+def url_host(url: str) -> str:
+    """Host (with a non-default port) of a normalized URL."""
+    return urlsplit(url).netloc
+
+
+def _key(kind: str, value: str) -> str:
+    return hashlib.sha256(f"{kind}:{value}".encode()).hexdigest()
+
+
+def _ttl(entry: UrlLiveness) -> timedelta:
+    if entry.live:
+        return timedelta(hours=URL_LIVE_TTL_HOURS)
+    if entry.kind == "url" and entry.status_code in _GONE_STATUSES:
+        return timedelta(hours=URL_DEAD_TTL_HOURS)
+    return timedelta(minutes=URL_UNREACHABLE_TTL_MINUTES)
+
+
+def _is_fresh(entry: UrlLiveness, now: datetime) -> bool:
+    return entry.checked_at >= now - _ttl(entry)
+
+
+def lookup_liveness(urls: list[str]) -> dict[str, bool]:
+    """Cached liveness of each URL that has a fresh result (URLs on a dead domain count as dead)."""
+    normalized = {url: normalize_url(url) for url in urls}
+    hosts = {url: url_host(value) for url, value in normalized.items()}
+    keys = {_key("url", value) for value in normalized.values()} | {_key("domain", host) for host in hosts.values()}
+
+    db: Session = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        entries = {
+            entry.key: entry
+            for entry in db.query(UrlLiveness).filter(UrlLiveness.key.in_(keys)).all()
+            if _is_fresh(entry, now)
+        }
+    finally:
+        db.close()
+
+    cached = {}
+    for url in urls:
+        if _key("domain", hosts[url]) in entries:
+            cached[url] = False
+            continue
+        entry = entries.get(_key("url", normalized[url]))
+        if entry is not None:
+            cached[url] = entry.live
+    return cached
+
+
+def store_liveness(results: dict[str, dict]):
+    """
+    Save fresh check results: {url: {"live", "status_code", "final_url", "unreachable"}}.
+
+    An unreachable result also marks the URL's host as a dead domain. How
+    long each result is reused depends on what it was (see the module docs).
+    """
+    if not results:
+        return
+
+    now = datetime.utcnow()
+    rows = {}
+    for url, result in results.items():
+        normalized = normalize_url(url)
+        rows[_key("url", normalized)] = {
+            "kind": "url",
+            "url": normalized,
+            "live": result["live"],
+            "status_code": result.get("status_code"),
+            "final_url": result.get("final_url")
+        }
+        if result.get("unreachable") and url_host(normalized):
+            host = url_host(normalized)
+            rows[_key("domain", host)] = {"kind": "domain", "url": host, "live": False, "status_code": None, "final_url": None}
+
+    db: Session = SessionLocal()
+    try:
+        existing = {entry.key: entry for entry in db.query(UrlLiveness).filter(UrlLiveness.key.in_(list(rows))).all()}
+        for key, values in rows.items():
+            entry = existing.get(key)
+            if entry is None:
+                db.add(UrlLiveness(key=key, checked_at=now, **values))
+                continue
+            for name, value in values.items():
+                setattr(entry, name, value)
+            entry.checked_at = now
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker checked some of the same URLs first; its results are just as fresh
+            db.rollback()
+
+        # Results past every TTL are of no use any more
+        cutoff = now - max(
+            timedelta(hours=URL_LIVE_TTL_HOURS), timedelta(hours=URL_DEAD_TTL_HOURS),
+            timedelta(minutes=URL_UNREACHABLE_TTL_MINUTES)
+        )
+        removed = db.query(UrlLiveness).filter(UrlLiveness.checked_at < cutoff).delete()
+        db.commit()
+        if removed:
+            print(f"[URL Liveness] Removed {removed} expired entries")
+    finally:
+        db.close()
@@ -0,0 +1,224 @@
+"""
+Append-only ledger of upstream AI calls, for attributing spend and latency.
+
+Every OpenAI and Perplexity call (each attempt, retries included) is
+recorded with its model, token usage, estimated cost, latency and outcome,
+tagged with the task, user and endpoint it was made for. The tags come
+from usage_context(), set where a request or job starts; calls made from
+worker threads need the context copied into the thread (see
+contextvars.copy_context). Study guides served from the cache are recorded
+as cache hits, without tokens.
+
+Recording only queues the record; a writer thread inserts them in batches
+every AI_USAGE_FLUSH_SECONDS (or AI_USAGE_BATCH_SIZE records), so AI
+requests never wait on the ledger.
+"""
+import queue
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from sqlalchemy import func, case
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from models.ai_usage import AIUsageRecord
+from models.user import User
+from config import AI_USAGE_LEDGER_ENABLED, AI_USAGE_FLUSH_SECONDS, AI_USAGE_BATCH_SIZE, AI_USAGE_QUEUE_SIZE
+from services.model_router import estimate_cost
+
+_usage_context: ContextVar[dict] = ContextVar("ai_usage_context", default={})
+
+_records: queue.Queue = queue.Queue(maxsize=AI_USAGE_QUEUE_SIZE)
+_writer: threading.Thread | None = None
+_writer_lock = threading.Lock()
+_stop = threading.Event()
+
+_metrics_lock = threading.Lock()
+_metrics = {"recorded": 0, "written": 0, "dropped": 0, "write_errors": 0}
+
+
+def _count(key: str, amount: int = 1):
+    with _metrics_lock:
+        _metrics[key] += amount
+
+
+@contextmanager
+def usage_context(endpoint: str, task_id: int | None = None, user_id: int | None = None):
+    """Tag the AI calls made inside the block with the endpoint, task and user they're for."""
+    previous = _usage_context.get()
+    # set() rather than reset(), so a streaming generator resumed in another context can still leave the block
+    _usage_context.set({"endpoint": endpoint, "task_id": task_id, "user_id": user_id})
+    try:
+        yield
+    finally:
+        _usage_context.set(previous)
+
+
+def current_usage_context() -> dict:
+    """The tags of the current usage_context() (for calls that finish after leaving it, like streams)."""
+    return dict(_usage_context.get())
+
+
+def record_call(
+    provider: str,
+    model: str,
+    latency: float,
+    usage: dict | None = None,
+    outcome: str = "ok",
+    context: dict | None = None
+):
+    """Queue one upstream call for the ledger. latency is in seconds; usage is a response_usage() dict."""
+    usage = usage or {}
+    _queue_record({
+        **(context if context is not None else _usage_context.get()),
+        "provider": provider,
+        "model": model,
+        "prompt_tokens": usage.get("prompt_tokens") or 0,
+        "cached_tokens": usage.get("cached_tokens") or 0,
+        "completion_tokens": usage.get("completion_tokens") or 0,
+        "cost_usd": estimate_cost(model, usage) if usage else None,
+        "latency_ms": latency * 1000,
+        "cache_hit": False,
+        "outcome": outcome
+    })
+
+
+def record_cache_hit():
+    """Queue a result served from cache (no upstream call) for the current usage_context()."""
+    _queue_record({**_usage_context.get(), "cache_hit": True, "outcome": "cached"})
+
+
+def _queue_record(record: dict):
+    if not AI_USAGE_LEDGER_ENABLED:
+        return
+    record.setdefault("endpoint", "other")
+    record["created_at"] = datetime.utcnow()
+    try:
+        _records.put_nowait(record)
+        _count("recorded")
+    except queue.Full:
+        _count("dropped")
+        return
+    _ensure_writer()
+
+
+def _ensure_writer():
+    global _writer
+    if _writer and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer and _writer.is_alive():
+            return
+        _stop.clear()
+        _writer = threading.Thread(target=_write_loop, name="ai-usage-writer", daemon=True)
+        _writer.start()
+
+
+def _take_batch() -> list[dict]:
+    """Up to AI_USAGE_BATCH_SIZE queued records."""
+    batch = []
+    try:
+        while len(batch) < AI_USAGE_BATCH_SIZE:
+            batch.append(_records.get_nowait())
+    except queue.Empty:
+        pass
+    return batch
+
+
+def _write_batch(batch: list[dict]):
+    db: Session = SessionLocal()
+    try:
+        db.bulk_insert_mappings(AIUsageRecord, batch)
+        db.commit()
+        _count("written", len(batch))
+    except Exception as e:
+        db.rollback()
+        _count("write_errors")
+        _count("dropped", len(batch))
+        print(f"[Usage Ledger] Could not write {len(batch)} records: {str(e)}")
+    finally:
+        db.close()
+
+
+def _write_loop():
+    while not _stop.is_set():
+        # Let records collect for a while, so they're written in batches
+        _stop.wait(AI_USAGE_FLUSH_SECONDS)
+        flush_usage_records()
+
+
+def flush_usage_records():
+    """Write every queued record now."""
+    while True:
+        batch = _take_batch()
+        if not batch:
+            return
+        _write_batch(batch)
+
+
+def stop_usage_writer():
+    """Stop the writer thread and write what's still queued (at shutdown)."""
+    _stop.set()
+    if _writer and _writer.is_alive():
+        _writer.join(timeout=AI_USAGE_FLUSH_SECONDS + 5)
+    flush_usage_records()
+
+
+def _rollup_columns():
+    upstream = AIUsageRecord.cache_hit.is_(False)
+    return [
+        func.sum(case((upstream, 1), else_=0)).label("calls"),
+        func.sum(case((AIUsageRecord.cache_hit.is_(True), 1), else_=0)).label("cache_hits"),
+        func.sum(case((AIUsageRecord.outcome.in_(("error", "timeout", "rate_limited")), 1), else_=0)).label("errors"),
+        func.sum(AIUsageRecord.prompt_tokens).label("prompt_tokens"),
+        func.sum(AIUsageRecord.cached_tokens).label("cached_tokens"),
+        func.sum(AIUsageRecord.completion_tokens).label("completion_tokens"),
+        func.sum(AIUsageRecord.cost_usd).label("cost_usd"),
+        func.avg(case((upstream, AIUsageRecord.latency_ms), else_=None)).label("avg_latency_ms"),
+        func.max(AIUsageRecord.latency_ms).label("max_latency_ms")
+    ]
+
+
+def _rollup_row(row) -> dict:
+    return {
+        "calls": row.calls or 0,
+        "cache_hits": row.cache_hits or 0,
+        "errors": row.errors or 0,
+        "prompt_tokens": row.prompt_tokens or 0,
+        "cached_tokens": row.cached_tokens or 0,
+        "completion_tokens": row.completion_tokens or 0,
+        "cost_usd": round(row.cost_usd or 0.0, 6),
+        "avg_latency_ms": round(row.avg_latency_ms or 0.0, 1),
+        "max_latency_ms": round(row.max_latency_ms or 0.0, 1)
+    }
+
+
+def get_usage_rollups(db: Session, days: int = 7, limit: int = 20) -> dict:
+    """Calls, tokens, cost and latency from the ledger over the last `days`: in total, per endpoint, model and user."""
+    since = datetime.utcnow() - timedelta(days=days)
+    columns = _rollup_columns()
+    recent = AIUsageRecord.created_at >= since
+    by_cost = func.coalesce(func.sum(AIUsageRecord.cost_usd), 0).desc()
+
+    totals = db.query(*columns).filter(recent).one()
+    by_endpoint = db.query(AIUsageRecord.endpoint, *columns).filter(recent).group_by(
+        AIUsageRecord.endpoint
+    ).order_by(by_cost).all()
+    by_model = db.query(AIUsageRecord.provider, AIUsageRecord.model, *columns).filter(
+        recent, AIUsageRecord.cache_hit.is_(False)
+    ).group_by(AIUsageRecord.provider, AIUsageRecord.model).order_by(by_cost).all()
+    by_user = db.query(AIUsageRecord.user_id, User.email, *columns).outerjoin(
+        User, User.id == AIUsageRecord.user_id
+    ).filter(recent).group_by(AIUsageRecord.user_id, User.email).order_by(by_cost).limit(limit).all()
+
+    with _metrics_lock:
+        writer = dict(_metrics, queued=_records.qsize())
+
+    return {
+        "since": since.isoformat(),
+        "totals": _rollup_row(totals),
+        "by_endpoint": [{"endpoint": row.endpoint, **_rollup_row(row)} for row in by_endpoint],
+        "by_model": [{"provider": row.provider, "model": row.model, **_rollup_row(row)} for row in by_model],
+        "by_user": [{"user_id": row.user_id, "email": row.email, **_rollup_row(row)} for row in by_user],
+        "writer": writer
+    }
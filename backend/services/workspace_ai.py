@@ -0,0 +1,496 @@
+import os
+from collections.abc import Callable
+from pathlib import Path
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from models.task import Task
+from models.task_note import TaskNote
+from models.task_attachment import TaskAttachment
+from models.task_summary import TaskSummary
+from models.task_resource import TaskResource
+from models.assignment_solution import AssignmentSolution
+from config import UPLOAD_DIR
+from services.ai_service import SUMMARY_SECTIONS, generate_task_summary, stream_task_summary
+from services.summary_cache import summary_fingerprint, get_cached_summary, store_summary
+from services.pdf_service import get_attachment_text
+from services.resource_service import find_resources, MAX_PROMPT_CONTENT_TOKENS
+from services.resource_cache import material_text, get_cached_resources, store_resources
+from services.context_builder import CANDIDATE_MULTIPLIER
+from services.tokenizer import count_tokens, truncate_to_tokens
+from services.assignment_service import solve_assignment
+from services.prompts import RESOURCES_PROMPT
+from services.job_queue import JobFailedError, enqueue_job, register_job_handler, update_job_progress
+from services.usage_ledger import record_cache_hit, usage_context
+
+
+SUMMARY_JOB_KIND = "generate_summary"
+RESOURCES_JOB_KIND = "generate_resources"
+ASSIGNMENT_JOB_KIND = "solve_assignment"
+
+# Someone is waiting on these, so they run ahead of background preprocessing
+INTERACTIVE_JOB_PRIORITY = 10
+# Speculative study guides for upcoming deadlines run only when nothing else is queued
+PRECOMPUTE_JOB_PRIORITY = -10
+
+
+def _report(progress: Callable[[str], None] | None, message: str):
+    if progress:
+        progress(message)
+
+
+def _summary_inputs(db: Session, task: Task) -> tuple[str, list[dict], str, bool]:
+    """A task's current notes, the attachments on disk, their fingerprint and whether there's any content."""
+    task_id = task.id
+
+    # Get fresh notes
+    note = db.query(TaskNote).filter(TaskNote.task_id == task_id).first()
+    notes_content = note.content if note else ""
+    print(f"[Summary Generate] Notes content: {len(notes_content)} chars")
+
+    # Get current attachments from database
+    attachments = db.query(TaskAttachment).filter(
+        TaskAttachment.task_id == task_id
+    ).all()
+
+    print(f"[Summary Generate] === CURRENT ATTACHMENTS FOR TASK {task_id} ===")
+    print(f"[Summary Generate] Found {len(attachments)} attachments in database")
+
+    # Build attachment data - only include files that exist on disk
+    attachment_data = []
+    for att in attachments:
+        file_path = UPLOAD_DIR / str(task_id) / att.stored_filename
+        exists = file_path.exists()
+        print(f"[Summary Generate]   - {att.filename} | stored: {att.stored_filename} | exists: {exists}")
+
+        if exists:
+            attachment_data.append({
+                "id": att.id,
+                "task_id": att.task_id,
+                "stored_filename": att.stored_filename,
+                "filename": att.filename,
+                "content_type": att.content_type
+            })
+
+    print(f"[Summary Generate] Processing {len(attachment_data)} valid attachments")
+
+    fingerprint = summary_fingerprint(
+        task.title,
+        notes_content,
+        [UPLOAD_DIR / str(task_id) / att["stored_filename"] for att in attachment_data]
+    )
+    has_content = bool(notes_content.strip()) or bool(attachment_data)
+    return notes_content, attachment_data, fingerprint, has_content
+
+
+def _save_summary(db: Session, task_id: int, result: dict) -> dict:
+    """
+    Replace the task's saved study guide with a new one, in one transaction.
+
+    Only called once the new guide succeeded, so a failed or rate-limited
+    regeneration (e.g. a background precompute) leaves the old one in place.
+    """
+    db.query(TaskSummary).filter(TaskSummary.task_id == task_id).delete()
+    new_summary = TaskSummary(
+        task_id=task_id,
+        summary=result.get("summary", ""),
+        key_points=result.get("key_points", []),
+        concepts=result.get("concepts", []),
+        action_items=result.get("action_items", []),
+        study_tips=result.get("study_tips", []),
+        prompt_version=result.get("prompt_version")
+    )
+    db.add(new_summary)
+    db.commit()
+    db.refresh(new_summary)
+
+    result["updated_at"] = new_summary.updated_at.isoformat() if new_summary.updated_at else None
+    print(f"[Summary Generate] Replaced summary for task {task_id}")
+    return result
+
+
+def generate_summary_for_task(
+    db: Session,
+    task: Task,
+    force: bool = False,
+    progress: Callable[[str], None] | None = None
+) -> dict:
+    """
+    Generate a task's study guide from its current notes and attachments and save it.
+
+    If the exact same title, notes and files were summarized before (for any
+    task) the cached study guide is reused; force=True always calls the model.
+    The saved study guide is only replaced once the new one succeeded.
+    """
+    task_id = task.id
+
+    # STEP 1: Get fresh notes and current attachments
+    _report(progress, "Reading notes and attachments")
+    notes_content, attachment_data, fingerprint, has_content = _summary_inputs(db, task)
+
+    _report(progress, "Generating study guide")
+
+    # STEP 2: Reuse the study guide for identical inputs, or generate a fresh one
+    result = get_cached_summary(db, fingerprint) if has_content and not force else None
+
+    if result is not None:
+        result["cached"] = True
+        record_cache_hit()
+        print(f"[Summary Generate] Cache hit {fingerprint[:12]} for task {task_id}")
+    else:
+        result = generate_task_summary(task.title, notes_content, attachment_data)
+
+        # If there was an error, return it and keep the saved study guide
+        if result.get("error"):
+            return result
+
+        # Unparsed or cut-off study guides are saved for this task but not reused for others
+        if result.pop("cacheable", False) and has_content:
+            store_summary(db, fingerprint, result)
+        result["cached"] = False
+
+    # STEP 3: Replace the saved summary
+    return _save_summary(db, task_id, result)
+
+
+def stream_summary_for_task(db: Session, task: Task, force: bool = False):
+    """
+    Generate and save a task's study guide like generate_summary_for_task, streaming it.
+
+    Yields ("section", (name, value)) as each section of the study guide is
+    ready, then ("done", result) once the whole guide is saved. A cached
+    study guide is sent section by section straight away.
+    """
+    task_id = task.id
+
+    notes_content, attachment_data, fingerprint, has_content = _summary_inputs(db, task)
+
+    result = get_cached_summary(db, fingerprint) if has_content and not force else None
+
+    if result is not None:
+        record_cache_hit()
+        print(f"[Summary Generate] Cache hit {fingerprint[:12]} for task {task_id}")
+        for name in SUMMARY_SECTIONS:
+            yield "section", (name, result.get(name))
+        result["cached"] = True
+    else:
+        for event, data in stream_task_summary(task.title, notes_content, attachment_data):
+            if event == "done":
+                result = data
+            else:
+                yield event, data
+
+        if result.get("error"):
+            yield "done", result
+            return
+
+        # Unparsed or cut-off study guides are saved for this task but not reused for others
+        if result.pop("cacheable", False) and has_content:
+            store_summary(db, fingerprint, result)
+        result["cached"] = False
+
+    yield "done", _save_summary(db, task_id, result)
+
+
+def generate_resources_for_task(
+    db: Session,
+    task: Task,
+    force: bool = False,
+    progress: Callable[[str], None] | None = None
+) -> dict:
+    """
+    Find fresh resource suggestions from a task's current notes and PDFs and save them.
+
+    If the same (or nearly the same) study material had resources found
+    recently (for any task) those are reused; force=True always searches.
+    """
+    task_id = task.id
+
+    # STEP 1: Delete any existing resources first
+    db.query(TaskResource).filter(TaskResource.task_id == task_id).delete()
+    db.commit()
+    print(f"[Resources Generate] Deleted old resources for task {task_id}")
+
+    # STEP 2: Get fresh notes
+    note = db.query(TaskNote).filter(TaskNote.task_id == task_id).first()
+    notes_content = note.content if note else ""
+    print(f"[Resources Generate] Notes content: {len(notes_content)} chars")
+
+    _report(progress, "Reading notes and attachments")
+
+    # STEP 3: Get ALL attachments and extract text from PDFs
+    pdf_content = ""
+    pdf_documents = []
+    pdf_tokens = 0
+    all_attachments = db.query(TaskAttachment).filter(
+        TaskAttachment.task_id == task_id
+    ).all()
+
+    print(f"[Resources Generate] === ALL ATTACHMENTS FOR TASK {task_id} ===")
+    print(f"[Resources Generate] Found {len(all_attachments)} total attachments in database")
+
+    pdf_attachments = [a for a in all_attachments if a.content_type == "application/pdf"]
+    print(f"[Resources Generate] Found {len(pdf_attachments)} PDF attachments")
+
+    for att in pdf_attachments[:5]:  # Process up to 5 PDFs
+        # Read a few times what Perplexity sees so the most relevant passages can be picked
+        budget = min(3000 * CANDIDATE_MULTIPLIER, MAX_PROMPT_CONTENT_TOKENS * CANDIDATE_MULTIPLIER - pdf_tokens)
+        if budget <= 0:
+            print(f"[Resources Generate]   Content budget used up, skipping {att.filename}")
+            break
+
+        file_path = UPLOAD_DIR / str(task_id) / att.stored_filename
+        exists = file_path.exists()
+        print(f"[Resources Generate]   - {att.filename} | stored: {att.stored_filename} | exists: {exists}")
+
+        if exists:
+            extracted = get_attachment_text(att.id, file_path, budget=budget, measure=count_tokens)
+            print(f"[Resources Generate]   Extraction result: {len(extracted) if extracted else 0} chars")
+            print(f"[Resources Generate]   First 200 chars: {extracted[:200] if extracted else 'None'}...")
+
+            # Include content even if it starts with [ - just log a warning
+            if extracted:
+                if extracted.startswith("["):
+                    print(f"[Resources Generate]   WARNING: PDF extraction returned message: {extracted[:100]}")
+                else:
+                    extracted = truncate_to_tokens(extracted, budget)
+                    extracted_tokens = count_tokens(extracted)
+                    pdf_tokens += extracted_tokens
+                    pdf_content += f"\n\n=== PDF: {att.filename} ===\n{extracted}"
+                    pdf_documents.append((att.filename, extracted))
+                    print(f"[Resources Generate]   Added {len(extracted)} chars ({extracted_tokens} tokens) from {att.filename}")
+
+    print(f"[Resources Generate] Total PDF content: {len(pdf_content)} chars")
+
+    # STEP 4: Find fresh resources based on current content
+    # Use task title as fallback if no notes/PDF content but there are image attachments
+    has_any_attachments = len(all_attachments) > 0
+    has_text_content = bool(notes_content.strip()) or bool(pdf_content.strip())
+
+    print(f"[Resources Generate] has_any_attachments: {has_any_attachments}, has_text_content: {has_text_content}")
+
+    # If we have attachments but no extractable text, use task title as content hint
+    effective_notes = notes_content
+    if has_any_attachments and not has_text_content and task.title:
+        effective_notes = f"Topic: {task.title}"
+        print(f"[Resources Generate] Using task title as content hint: {task.title}")
+
+    # Reuse the verified resources found for matching material, or search for fresh ones
+    material = material_text(effective_notes, pdf_documents)
+    resources, match = get_cached_resources(db, material) if not force else (None, None)
+
+    if resources is not None:
+        record_cache_hit()
+        print(f"[Resources Generate] Cache hit ({match}) for task {task_id}")
+    else:
+        _report(progress, "Searching the web for resources")
+        resources = find_resources(
+            task_title=task.title,
+            notes_content=effective_notes,
+            pdf_content=pdf_content,
+            num_resources=5,
+            pdf_documents=pdf_documents
+        )
+
+        if not resources:
+            return {"resources": [], "error": "Could not find relevant resources. Please add notes or upload PDFs with readable text."}
+
+        store_resources(db, material, resources)
+
+    # STEP 5: Save new resources
+    saved_resources = []
+    for r in resources:
+        resource = TaskResource(
+            task_id=task_id,
+            title=r.get("title", ""),
+            url=r.get("url", ""),
+            description=r.get("description", ""),
+            source=r.get("source", ""),
+            prompt_version=RESOURCES_PROMPT.id
+        )
+        db.add(resource)
+        saved_resources.append(resource)
+
+    db.commit()
+
+    for r in saved_resources:
+        db.refresh(r)
+
+    print(f"[Resources Generate] Saved {len(saved_resources)} new resources for task {task_id}")
+
+    return {
+        "resources": [
+            {
+                "id": r.id,
+                "task_id": r.task_id,
+                "title": r.title,
+                "url": r.url,
+                "description": r.description,
+                "source": r.source,
+                "prompt_version": r.prompt_version,
+                "created_at": r.created_at.isoformat() if r.created_at else None
+            }
+            for r in saved_resources
+        ],
+        "cached": match is not None,
+        "error": None
+    }
+
+
+def solve_assignment_for_task(
+    db: Session,
+    task: Task,
+    file_path: Path,
+    assignment_filename: str,
+    content_type: str,
+    progress: Callable[[str], None] | None = None
+) -> dict:
+    """Solve an uploaded assignment file using the task's notes and attachments, and save the solution."""
+    task_id = task.id
+
+    # Get notes content
+    note = db.query(TaskNote).filter(TaskNote.task_id == task_id).first()
+    notes_content = note.content if note else ""
+
+    # Get context attachments (study materials)
+    attachments = db.query(TaskAttachment).filter(
+        TaskAttachment.task_id == task_id
+    ).all()
+
+    context_attachments = []
+    for att in attachments:
+        att_path = UPLOAD_DIR / str(task_id) / att.stored_filename
+        if att_path.exists():
+            context_attachments.append({
+                "id": att.id,
+                "task_id": att.task_id,
+                "stored_filename": att.stored_filename,
+                "filename": att.filename,
+                "content_type": att.content_type
+            })
+
+    print(f"[Assignment Solve] Using {len(context_attachments)} context attachments")
+    print(f"[Assignment Solve] Notes content: {len(notes_content)} chars")
+
+    # Generate solutions
+    result = solve_assignment(
+        task_title=task.title,
+        notes_content=notes_content,
+        context_attachments=context_attachments,
+        assignment_file_path=file_path,
+        assignment_content_type=content_type,
+        assignment_filename=assignment_filename,
+        progress=progress
+    )
+
+    if result.get("error"):
+        # Clean up the uploaded file if there was an error
+        if file_path.exists():
+            os.remove(file_path)
+        return {"questions": [], "error": result["error"]}
+
+    # Save the solution to database
+    solution = AssignmentSolution(
+        task_id=task_id,
+        assignment_filename=assignment_filename,
+        assignment_stored_filename=file_path.name,
+        questions=result.get("questions", []),
+        prompt_version=result.get("prompt_version")
+    )
+    db.add(solution)
+    db.commit()
+    db.refresh(solution)
+
+    print(f"[Assignment Solve] Saved solution with {len(result.get('questions', []))} questions")
+
+    return {
+        "id": solution.id,
+        "task_id": solution.task_id,
+        "assignment_filename": solution.assignment_filename,
+        "questions": solution.questions,
+        "prompt_version": solution.prompt_version,
+        "created_at": solution.created_at.isoformat() if solution.created_at else None,
+        "token_usage": result.get("token_usage"),
+        "error": None
+    }
+
+
+# ============ BACKGROUND JOBS ============
+
+def queue_summary_job(
+    db: Session,
+    task: Task,
+    user_id: int,
+    force: bool = False,
+    priority: int = INTERACTIVE_JOB_PRIORITY
+):
+    return enqueue_job(
+        db, SUMMARY_JOB_KIND, task_id=task.id, user_id=user_id,
+        payload={"force": force}, priority=priority
+    )
+
+
+def queue_resources_job(db: Session, task: Task, user_id: int, force: bool = False):
+    return enqueue_job(
+        db, RESOURCES_JOB_KIND, task_id=task.id, user_id=user_id,
+        payload={"force": force}, priority=INTERACTIVE_JOB_PRIORITY
+    )
+
+
+def queue_assignment_job(db: Session, task: Task, user_id: int, stored_filename: str, assignment_filename: str, content_type: str):
+    """Queue solving an assignment file already saved in the task's upload directory."""
+    return enqueue_job(
+        db, ASSIGNMENT_JOB_KIND, task_id=task.id, user_id=user_id,
+        payload={
+            "stored_filename": stored_filename,
+            "assignment_filename": assignment_filename,
+            "content_type": content_type
+        },
+        priority=INTERACTIVE_JOB_PRIORITY
+    )
+
+
+def _run_task_job(job: dict, endpoint: str, run: Callable[[Session, Task, Callable[[str], None]], dict]) -> dict:
+    db: Session = SessionLocal()
+    try:
+        task = db.query(Task).filter(Task.id == job["task_id"]).first()
+        if not task:
+            raise JobFailedError("Task no longer exists")
+
+        with usage_context(endpoint, task_id=task.id, user_id=job["user_id"]):
+            result = run(db, task, lambda message: update_job_progress(job["id"], message))
+
+        # AI errors (missing key, bad response, no content) won't go away on retry
+        if result.get("error"):
+            message = result["error"] if isinstance(result["error"], str) else result.get("summary", "Generation failed")
+            raise JobFailedError(message)
+        return result
+    finally:
+        db.close()
+
+
+@register_job_handler(SUMMARY_JOB_KIND)
+def run_summary_job(job: dict) -> dict:
+    # Precomputed study guides are spent speculatively, so the ledger keeps them apart
+    endpoint = "summary_job" if job["priority"] >= INTERACTIVE_JOB_PRIORITY else "summary_precompute"
+    return _run_task_job(job, endpoint, lambda db, task, progress: generate_summary_for_task(
+        db, task, force=job["payload"].get("force", False), progress=progress
+    ))
+
+
+@register_job_handler(RESOURCES_JOB_KIND)
+def run_resources_job(job: dict) -> dict:
+    return _run_task_job(job, "resources_job", lambda db, task, progress: generate_resources_for_task(
+        db, task, force=job["payload"].get("force", False), progress=progress
+    ))
+
+
+@register_job_handler(ASSIGNMENT_JOB_KIND)
+def run_assignment_job(job: dict) -> dict:
+    payload = job["payload"]
+    file_path = UPLOAD_DIR / str(job["task_id"]) / payload["stored_filename"]
+    if not file_path.exists():
+        raise JobFailedError("Assignment file no longer exists")
+
+    return _run_task_job(job, "assignments_job", lambda db, task, progress: solve_assignment_for_task(
+        db, task, file_path, payload["assignment_filename"], payload["content_type"], progress=progress
+    ))